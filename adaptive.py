@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import asyncio
+from typing import Any, Callable, Dict, Optional, Set
+
+from timeseries import TimeSeries
+
+# 檢查是否需要調整並發數的間隔(秒)
+ADAPTIVE_POLL = 0.1
+# 初始並發數
+ADAPTIVE_START = 1
+# 違反目標時並發數乘以此係數
+DECREASE_FACTOR = 0.7
+# 滿足目標時每次增加的並發數（慢啟動結束後）
+INCREASE_STEP = 1
+# 判定一次至少需要的完成請求數，不足時延長觀察期
+MIN_SAMPLES = 20
+
+
+def slo_met(requests: int, p99_ms: float, errors: int, target_p99: float, max_error_rate: float) -> bool:
+    """一段時間內 p99 延遲和錯誤率（請求錯誤及5xx）是否都在目標之內"""
+    return requests > 0 and p99_ms <= target_p99 and errors <= max_error_rate * requests
+
+
+def _errors(row: Dict[str, Any]) -> int:
+    return row['error'] + row['5xx']
+
+
+class AdaptiveController:
+    """AIMD 並發控制：保持 p99 延遲和錯誤率在目標之內，同時找出可持續的最大吞吐量
+
+    慢啟動階段每次滿足目標後並發數加倍，第一次違反目標後改為每次加 INCREASE_STEP；
+    違反目標時乘以 DECREASE_FACTOR。每次判定只使用並發數調整之後的完整秒，
+    負載生成器飽和時不再增加並發數。
+    """
+
+    def __init__(self, series: TimeSeries, max_concurrency: int, target_p99: float, max_error_rate: float,
+                 saturated: Optional[Callable[[], bool]] = None):
+        self.series = series
+        self.max_concurrency = max_concurrency
+        self.target_p99 = target_p99
+        self.max_error_rate = max_error_rate
+        self.saturated = saturated or (lambda: False)
+        self.concurrency = min(ADAPTIVE_START, max_concurrency)
+        self.slow_start = True
+        self.decreases = 0
+        # 每秒生效的並發數，以及並發數在其中發生變化的秒（這些秒不用於判定和報告）
+        self.levels: Dict[int, int] = {}
+        self.changed: Set[int] = set()
+
+    def decide(self, requests: int, p99_ms: float, errors: int, saturated: bool = False) -> int:
+        """根據一段觀察期的統計返回新的並發數"""
+        if not slo_met(requests, p99_ms, errors, self.target_p99, self.max_error_rate):
+            self.slow_start = False
+            self.decreases += 1
+            return max(1, int(self.concurrency * DECREASE_FACTOR))
+        if saturated:
+            return self.concurrency
+        if self.slow_start:
+            return min(self.max_concurrency, self.concurrency * 2)
+        return min(self.max_concurrency, self.concurrency + INCREASE_STEP)
+
+    async def run(self, apply: Callable[[int], None]):
+        """按觀察結果調整並發數，apply 使新的並發數生效"""
+        apply(self.concurrency)
+        # 當前觀察期的第一個完整秒
+        since = self.series.now() + 1
+        while True:
+            now = self.series.now()
+            self.levels[now] = self.concurrency
+            if now > since:
+                rows = self.series.rows(since, now)
+                requests = sum(row['requests'] for row in rows)
+                errors = sum(_errors(row) for row in rows)
+                span = now - since
+                # 整個觀察期都沒有請求完成，說明延遲至少有這麼長
+                stalled = requests == 0 and span * 1000 > self.target_p99
+                if requests >= MIN_SAMPLES or stalled:
+                    p99 = self.series.window(span, now)['p99'] if requests else float('inf')
+                    concurrency = self.decide(requests, p99, errors, self.saturated())
+                    if concurrency != self.concurrency:
+                        self.concurrency = concurrency
+                        self.levels[now] = concurrency
+                        self.changed.add(now)
+                        apply(concurrency)
+                        now += 1
+                    since = now
+            await asyncio.sleep(ADAPTIVE_POLL)
+
+    def best(self, series: TimeSeries, excluded: Optional[Set[int]] = None) -> Optional[Dict[str, Any]]:
+        """並發數穩定且滿足目標的秒中吞吐量最高的一秒"""
+        best = None
+        for second in sorted(self.levels):
+            if second in self.changed or (excluded and second in excluded):
+                continue
+            row = series.row(second)
+            if not slo_met(row['requests'], row['p99'], _errors(row), self.target_p99, self.max_error_rate):
+                continue
+            if best is None or row['requests'] > best['requests']:
+                best = dict(row, concurrency=self.levels[second])
+        return best
+
+    def settled(self) -> float:
+        """後半段測試的平均並發數"""
+        seconds = sorted(self.levels)
+        tail = seconds[len(seconds) // 2:]
+        return sum(self.levels[second] for second in tail) / len(tail) if tail else 0.0
+
+    def merge(self, other: 'AdaptiveController'):
+        """合併其他進程的並發數：同一秒相加"""
+        for second, level in other.levels.items():
+            self.levels[second] = self.levels.get(second, 0) + level
+        self.changed |= other.changed
+        self.decreases += other.decreases
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'levels': [[second, level] for second, level in self.levels.items()],
+                'changed': sorted(self.changed), 'decreases': self.decreases}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'AdaptiveController':
+        controller = cls(TimeSeries(1), 1, 0.0, 0.0)
+        controller.levels = {second: level for second, level in data['levels']}
+        controller.changed = set(data['changed'])
+        controller.decreases = data['decreases']
+        return controller
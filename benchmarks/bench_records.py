@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+比較每個請求記錄佔用的內存：舊版字典記錄 vs 緊湊的 RecordStore
+
+用法：python benchmarks/bench_records.py [請求數]
+
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from records import RecordStore  # noqa: E402
+from result_sink import MemorySink  # noqa: E402
+
+PARAMS = [{'param': f'id={i}'} for i in range(1000)]
+HEADERS = {'User-Agent': 'WAF-Tester/1.0', 'Accept': '*/*'}
+STATUSES = (200, 200, 200, 403, -1)
+
+
+def dict_records(n: int):
+    """舊版 send_request 的記錄格式"""
+    results = []
+    for _ in range(n):
+        status = random.choice(STATUSES)
+        record = {
+            'timestamp': datetime.now().isoformat(),
+            'status': status,
+            'response_time': random.random() / 10,
+            'params': random.choice(PARAMS),
+            'headers': HEADERS.copy(),
+        }
+        if status == -1:
+            record['error'] = 'Connection reset by peer'
+        results.append(record)
+    return results
+
+
+def compact_records(n: int):
+    """RecordStore 記錄格式"""
+    store = RecordStore(MemorySink(), PARAMS, HEADERS)
+    for _ in range(n):
+        status = random.choice(STATUSES)
+        store.append(time.monotonic_ns(), status, int(random.random() * 1e8),
+                     random.randrange(len(PARAMS)),
+                     'Connection reset by peer' if status == -1 else None)
+    store.flush()
+    return store
+
+
+def measure(func, n: int) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = func(n)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return (after - before) / n
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    old = measure(dict_records, n)
+    new = measure(compact_records, n)
+    print(f"requests:          {n}")
+    print(f"dict records:      {old:8.1f} bytes/request")
+    print(f"RecordStore:       {new:8.1f} bytes/request")
+    print(f"reduction:         {old / new:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+報告基準：生成指定行數的合成結果，分別寫入列式和CSV輸出，
+記錄由已保存結果重建統計（報告的主要開銷）所需的時間和峰值內存。
+
+用法：
+  python benchmarks/bench_report.py [--rows 5000000] [--formats columnar csv]
+
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import argparse
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from array import array
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from records import RecordBatch, RecordStore  # noqa: E402
+from result_sink import DEFAULT_BATCH_SIZE, SINK_FORMATS, create_sink  # noqa: E402
+from stats import RunStats  # noqa: E402
+
+STATUSES = (200, 200, 200, 403, 403, 404, 500, -1)
+
+
+def _max_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return (rss if platform.system() == 'Darwin' else rss * 1024) / 2 ** 20
+
+
+def _template_batch(size: int) -> RecordBatch:
+    rng = random.Random(0)
+    return RecordBatch.from_arrays({
+        'ts_ns': array('q', range(size)),
+        'status': array('h', (rng.choice(STATUSES) for _ in range(size))),
+        'latency_ns': array('q', (int(rng.lognormvariate(16, 1)) for _ in range(size))),
+        'param_idx': array('i', [-1]) * size,
+        'error_idx': array('i', [-1]) * size,
+    })
+
+
+def write_results(fmt: str, rows: int, directory: str):
+    """重複寫入同一個模板批次，直到達到指定行數"""
+    sink = create_sink(fmt, os.path.join(directory, SINK_FORMATS[fmt]))
+    RecordStore(sink, batch_size=DEFAULT_BATCH_SIZE)
+    template = _template_batch(DEFAULT_BATCH_SIZE)
+    written = 0
+    while written < rows:
+        size = min(DEFAULT_BATCH_SIZE, rows - written)
+        batch = template if size == DEFAULT_BATCH_SIZE else RecordBatch.from_arrays(
+            {name: template.column(name)[:size] for name in ('ts_ns', 'status', 'latency_ns',
+                                                                'param_idx', 'error_idx')})
+        sink.write_batch(batch)
+        written += size
+    sink.close()
+    return sink
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WAFTester 報告基準')
+    parser.add_argument('--rows', type=int, default=5_000_000, help='合成結果的行數')
+    parser.add_argument('--formats', nargs='*', default=['columnar', 'csv'], choices=list(SINK_FORMATS)[1:],
+                        help='測試的輸出格式')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='waf-bench-report-') as directory:
+        for fmt in args.formats:
+            start = time.perf_counter()
+            sink = write_results(fmt, args.rows, directory)
+            write_seconds = time.perf_counter() - start
+
+            rss_before = _max_rss_mb()
+            start = time.perf_counter()
+            stats = RunStats.from_columns(sink.iter_numeric())
+            rebuild_seconds = time.perf_counter() - start
+            assert stats.total == args.rows
+            summary = stats.latency_summary()['all']
+            print(f"{fmt:10} {args.rows} rows  write {write_seconds:6.2f}s  "
+                  f"rebuild {rebuild_seconds:6.2f}s ({args.rows / rebuild_seconds / 1e6:.1f}M rows/s)  "
+                  f"peak RSS +{_max_rss_mb() - rss_before:.0f}MB  p99 {summary['p99']:.2f}ms", flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+啟動時間基準：多次運行 `main.py --help`，記錄中位數和最慢一次的耗時，
+並檢查導入命令行入口時沒有載入報告使用的重型庫（pandas、matplotlib、numpy）。
+
+用法：
+  python benchmarks/bench_startup.py [--runs 10] [--max-ms 800]
+
+超出 --max-ms 或載入了重型庫時以非零狀態退出，可在 CI 中使用。
+
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 只應在生成報告時載入的模塊
+HEAVY_MODULES = ('pandas', 'matplotlib', 'numpy')
+
+
+def time_help(runs: int) -> List[float]:
+    """每次在新的解釋器中運行 `main.py --help`，返回各次耗時（毫秒）"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(ROOT, 'main.py'), '--help'], cwd=ROOT,
+                       stdout=subprocess.DEVNULL, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def loaded_heavy_modules() -> List[str]:
+    """在新的解釋器中導入命令行入口，返回已被載入的重型模塊"""
+    code = ('import sys, main; '
+            f'print(" ".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))')
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True,
+                            check=True).stdout
+    return output.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WAFTester 啟動時間基準')
+    parser.add_argument('--runs', type=int, default=10, help='運行次數')
+    parser.add_argument('--max-ms', type=float, default=0, help='中位數耗時上限(毫秒，0表示不檢查)')
+    args = parser.parse_args()
+
+    # 第一次運行會編譯字節碼，不計入結果
+    time_help(1)
+    timings = time_help(args.runs)
+    median = statistics.median(timings)
+    print(f"main.py --help: median {median:.1f}ms, min {min(timings):.1f}ms, max {max(timings):.1f}ms "
+          f"({args.runs} runs)")
+
+    failed = False
+    heavy = loaded_heavy_modules()
+    if heavy:
+        print(f"heavy modules loaded at import: {', '.join(heavy)}")
+        failed = True
+    if args.max_ms and median > args.max_ms:
+        print(f"median startup {median:.1f}ms exceeds {args.max_ms:.0f}ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+自測基準：在本地替身服務器上以多種並發和速率設置運行 WAFTester，
+記錄最大實際速率、每個請求的CPU時間和內存，以及生成報告的時間，
+結果保存為JSON，可與其他版本的結果比較。
+
+用法：
+  python benchmarks/bench_suite.py [--duration 5] [--output bench_results.json]
+  python benchmarks/bench_suite.py --compare old.json new.json
+
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from standin_server import DEFAULT_PORT, run_server, wait_until_ready  # noqa: E402
+
+# (名稱, 路徑, 並發線程數, 目標速率)
+SCENARIOS = (
+    ('ok-c10', '/ok', 10, 0),
+    ('ok-c50', '/ok', 50, 0),
+    ('ok-c100', '/ok', 100, 0),
+    ('blocked-c50', '/blocked', 50, 0),
+    ('error-c50', '/error', 50, 0),
+    ('reset-c10', '/reset', 10, 0),
+    ('slow50ms-c100', '/slow?ms=50', 100, 0),
+    ('ok-r500', '/ok', 50, 500),
+    ('ok-r1000', '/ok', 100, 1000),
+)
+
+# 比較結果時的指標及其方向（True 表示越大越好）
+COMPARED = (
+    ('achieved_rps', True),
+    ('cpu_us_per_request', False),
+    ('memory_bytes_per_request', False),
+    ('report_seconds', False),
+)
+
+
+def _max_rss_bytes() -> int:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以字節為單位，Linux 以 KB 為單位
+    return rss if platform.system() == 'Darwin' else rss * 1024
+
+
+def _run_scenario(name: str, url: str, threads: int, rate_limit: int, duration: int,
+                  output_format: str) -> Dict[str, Any]:
+    """在獨立進程中運行一個場景，進程的峰值內存只反映該場景"""
+    from config import Config
+    from waf_tester import WAFTester
+
+    # 圖表缺少字體等警告與基準無關
+    warnings.filterwarnings('ignore', category=UserWarning)
+    os.chdir(tempfile.mkdtemp(prefix='waf-bench-'))
+    config = Config(url=url, threads=threads, duration=duration, rate_limit=rate_limit,
+                    output_format=output_format)
+    tester = WAFTester(config)
+    baseline_rss = _max_rss_bytes()
+    cpu_start = time.process_time()
+    results = tester.run()
+    cpu = time.process_time() - cpu_start
+    peak_rss = _max_rss_bytes()
+
+    report_start = time.perf_counter()
+    tester.generate_report(results)
+    report_seconds = time.perf_counter() - report_start
+
+    requests = tester.stats.total
+    wall = tester.end_time - tester.start_time
+    latency = tester.stats.overall().percentiles((50, 99))
+    return {
+        'name': name,
+        'url': url,
+        'threads': threads,
+        'rate_limit': rate_limit,
+        'duration': duration,
+        'output_format': output_format,
+        'requests': requests,
+        'achieved_rps': requests / wall if wall else 0.0,
+        'cpu_seconds': cpu,
+        'cpu_us_per_request': cpu / requests * 1e6 if requests else None,
+        'memory_bytes_per_request': (peak_rss - baseline_rss) / requests if requests else None,
+        'peak_rss_bytes': peak_rss,
+        'report_seconds': report_seconds,
+        'p50_ms': latency[50] / 1000,
+        'p99_ms': latency[99] / 1000,
+        'status_counts': {str(k): v for k, v in tester.stats.status_counts.items()},
+    }
+
+
+def _git_version() -> str:
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_suite(duration: int, output_format: str, port: int, only: List[str]) -> Dict[str, Any]:
+    ctx = multiprocessing.get_context('spawn')
+    # 替身服務器在單獨的進程中運行，不計入被測進程的CPU時間
+    server = ctx.Process(target=run_server, args=(port,), daemon=True)
+    server.start()
+    try:
+        wait_until_ready(port)
+        scenarios = []
+        for name, path, threads, rate_limit in SCENARIOS:
+            if only and name not in only:
+                continue
+            # 每個場景使用新進程，依次運行避免互相干擾
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                result = pool.submit(_run_scenario, name, f'http://127.0.0.1:{port}{path}', threads,
+                                     rate_limit, duration, output_format).result()
+            scenarios.append(result)
+            print(f"{name:16} {result['achieved_rps']:9.1f} req/s  "
+                  f"{result['cpu_us_per_request'] or 0:7.1f} us CPU/req  "
+                  f"{result['memory_bytes_per_request'] or 0:8.1f} B/req  "
+                  f"report {result['report_seconds']:.2f}s", flush=True)
+    finally:
+        server.terminate()
+        server.join()
+    return {
+        'version': _git_version(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'scenarios': scenarios,
+    }
+
+
+def compare(old_path: str, new_path: str):
+    """逐場景比較兩份結果"""
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+    print(f"{old['version']} -> {new['version']}")
+    old_by_name = {s['name']: s for s in old['scenarios']}
+    for scenario in new['scenarios']:
+        before = old_by_name.get(scenario['name'])
+        if not before:
+            continue
+        parts = []
+        for key, higher_is_better in COMPARED:
+            a, b = before.get(key), scenario.get(key)
+            if not a or b is None:
+                continue
+            change = (b - a) / a * 100
+            better = change > 0 if higher_is_better else change < 0
+            parts.append(f"{key} {change:+.1f}%{'' if abs(change) < 5 else (' better' if better else ' WORSE')}")
+        print(f"{scenario['name']:16} " + ', '.join(parts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WAFTester 自測基準')
+    parser.add_argument('--duration', type=int, default=5, help='每個場景的測試時間(秒)')
+    parser.add_argument('--output-format', default='memory', help='詳細結果輸出格式')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='替身服務器端口')
+    parser.add_argument('--only', nargs='*', default=[], help='只運行指定名稱的場景')
+    parser.add_argument('--output', default='bench_results.json', help='結果文件')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='比較兩份結果文件')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    results = run_suite(args.duration, args.output_format, args.port, args.only)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+比較每個請求在客戶端構建請求時消耗的CPU時間：每次編碼參數 vs 預編譯的請求模板
+
+用法：python benchmarks/bench_templates.py [請求數]
+
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import asyncio
+import os
+import random
+import sys
+import time
+
+from aiohttp import ClientRequest
+from yarl import URL
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from templates import compile_headers, compile_templates  # noqa: E402
+
+URL_STR = 'http://127.0.0.1:8080/search?lang=en'
+PARAMS = [{'param': f"id={i}' OR '1'='1 <script>alert({i})</script>"} for i in range(1000)]
+HEADERS = {'Accept': '*/*', 'X-Test': 'waf'}
+
+
+def legacy_requests(n: int, loop):
+    """舊版 send_request：每次複製Headers並由 aiohttp 編碼 params"""
+    for _ in range(n):
+        headers = dict(HEADERS)
+        if not headers.get('User-Agent'):
+            headers['User-Agent'] = 'WAF-Tester/1.0'
+        ClientRequest('GET', URL(URL_STR), params=random.choice(PARAMS), headers=headers, loop=loop)
+
+
+def template_requests(n: int, loop):
+    """預編譯模板：URL和Headers在載入時構建一次"""
+    templates = compile_templates(URL_STR, PARAMS, compile_headers(HEADERS))
+    for _ in range(n):
+        template = random.choice(templates)
+        ClientRequest('GET', template.url, headers=template.headers, loop=loop)
+
+
+def measure(func, n: int, loop) -> float:
+    start = time.process_time()
+    func(n, loop)
+    return (time.process_time() - start) / n * 1e6
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    loop = asyncio.new_event_loop()
+    old = measure(legacy_requests, n, loop)
+    new = measure(template_requests, n, loop)
+    loop.close()
+    print(f"requests:          {n}")
+    print(f"encode per request:{old:8.2f} us CPU/request")
+    print(f"templates:         {new:8.2f} us CPU/request")
+    print(f"saved:             {old - new:8.2f} us CPU/request ({(1 - new / old) * 100:.0f}%)")
+
+
+if __name__ == '__main__':
+    main()
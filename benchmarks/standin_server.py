@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+本地替身目標服務器，供自測基準使用
+
+路徑：
+  /ok            固定返回 200
+  /blocked       固定返回 403（模擬 WAF 阻擋）
+  /slow?ms=50    延遲 ms 毫秒後返回 200
+  /error         返回 500
+  /reset         不返回響應直接關閉連接（傳輸錯誤）
+
+用法：python benchmarks/standin_server.py [端口]
+
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import asyncio
+import socket
+import sys
+import time
+
+from aiohttp import web
+
+DEFAULT_PORT = 8099
+BODY = b'ok'
+
+
+async def handle_ok(request: web.Request) -> web.Response:
+    return web.Response(body=BODY)
+
+
+async def handle_blocked(request: web.Request) -> web.Response:
+    return web.Response(status=403, body=b'blocked')
+
+
+async def handle_slow(request: web.Request) -> web.Response:
+    await asyncio.sleep(int(request.query.get('ms', 50)) / 1000)
+    return web.Response(body=BODY)
+
+
+async def handle_error(request: web.Request) -> web.Response:
+    return web.Response(status=500, body=b'error')
+
+
+async def handle_reset(request: web.Request) -> web.Response:
+    request.transport.close()
+    raise web.HTTPInternalServerError()
+
+
+def make_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get('/ok', handle_ok)
+    app.router.add_get('/blocked', handle_blocked)
+    app.router.add_get('/slow', handle_slow)
+    app.router.add_get('/error', handle_error)
+    app.router.add_get('/reset', handle_reset)
+    return app
+
+
+def run_server(port: int = DEFAULT_PORT, host: str = '127.0.0.1'):
+    web.run_app(make_app(), host=host, port=port, print=None, access_log=None)
+
+
+def wait_until_ready(port: int, host: str = '127.0.0.1', timeout: float = 30.0):
+    """等待服務器開始監聽"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"替身服務器未在 {timeout:.0f} 秒內啟動：{host}:{port}")
+
+
+if __name__ == '__main__':
+    run_server(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows 沒有 resource 模塊，不檢查文件描述符上限
+    resource = None
+
+# 標準模式的並發數和速率上限
+MAX_THREADS = 100
+MAX_RATE = 1000
+# 高並發模式的上限
+HIGH_CONCURRENCY_MAX_THREADS = 100_000
+HIGH_CONCURRENCY_MAX_RATE = 1_000_000
+# 高並發模式下每個連接的讀緩衝區（aiohttp read_bufsize，未讀的響應最多緩衝兩倍）
+HIGH_CONCURRENCY_READ_BUFSIZE = 8192
+# 除 socket 外每個進程預留的文件描述符（標準輸入輸出、結果文件、事件循環等）
+FD_RESERVE = 64
+# 每個進行中請求（含其 HTTP 連接）的用戶態內存：任務、協程、aiohttp 的請求/響應對象及讀緩衝，
+# 以 5000 個並發的慢響應請求實測約 12KB
+REQUEST_OVERHEAD_BYTES = 12 * 1024
+# 每個 TLS 連接額外的用戶態內存（SSL 對象及其緩衝區）
+TLS_OVERHEAD_BYTES = 48 * 1024
+# 無法讀取系統設置時假定的內核 socket 緩衝區（接收 + 發送）
+DEFAULT_SOCKET_BUFFER_BYTES = 131072 + 16384
+
+
+def _read_ints(path: str) -> Optional[List[int]]:
+    try:
+        with open(path) as f:
+            return [int(value) for value in f.read().split()]
+    except (OSError, ValueError):
+        return None
+
+
+def fd_limits() -> Optional[Tuple[int, int]]:
+    """當前進程的文件描述符軟/硬上限，不支持時返回 None"""
+    if resource is None:
+        return None
+    return resource.getrlimit(resource.RLIMIT_NOFILE)
+
+
+def ensure_fd_limit(needed: int) -> Optional[Tuple[int, int]]:
+    """需要時把文件描述符軟上限提高到 needed（不超過硬上限），返回調整後的上限
+
+    子進程繼承調整後的上限。硬上限不足時拋出 ValueError。
+    """
+    limits = fd_limits()
+    if limits is None:
+        return None
+    soft, hard = limits
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        if hard != resource.RLIM_INFINITY and hard < needed:
+            raise ValueError(f"需要 {needed} 個文件描述符，超出系統硬上限 {hard}；"
+                             f"請提高硬上限（例如 ulimit -Hn）或減少並發數")
+        resource.setrlimit(resource.RLIMIT_NOFILE, (needed, hard))
+        soft = needed
+    return soft, hard
+
+
+def _socket_buffer_bytes() -> int:
+    """每個 TCP socket 默認的內核接收 + 發送緩衝區"""
+    rmem = _read_ints('/proc/sys/net/ipv4/tcp_rmem')
+    wmem = _read_ints('/proc/sys/net/ipv4/tcp_wmem')
+    if rmem and wmem and len(rmem) == 3 and len(wmem) == 3:
+        return rmem[1] + wmem[1]
+    return DEFAULT_SOCKET_BUFFER_BYTES
+
+
+def _ephemeral_ports() -> Optional[int]:
+    """本機可用的臨時端口數（連接同一目標地址時的連接數上限）"""
+    ports = _read_ints('/proc/sys/net/ipv4/ip_local_port_range')
+    return ports[1] - ports[0] + 1 if ports and len(ports) == 2 else None
+
+
+def preflight(config) -> Dict[str, Any]:
+    """估算測試需要的 socket、文件描述符和內存"""
+    processes = config.processes
+    users = math.ceil(config.threads / processes)
+    sockets = users
+    for limit in (config.conn_limit, config.conn_limit_per_host):
+        if limit:
+            sockets = min(sockets, limit)
+    tls_bytes = TLS_OVERHEAD_BYTES if config.url.startswith('https://') else 0
+    return {
+        'users': config.threads,
+        'processes': processes,
+        'sockets': sockets * processes,
+        'pool_limited': sockets < users,
+        'fds_per_process': sockets + FD_RESERVE,
+        'fd_limits': fd_limits(),
+        'memory_bytes': config.threads * REQUEST_OVERHEAD_BYTES + sockets * processes * tls_bytes,
+        'kernel_bytes': sockets * processes * _socket_buffer_bytes(),
+        'ephemeral_ports': _ephemeral_ports(),
+    }
+
+
+def format_preflight(estimate: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+    """預檢結果的文字說明及警告"""
+    lines = [
+        f"虛擬用戶 {estimate['users']}（{estimate['processes']} 個進程），socket 最多 {estimate['sockets']} 個",
+        f"每個進程需要文件描述符 {estimate['fds_per_process']} 個"
+        + (f"（當前上限 軟 {estimate['fd_limits'][0]} / 硬 {estimate['fd_limits'][1]}，不足時自動提高軟上限）"
+           if estimate['fd_limits'] else ''),
+        f"用戶態內存約 {estimate['memory_bytes'] / 2 ** 20:.0f}MB，"
+        f"內核 socket 緩衝區最多約 {estimate['kernel_bytes'] / 2 ** 20:.0f}MB",
+    ]
+    warnings = []
+    if estimate['pool_limited']:
+        warnings.append("連接池上限小於並發數，實際並發受 --conn-limit / --conn-limit-per-host 限制（0表示無限制）")
+    limits = estimate['fd_limits']
+    if limits and limits[1] != resource.RLIM_INFINITY and limits[1] < estimate['fds_per_process']:
+        warnings.append("文件描述符硬上限不足，測試將無法開始")
+    ports = estimate['ephemeral_ports']
+    if ports and estimate['sockets'] > ports:
+        warnings.append(f"socket 數超過本機臨時端口數 {ports}，連接同一目標地址時會耗盡端口")
+    return lines, warnings
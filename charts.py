@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import functools
+import html
+import io
+import multiprocessing
+import os
+import platform
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from timeseries import LATENCY_BINS, TimeSeries, bin_upper
+
+# 圖表輸出格式：png 為 300dpi 點陣圖，svg 為矢量圖，html 把所有圖表內嵌到 charts.html
+CHART_FORMATS = ('png', 'svg', 'html')
+PNG_DPI = 300
+HTML_FILE = 'charts.html'
+# 熱力圖最多的列數，更長的測試按相鄰秒合併
+MAX_HEATMAP_COLUMNS = 1200
+
+
+def timeseries_specs(series: TimeSeries, t: Dict[str, str]) -> List[Dict[str, Any]]:
+    """由逐秒統計生成延遲隨時間變化、吞吐量隨時間變化和延遲熱力圖的繪圖數據"""
+    rows = series.rows()
+    if not rows:
+        return []
+    start = rows[0]['second']
+    x = [row['second'] - start for row in rows]
+    specs = [
+        {'kind': 'lines', 'name': 'latency_over_time', 'title': t['latency_over_time'], 'x': x,
+         'series': [(name, [row[name] for row in rows]) for name in ('p50', 'p99', 'mean')],
+         'xlabel': t['elapsed'], 'ylabel': t['latency_ms']},
+        {'kind': 'lines', 'name': 'rps_over_time', 'title': t['rps_over_time'], 'x': x,
+         'series': [(t['total_requests'], [row['requests'] for row in rows]),
+                    (t['blocked'], [row['blocked'] for row in rows]),
+                    (t['errors'], [row['error'] for row in rows])],
+         'xlabel': t['elapsed'], 'ylabel': t['requests_per_second']},
+    ]
+
+    # 每列合併 step 秒，矩陣行為延遲分桶、列為時間
+    step = -(-len(rows) // MAX_HEATMAP_COLUMNS)
+    columns = []
+    for i in range(0, len(rows), step):
+        column = [0] * LATENCY_BINS
+        for row in rows[i:i + step]:
+            for b, count in enumerate(series.latency_bins(row['second'])):
+                column[b] += count
+        columns.append(column)
+    used = [b for b in range(LATENCY_BINS) if any(column[b] for column in columns)]
+    if used:
+        low, high = used[0], used[-1]
+        # 分桶的上下界（毫秒），對數坐標不能從 0 開始
+        y_edges = [max((bin_upper(b - 1) + 1 if b else 0) / 1000, 0.001) for b in range(low, high + 1)]
+        y_edges.append((bin_upper(high) + 1) / 1000)
+        specs.append({
+            'kind': 'heatmap', 'name': 'latency_heatmap', 'title': t['latency_heatmap'],
+            'x_edges': [i * step for i in range(len(columns) + 1)], 'y_edges': y_edges,
+            'matrix': [[column[b] for column in columns] for b in range(low, high + 1)],
+            'xlabel': t['elapsed'], 'ylabel': t['latency_ms'], 'zlabel': t['request_count'],
+        })
+    return specs
+
+
+@functools.lru_cache(maxsize=None)
+def _pyplot():
+    """首次繪圖時才載入 matplotlib 並設置字體，命令行啟動和不生成報告的測試不需要支付導入開銷"""
+    import matplotlib
+    # 只保存到文件，不需要交互式後端
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    # 設置中文字體
+    if platform.system() == 'Windows':
+        plt.rcParams['font.sans-serif'] = ['Microsoft YaHei']  # 微軟雅黑
+    elif platform.system() == 'Darwin':
+        plt.rcParams['font.sans-serif'] = ['PingFang HK']     # macOS
+    else:
+        plt.rcParams['font.sans-serif'] = ['Noto Sans TC']    # Linux
+
+    plt.rcParams['axes.unicode_minus'] = False  # 解決負號顯示問題
+    return plt
+
+
+def _draw_histogram(plt, spec: Dict[str, Any]):
+    edges = spec['edges']
+    plt.figure(figsize=(10, 6))
+    plt.bar(edges[:-1], spec['counts'], width=[b - a for a, b in zip(edges, edges[1:])], align='edge')
+    plt.xlabel(spec['xlabel'], fontsize=10)
+    plt.ylabel(spec['ylabel'], fontsize=10)
+    plt.grid(True, linestyle='--', alpha=0.7)
+
+
+def _draw_pie(plt, spec: Dict[str, Any]):
+    plt.figure(figsize=(8, 8))
+    colors = ['#2ecc71', '#e74c3c', '#3498db', '#f1c40f']  # 設置顏色
+    patches, texts, autotexts = plt.pie(
+        spec['values'],
+        labels=spec['labels'],
+        autopct='%1.1f%%',
+        colors=colors,
+        startangle=90
+    )
+    # 設置字體大小
+    plt.setp(autotexts, size=9, weight='bold')
+    plt.setp(texts, size=9)
+
+
+def _draw_lines(plt, spec: Dict[str, Any]):
+    plt.figure(figsize=(12, 5))
+    for label, values in spec['series']:
+        plt.plot(spec['x'], values, label=label, linewidth=1)
+    plt.xlabel(spec['xlabel'], fontsize=10)
+    plt.ylabel(spec['ylabel'], fontsize=10)
+    plt.grid(True, linestyle='--', alpha=0.7)
+    plt.legend(fontsize=9)
+
+
+def _draw_heatmap(plt, spec: Dict[str, Any]):
+    from matplotlib.colors import LogNorm
+
+    matrix = spec['matrix']
+    plt.figure(figsize=(12, 6))
+    # 計數跨越多個數量級，使用對數色階；空格不著色
+    masked = [[count if count else float('nan') for count in row] for row in matrix]
+    mesh = plt.pcolormesh(spec['x_edges'], spec['y_edges'], masked, norm=LogNorm(), shading='flat')
+    plt.colorbar(mesh, label=spec['zlabel'])
+    plt.yscale('log')
+    plt.xlabel(spec['xlabel'], fontsize=10)
+    plt.ylabel(spec['ylabel'], fontsize=10)
+
+
+_DRAW = {
+    'histogram': _draw_histogram,
+    'pie': _draw_pie,
+    'lines': _draw_lines,
+    'heatmap': _draw_heatmap,
+}
+
+
+def render_chart(spec: Dict[str, Any], fmt: str = 'png') -> str:
+    """繪製一個圖表：png/svg 保存為文件並返回文件名，html 返回 SVG 文本
+
+    spec 只包含預先匯總的分桶和逐秒數據，可在工作進程中繪製。
+    """
+    plt = _pyplot()
+    try:
+        _DRAW[spec['kind']](plt, spec)
+        plt.title(spec['title'], fontsize=12, pad=20 if spec['kind'] == 'pie' else None)
+        if fmt == 'html':
+            buffer = io.StringIO()
+            plt.savefig(buffer, format='svg', bbox_inches='tight')
+            return buffer.getvalue()
+        path = f"{spec['name']}.{fmt}"
+        plt.savefig(path, dpi=PNG_DPI if fmt == 'png' else None, bbox_inches='tight')
+        return path
+    finally:
+        plt.close()
+
+
+def render_charts(specs: List[Dict[str, Any]], fmt: str = 'png', title: str = '',
+                  workers: Optional[int] = None) -> List[str]:
+    """在多個工作進程中並行繪製圖表，返回生成的文件名"""
+    if fmt not in CHART_FORMATS:
+        raise ValueError(f"圖表格式必須是以下之一：{', '.join(CHART_FORMATS)}")
+    if not specs:
+        return []
+    workers = min(len(specs), workers or os.cpu_count() or 1)
+    if workers > 1:
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            outputs = list(pool.map(render_chart, specs, [fmt] * len(specs)))
+    else:
+        outputs = [render_chart(spec, fmt) for spec in specs]
+    if fmt != 'html':
+        return outputs
+
+    with open(HTML_FILE, 'w', encoding='utf-8') as f:
+        f.write(f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{html.escape(title)}</title>'
+                '<style>body{font-family:sans-serif;margin:2em}figure{margin:0 0 2em}'
+                'svg{max-width:100%;height:auto}</style></head><body>\n')
+        f.write(f'<h1>{html.escape(title)}</h1>\n')
+        for svg in outputs:
+            # 去掉 XML 聲明，直接內嵌 SVG
+            f.write(f"<figure>{svg[svg.find('<svg'):]}</figure>\n")
+        f.write('</body></html>\n')
+    return [HTML_FILE]
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import hashlib
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Mapping, Optional, Tuple
+
+# 默認讀取的響應體前綴字節數
+DEFAULT_BODY_BYTES = 4096
+# 響應體匹配結果緩存的條目數（按響應體前綴的哈希）
+BODY_CACHE_SIZE = 4096
+# 含反向引用的特徵合併後組號會改變，需要單獨匹配
+_BACKREF = re.compile(rb'\\[1-9]|\(\?P=')
+
+
+@dataclass
+class Signature:
+    """阻擋頁特徵：指定的狀態碼、響應頭和響應體條件全部滿足時匹配"""
+    name: str
+    status: Tuple[int, ...] = ()
+    headers: Dict[str, str] = field(default_factory=dict)
+    body: Optional[str] = None
+    # 不區分大小寫的匹配在 re 中明顯較慢，默認關閉
+    ignore_case: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'name': self.name, 'status': list(self.status), 'headers': self.headers, 'body': self.body,
+                'ignore_case': self.ignore_case}
+
+
+class ResponseClassifier:
+    """按特徵識別阻擋頁（例如狀態碼 200/406/429 加上質詢頁面）
+
+    響應體特徵按是否區分大小寫直接以 | 連接為合併的正則表達式（不加分組，re 才能按首字符快速跳過）：
+    大多數響應只需一次掃描即可確定沒有特徵匹配，有匹配時才逐個特徵確認。
+    匹配結果按響應體前綴的哈希緩存，重複的阻擋頁不需要再次掃描。
+    特徵按文件中的順序檢查，第一個匹配的特徵即為結果。
+    """
+
+    def __init__(self, signatures: List[Signature], body_bytes: int = DEFAULT_BODY_BYTES):
+        if not signatures:
+            raise ValueError("響應特徵列表不能為空")
+        if not isinstance(body_bytes, int) or body_bytes < 1:
+            raise ValueError("body_bytes必須是正整數")
+        self.signatures = signatures
+        self.body_bytes = body_bytes
+        self.names = [sig.name for sig in signatures]
+        self._headers = []
+        self._body: Dict[int, re.Pattern] = {}
+        sources: Dict[int, List[bytes]] = {}
+        standalone = []
+        for i, sig in enumerate(signatures):
+            flags = re.IGNORECASE if sig.ignore_case else 0
+            try:
+                self._headers.append([(name, re.compile(pattern, flags)) for name, pattern in sig.headers.items()])
+                if sig.body is not None:
+                    source = sig.body.encode('utf-8')
+                    self._body[i] = re.compile(source, flags)
+                    if _BACKREF.search(source):
+                        standalone.append(self._body[i])
+                    else:
+                        sources.setdefault(flags, []).append(source)
+            except re.error as e:
+                raise ValueError(f"響應特徵 {sig.name} 的正則表達式無效：{e}")
+        try:
+            self._matchers = [re.compile(b'|'.join(group), flags) for flags, group in sources.items()]
+        except re.error as e:
+            raise ValueError(f"響應體特徵無法合併（不能使用內聯標記或重複的組名，請改用 ignore_case）：{e}")
+        self._matchers += standalone
+        # 各狀態碼需要檢查的特徵索引
+        self._candidates: Dict[int, Tuple[int, ...]] = {}
+        self._cache: Dict[bytes, FrozenSet[int]] = {}
+
+    @classmethod
+    def from_dict(cls, data: Any) -> 'ResponseClassifier':
+        """由JSON數據創建：特徵列表，或包含 signatures 和 body_bytes 的對象"""
+        body_bytes = DEFAULT_BODY_BYTES
+        if isinstance(data, dict):
+            body_bytes = data.get('body_bytes', body_bytes)
+            data = data.get('signatures')
+        if not isinstance(data, list):
+            raise ValueError("響應特徵文件必須包含特徵列表")
+        signatures = []
+        for i, item in enumerate(data):
+            if not isinstance(item, dict):
+                raise ValueError(f"第{i + 1}個響應特徵必須是鍵值對格式")
+            status = item.get('status', [])
+            status = [status] if isinstance(status, int) else status
+            if not isinstance(status, list) or not all(isinstance(code, int) for code in status):
+                raise ValueError(f"第{i + 1}個響應特徵的status必須是狀態碼或狀態碼列表")
+            headers = item.get('headers', {})
+            if not isinstance(headers, dict) or not all(isinstance(v, str) for v in headers.values()):
+                raise ValueError(f"第{i + 1}個響應特徵的headers必須是響應頭名稱到正則表達式的鍵值對")
+            body = item.get('body')
+            if body is not None and not isinstance(body, str):
+                raise ValueError(f"第{i + 1}個響應特徵的body必須是正則表達式字符串")
+            if not (status or headers or body):
+                raise ValueError(f"第{i + 1}個響應特徵至少需要指定status、headers或body之一")
+            signatures.append(Signature(name=str(item.get('name', f'signature{i + 1}')), status=tuple(status),
+                                        headers=headers, body=body, ignore_case=bool(item.get('ignore_case', False))))
+        return cls(signatures, body_bytes)
+
+    @classmethod
+    def load(cls, path: str) -> 'ResponseClassifier':
+        """從JSON文件載入"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls.from_dict(json.load(f))
+        except json.JSONDecodeError:
+            raise ValueError("響應特徵文件格式錯誤，必須是有效的JSON格式")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'body_bytes': self.body_bytes, 'signatures': [sig.to_dict() for sig in self.signatures]}
+
+    def __getstate__(self):
+        # 子進程由特徵重新編譯
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        other = ResponseClassifier.from_dict(state)
+        self.__dict__.update(other.__dict__)
+
+    def candidates(self, status: int) -> Tuple[int, ...]:
+        """狀態碼為 status 的響應需要檢查的特徵索引（按文件順序）"""
+        found = self._candidates.get(status)
+        if found is None:
+            found = self._candidates[status] = tuple(
+                i for i, sig in enumerate(self.signatures) if not sig.status or status in sig.status)
+        return found
+
+    def wants_body(self, status: int) -> bool:
+        """此狀態碼的響應是否需要讀取響應體前綴"""
+        return any(i in self._body for i in self.candidates(status))
+
+    def _body_hits(self, body: bytes) -> FrozenSet[int]:
+        """響應體前綴匹配的特徵索引"""
+        key = hashlib.blake2b(body, digest_size=16).digest()
+        hits = self._cache.get(key)
+        if hits is None:
+            if not any(matcher.search(body) for matcher in self._matchers):
+                hits = frozenset()
+            else:
+                hits = frozenset(i for i, pattern in self._body.items() if pattern.search(body))
+            if len(self._cache) >= BODY_CACHE_SIZE:
+                del self._cache[next(iter(self._cache))]
+            self._cache[key] = hits
+        return hits
+
+    def classify(self, status: int, headers: Mapping[str, str], body: bytes = b'') -> Optional[int]:
+        """返回第一個匹配的特徵索引，沒有匹配時返回 None"""
+        hits = None
+        for i in self.candidates(status):
+            matched = True
+            for name, pattern in self._headers[i]:
+                value = headers.get(name)
+                if value is None or pattern.search(value) is None:
+                    matched = False
+                    break
+            if not matched:
+                continue
+            if i in self._body:
+                if hits is None:
+                    hits = self._body_hits(body)
+                if i not in hits:
+                    continue
+            return i
+        return None
+
+
+async def read_prefix(stream, limit: int) -> bytes:
+    """讀取響應體的前 limit 個字節，不緩衝整個響應體"""
+    chunks = []
+    remaining = limit
+    while remaining > 0:
+        chunk = await stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
@@ -10,9 +10,19 @@ https://opensource.org/licenses/MIT
 import json
 import os
 from dataclasses import dataclass
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Union
 from urllib.parse import urlparse
 
+from capacity import HIGH_CONCURRENCY_MAX_RATE, HIGH_CONCURRENCY_MAX_THREADS, MAX_RATE, MAX_THREADS
+from charts import CHART_FORMATS
+from classifier import ResponseClassifier
+from corpus import Corpus
+from load_profile import LoadProfile
+from replay import REPLAY_FORMATS
+from selection import SELECTION_STRATEGIES
+from result_sink import DEFAULT_BATCH_SIZE, SINK_FORMATS
+from templates import LazyTemplates, RequestTemplate, compile_headers, compile_templates
+
 @dataclass
 class Config:
     url: str
@@ -21,13 +31,69 @@ class Config:
     rate_limit: int
     params_file: Optional[str] = None
     headers_file: Optional[str] = None
-    _params: List[Dict] = None
+    output_format: str = 'csv'
+    batch_size: int = DEFAULT_BATCH_SIZE
+    processes: int = 1
+    # 高並發模式：提高並發數和速率上限，由單一調度協程按並發槽位派發請求
+    high_concurrency: bool = False
+    conn_limit: int = 100
+    conn_limit_per_host: int = 0
+    keepalive_timeout: float = 15.0
+    dns_cache_ttl: int = 10
+    force_close: bool = False
+    # 請求超時(秒，0表示不限制)：建立連接、兩次讀取之間和整個請求
+    connect_timeout: float = 10.0
+    read_timeout: float = 30.0
+    total_timeout: float = 30.0
+    # 到達持續時間後等待進行中請求完成的寬限期(秒)，之後取消剩餘請求
+    grace_period: float = 5.0
+    profile_file: Optional[str] = None
+    signatures_file: Optional[str] = None
+    metrics_host: str = '127.0.0.1'
+    metrics_port: int = 0
+    trace_phases: bool = False
+    chart_format: str = 'png'
+    params_index_cache: bool = True
+    # 自適應並發：以 threads 為上限調整並發數，保持 p99 延遲(毫秒)和錯誤率在目標之內
+    adaptive: bool = False
+    target_p99: float = 500.0
+    max_error_rate: float = 0.01
+    selection: str = 'random'
+    seed: Optional[int] = None
+    # 訪問日誌回放：按日誌時間（乘以倍速，0表示最大吞吐量）發送其中的GET請求，threads 為並發上限
+    replay_file: Optional[str] = None
+    replay_format: str = 'auto'
+    replay_speed: float = 1.0
+    # 多進程或多代理時本配置所屬的分片，參數選擇策略據此劃分參數項
+    shard_index: int = 0
+    shard_count: int = 1
+    _params: Union[List[Dict], Corpus] = None
     _headers: Dict = None
+    _request_headers: Optional[Dict] = None
+    _templates: Union[List[RequestTemplate], LazyTemplates] = None
+    _base_template: Optional[RequestTemplate] = None
+    _profile: Optional[LoadProfile] = None
+    _classifier: Optional[ResponseClassifier] = None
 
     def __post_init__(self):
+        # 負載配置決定總持續時間和並發數，需在驗證之前載入
+        self.load_profile()
         self.validate()
         self.load_params()
         self.load_headers()
+        self.load_signatures()
+        self.compile_templates()
+
+    def __getstate__(self):
+        # 預編譯的模板不可序列化，傳給子進程後重新編譯
+        state = self.__dict__.copy()
+        for name in ('_request_headers', '_templates', '_base_template'):
+            state[name] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.compile_templates()
 
     def validate(self):
         """驗證配置參數"""
@@ -53,8 +119,11 @@ class Config:
             raise ValueError("並發線程數必須是整數")
         if self.threads < 1:
             raise ValueError("並發線程數必須大於0")
-        if self.threads > 100:
-            raise ValueError("並發線程數不能超過100")
+        max_threads, max_rate = (HIGH_CONCURRENCY_MAX_THREADS, HIGH_CONCURRENCY_MAX_RATE) \
+            if self.high_concurrency else (MAX_THREADS, MAX_RATE)
+        hint = "" if self.high_concurrency else "（高並發模式可提高上限）"
+        if self.threads > max_threads:
+            raise ValueError(f"並發線程數不能超過{max_threads}{hint}")
         
         # 驗證持續時間
         if not isinstance(self.duration, int):
@@ -69,8 +138,85 @@ class Config:
             raise ValueError("請求速率限制必須是整數")
         if self.rate_limit < 0:
             raise ValueError("請求速率限制不能為負數")
-        if self.rate_limit > 1000:
-            raise ValueError("請求速率限制不能超過1000次/秒")
+        if self.rate_limit > max_rate:
+            raise ValueError(f"請求速率限制不能超過{max_rate}次/秒{hint}")
+
+        # 驗證結果輸出
+        if self.output_format not in SINK_FORMATS:
+            raise ValueError(f"輸出格式必須是以下之一：{', '.join(SINK_FORMATS)}")
+        if not isinstance(self.batch_size, int) or self.batch_size < 1:
+            raise ValueError("寫入批量大小必須是正整數")
+        if self.chart_format not in CHART_FORMATS:
+            raise ValueError(f"圖表格式必須是以下之一：{', '.join(CHART_FORMATS)}")
+
+        # 驗證進程數
+        if not isinstance(self.processes, int):
+            raise ValueError("進程數必須是整數")
+        if self.processes < 1:
+            raise ValueError("進程數必須大於0")
+        if self.processes > self.threads:
+            raise ValueError("進程數不能超過並發線程數")
+        if 0 < self.rate_limit < self.processes:
+            raise ValueError("請求速率限制不能小於進程數")
+        if self.processes > 1 and self.output_format == 'memory':
+            raise ValueError("多進程模式不支持memory輸出格式")
+        if self._profile and self.processes > 1:
+            for stage in self._profile.stages:
+                if (stage.threads or self.processes) < self.processes or (stage.rate or self.processes) < self.processes:
+                    raise ValueError("多進程模式下每個負載階段的並發數和速率不能小於進程數")
+
+        # 驗證自適應並發
+        if self.adaptive:
+            if self._profile:
+                raise ValueError("自適應並發不能與負載配置同時使用")
+            if not isinstance(self.target_p99, (int, float)) or self.target_p99 <= 0:
+                raise ValueError("目標p99延遲必須大於0")
+            if not isinstance(self.max_error_rate, (int, float)) or not 0 <= self.max_error_rate <= 1:
+                raise ValueError("最大錯誤率必須在0到1之間")
+
+        # 驗證訪問日誌回放
+        if self.replay_file:
+            if not os.path.exists(self.replay_file):
+                raise ValueError(f"無法找到訪問日誌：{self.replay_file}")
+            if self.replay_format not in REPLAY_FORMATS:
+                raise ValueError(f"訪問日誌格式必須是以下之一：{', '.join(REPLAY_FORMATS)}")
+            if not isinstance(self.replay_speed, (int, float)) or self.replay_speed < 0:
+                raise ValueError("回放倍速必須是非負數（0表示最大吞吐量）")
+            if self._profile or self.adaptive or self.rate_limit:
+                raise ValueError("訪問日誌回放按日誌時間發送，不能與負載配置、自適應並發或速率限制同時使用")
+            if self.params_file:
+                raise ValueError("訪問日誌回放使用日誌中的路徑和查詢串，不能同時指定參數文件")
+
+        # 驗證參數選擇策略
+        if self.selection not in SELECTION_STRATEGIES:
+            raise ValueError(f"參數選擇策略必須是以下之一：{', '.join(SELECTION_STRATEGIES)}")
+        if self.seed is not None and not isinstance(self.seed, int):
+            raise ValueError("隨機種子必須是整數")
+        if not isinstance(self.shard_count, int) or self.shard_count < 1 \
+                or not 0 <= self.shard_index < self.shard_count:
+            raise ValueError("分片索引必須在0到分片數之間")
+
+        # 驗證連接池設置
+        if not isinstance(self.conn_limit, int) or self.conn_limit < 0:
+            raise ValueError("連接數上限必須是非負整數（0表示無限制）")
+        if not isinstance(self.conn_limit_per_host, int) or self.conn_limit_per_host < 0:
+            raise ValueError("每主機連接數上限必須是非負整數（0表示無限制）")
+        if not isinstance(self.keepalive_timeout, (int, float)) or self.keepalive_timeout < 0:
+            raise ValueError("Keep-Alive超時必須是非負數")
+        if not isinstance(self.dns_cache_ttl, int) or self.dns_cache_ttl < 0:
+            raise ValueError("DNS緩存時間必須是非負整數")
+
+        # 驗證超時和寬限期
+        for value, name in ((self.connect_timeout, "連接超時"), (self.read_timeout, "讀取超時"),
+                            (self.total_timeout, "請求總超時"), (self.grace_period, "收尾寬限期")):
+            if not isinstance(value, (int, float)) or value < 0:
+                raise ValueError(f"{name}必須是非負數")
+
+        # 驗證指標服務
+        if not isinstance(self.metrics_port, int) or not 0 <= self.metrics_port <= 65535:
+            raise ValueError("指標服務端口必須在0到65535之間（0表示不啟用）")
+        if self.metrics_port and self.metrics_port + self.processes - 1 > 65535:
+            raise ValueError("指標服務端口加上進程數超出範圍")
 
         # 驗證文件路徑
         if self.params_file:
@@ -85,19 +231,45 @@ class Config:
             if not self.headers_file.endswith('.json'):
                 raise ValueError("Headers文件必須是.json格式")
 
+    def load_profile(self):
+        """載入分階段負載配置"""
+        if not self.profile_file:
+            return
+        if not os.path.exists(self.profile_file):
+            raise ValueError(f"無法找到負載配置文件：{self.profile_file}")
+        if not self.profile_file.endswith('.json'):
+            raise ValueError("負載配置文件必須是.json格式")
+        self._profile = LoadProfile.load(self.profile_file)
+        self.apply_profile()
+
+    def load_signatures(self):
+        """載入阻擋頁特徵"""
+        if not self.signatures_file:
+            return
+        if not os.path.exists(self.signatures_file):
+            raise ValueError(f"無法找到響應特徵文件：{self.signatures_file}")
+        if not self.signatures_file.endswith('.json'):
+            raise ValueError("響應特徵文件必須是.json格式")
+        self._classifier = ResponseClassifier.load(self.signatures_file)
+
+    def apply_profile(self):
+        """按負載配置推導總持續時間、工作協程數和最大速率"""
+        profile = self._profile
+        self.duration = profile.duration
+        if profile.rate_based:
+            # 以速率為目標時 threads 是並發上限，階段未指定並發數時沿用
+            self.threads = max(self.threads, profile.max_threads())
+            self.rate_limit = profile.max_rate()
+        else:
+            self.threads = profile.max_threads()
+
     def load_params(self):
-        """載入GET參數列表"""
+        """載入GET參數列表：以內存映射方式建立偏移索引，參數項被抽中時才解碼"""
         if self.params_file:
             try:
-                with open(self.params_file, 'r', encoding='utf-8') as f:
-                    if self.params_file.endswith('.json'):
-                        self._params = json.load(f)
-                        if not isinstance(self._params, list):
-                            raise ValueError("參數文件必須包含參數列表")
-                    else:  # .txt 文件
-                        self._params = [{'param': line.strip()} for line in f if line.strip()]
-            except json.JSONDecodeError:
-                raise ValueError("參數文件格式錯誤，必須是有效的JSON格式")
+                self._params = Corpus(self.params_file, self.params_index_cache)
+            except ValueError:
+                raise
             except Exception as e:
                 raise ValueError(f"無法載入參數文件：{str(e)}")
         else:
@@ -116,4 +288,16 @@ class Config:
             except Exception as e:
                 raise ValueError(f"無法載入Headers文件：{str(e)}")
         else:
-            self._headers = {} 
\ No newline at end of file
+            self._headers = {}
+
+    def compile_templates(self):
+        """將參數項編譯為最終URL，所有請求共享同一份只讀Headers
+
+        參數文件按需編譯；直接傳入的參數列表（例如控制器下發的配置）在載入時全部預編譯並驗證。
+        """
+        self._request_headers = compile_headers(self._headers)
+        if isinstance(self._params, Corpus):
+            self._templates = LazyTemplates(self.url, self._params, self._request_headers)
+        else:
+            self._templates = compile_templates(self.url, self._params or [], self._request_headers)
+        self._base_template = compile_templates(self.url, [None], self._request_headers)[0]
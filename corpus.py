@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import codecs
+import json
+import mmap
+import os
+import struct
+from array import array
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from selection import WEIGHT_KEY
+
+# 索引緩存文件：魔數、版本、源文件大小、修改時間(納秒)、條目數，之後為每項的 [開始, 結束) 字節偏移，
+# JSON文件另有每項的權重（double）
+INDEX_SUFFIX = '.idx'
+_INDEX_MAGIC = b'WAFI'
+_INDEX_VERSION = 2
+_INDEX_HEADER = struct.Struct('<4sIQqQ')
+
+# 流式解析JSON時每次讀取的字節數
+JSON_CHUNK_BYTES = 1 << 20
+_WHITESPACE = ' \t\r\n'
+
+
+class Corpus:
+    """以內存映射方式讀取的參數列表，只保存每一項的字節偏移，被抽中時才解碼
+
+    .txt 文件每個非空行為一項（{'param': 行內容}），.json 文件為對象數組。
+    偏移索引可緩存在源文件旁（<文件名>.idx），源文件大小或修改時間變化後自動重建。
+    JSON文件建立索引時順便記錄每項的 _weight（無效值記為 -1），weighted 選擇不需要再解碼每一項；
+    .txt 文件沒有權重，每項按 1 計算。
+    """
+
+    def __init__(self, path: str, cache_index: bool = True):
+        self.path = path
+        self.kind = 'json' if path.endswith('.json') else 'txt'
+        self.cache_index = cache_index
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._offsets = array('Q')
+        self._weights: Optional[array] = None
+        self._open()
+        stat = os.stat(path)
+        index = self._read_index(stat) if cache_index else None
+        if index is None:
+            index = self._build_index()
+            if cache_index:
+                self._write_index(stat, *index)
+        self._offsets, self._weights = index
+
+    def _open(self):
+        self._file = open(self.path, 'rb')
+        # 空文件無法映射
+        if os.fstat(self._file.fileno()).st_size:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __getstate__(self):
+        # 子進程重新映射文件；索引已緩存時不隨配置傳輸
+        state = {'path': self.path, 'kind': self.kind, 'cache_index': self.cache_index}
+        if not (self.cache_index and os.path.exists(self.index_path)):
+            state['offsets'] = self._offsets
+            state['weights'] = self._weights
+        return state
+
+    def __setstate__(self, state):
+        self.path = state['path']
+        self.kind = state['kind']
+        self.cache_index = state['cache_index']
+        self._file = None
+        self._mmap = None
+        self._open()
+        index = (state['offsets'], state['weights']) if 'offsets' in state else None
+        if index is None:
+            index = self._read_index(os.stat(self.path))
+        self._offsets, self._weights = index if index is not None else self._build_index()
+
+    def __len__(self) -> int:
+        return len(self._offsets) // 2
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __getitem__(self, idx: int) -> Dict[str, Any]:
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        start, end = self._offsets[2 * idx], self._offsets[2 * idx + 1]
+        data = self._mmap[start:end]
+        if self.kind == 'json':
+            return json.loads(data)
+        return {'param': data.decode('utf-8').strip()}
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def item_weights(self) -> array:
+        """每項的權重（建立索引時記錄）；文本文件每項為 1"""
+        if self._weights is None:
+            return array('d', [1.0]) * len(self)
+        return self._weights
+
+    @property
+    def index_path(self) -> str:
+        return self.path + INDEX_SUFFIX
+
+    def _read_index(self, stat: os.stat_result) -> Optional[Tuple[array, Optional[array]]]:
+        """讀取緩存的 (偏移, 權重)，不存在或已過期時返回 None"""
+        try:
+            with open(self.index_path, 'rb') as f:
+                header = f.read(_INDEX_HEADER.size)
+                if len(header) != _INDEX_HEADER.size:
+                    return None
+                magic, version, size, mtime_ns, count = _INDEX_HEADER.unpack(header)
+                if (magic, version, size, mtime_ns) != (_INDEX_MAGIC, _INDEX_VERSION, stat.st_size,
+                                                        stat.st_mtime_ns):
+                    return None
+                offsets = array('Q')
+                offsets.frombytes(f.read(16 * count))
+                weights = None
+                if self.kind == 'json':
+                    weights = array('d')
+                    weights.frombytes(f.read(8 * count))
+                if f.read(1):
+                    return None
+        except (OSError, ValueError):
+            return None
+        if len(offsets) != 2 * count or (weights is not None and len(weights) != count):
+            return None
+        return offsets, weights
+
+    def _write_index(self, stat: os.stat_result, offsets: array, weights: Optional[array]):
+        """把索引寫到源文件旁，目錄不可寫時略過"""
+        tmp = f"{self.index_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(_INDEX_HEADER.pack(_INDEX_MAGIC, _INDEX_VERSION, stat.st_size, stat.st_mtime_ns,
+                                           len(offsets) // 2))
+                offsets.tofile(f)
+                if weights is not None:
+                    weights.tofile(f)
+            os.replace(tmp, self.index_path)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def _build_index(self) -> Tuple[array, Optional[array]]:
+        if self._mmap is None:
+            if self.kind == 'json':
+                raise ValueError("參數文件格式錯誤，必須是有效的JSON格式")
+            return array('Q'), None
+        if self.kind == 'json':
+            return _index_json(self._mmap)
+        return _index_lines(self._mmap), None
+
+
+def _index_lines(mm: mmap.mmap) -> array:
+    """文本文件：記錄每個非空行的 [開始, 結束) 偏移"""
+    offsets = array('Q')
+    size = len(mm)
+    start = 0
+    while start < size:
+        end = mm.find(b'\n', start)
+        if end < 0:
+            end = size
+        if mm[start:end].strip():
+            offsets.append(start)
+            offsets.append(end)
+        start = end + 1
+    return offsets
+
+
+def _item_weight(item: Dict[str, Any]) -> float:
+    """參數項的權重（缺省為 1），不是非負數時返回 -1 由選擇策略報錯"""
+    weight = item.get(WEIGHT_KEY, 1)
+    if not isinstance(weight, (int, float)) or weight < 0:
+        return -1.0
+    return weight
+
+
+def _index_json(mm: mmap.mmap) -> Tuple[array, array]:
+    """JSON文件：按塊增量解碼，逐項 raw_decode 找出頂層數組中每個對象的字節範圍和權重
+
+    不把整個文件讀入內存，也不保留解析出的對象。
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8-sig')()
+    offsets = array('Q')
+    weights = array('d')
+    size = len(mm)
+    read_pos = 0
+    buf = ''
+    # buf 中已換算為文件字節偏移的位置
+    cursor_char = 0
+    cursor_byte = 0
+    bom = 3 if mm[:3] == codecs.BOM_UTF8 else 0
+
+    def refill(keep_from: int) -> bool:
+        """丟棄 keep_from 之前已處理的文本並讀入下一塊，文件已讀完時返回 False"""
+        nonlocal buf, read_pos, cursor_char
+        if read_pos >= size:
+            return False
+        byte_at(keep_from)
+        buf = buf[keep_from:]
+        cursor_char = 0
+        chunk = mm[read_pos:read_pos + JSON_CHUNK_BYTES]
+        read_pos += len(chunk)
+        buf += utf8.decode(chunk, final=read_pos >= size)
+        return True
+
+    def byte_at(char_index: int) -> int:
+        """buf 中字符位置對應的文件字節偏移（只向前推進）"""
+        nonlocal cursor_char, cursor_byte
+        if char_index > cursor_char:
+            cursor_byte += len(buf[cursor_char:char_index].encode('utf-8'))
+            cursor_char = char_index
+        return cursor_byte
+
+    def next_token(i: int) -> Tuple[int, str]:
+        """跳過空白，返回下一個字符及其位置；文件結束時返回空字符"""
+        while True:
+            while i < len(buf) and buf[i] in _WHITESPACE:
+                i += 1
+            if i < len(buf):
+                return i, buf[i]
+            if not refill(i):
+                return 0, ''
+            i = 0
+
+    refill(0)
+    cursor_byte = bom
+    i, token = next_token(0)
+    if token != '[':
+        raise ValueError("參數文件必須包含參數列表")
+    i, token = next_token(i + 1)
+    if token == ']':
+        return offsets, weights
+    while True:
+        if not token:
+            raise ValueError("參數文件格式錯誤，必須是有效的JSON格式")
+        if token != '{':
+            raise ValueError("參數文件中的每一項必須是JSON對象")
+        while True:
+            try:
+                item, end = decoder.raw_decode(buf, i)
+                break
+            except json.JSONDecodeError:
+                # 對象可能跨越塊邊界，讀入下一塊後重試
+                keep = i
+                if not refill(keep):
+                    raise ValueError("參數文件格式錯誤，必須是有效的JSON格式")
+                i = 0
+        offsets.append(byte_at(i))
+        offsets.append(byte_at(end))
+        weights.append(_item_weight(item))
+        i, token = next_token(end)
+        if token == ']':
+            return offsets, weights
+        if token != ',':
+            raise ValueError("參數文件格式錯誤，必須是有效的JSON格式")
+        i, token = next_token(i + 1)
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import asyncio
+import dataclasses
+import hashlib
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+from config import Config
+from load_profile import LoadProfile
+from classifier import ResponseClassifier
+from corpus import Corpus
+from multiproc import split_config
+from result_sink import MultiSink, create_sink, sink_path
+
+DEFAULT_AGENT_PORT = 8765
+TOKEN_HEADER = 'X-WAF-Tester-Token'
+# 參數文件不超過此大小時內嵌在請求中；更大的文件須在代理機器的相同路徑上存在
+MAX_INLINE_PARAMS_BYTES = 16 * 1024 ** 2
+
+
+def _file_sha256(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+def config_to_dict(config: Config) -> Dict[str, Any]:
+    """將配置序列化為字典，Headers直接內嵌；小的參數文件內嵌為列表，大的只傳路徑和內容哈希"""
+    data = {f.name: getattr(config, f.name) for f in dataclasses.fields(config)
+            if not f.name.startswith('_') and not f.name.endswith('_file')}
+    params = config._params
+    if isinstance(params, Corpus) and os.path.getsize(params.path) > MAX_INLINE_PARAMS_BYTES:
+        # 不把整個語料讀入請求體，代理自行映射同一份文件
+        data['params_file'] = os.path.abspath(params.path)
+        data['params_sha256'] = _file_sha256(params.path)
+    else:
+        data['params'] = list(params) if params else []
+    data['headers'] = config._headers
+    data['profile'] = config._profile.to_dict() if config._profile else None
+    data['signatures'] = config._classifier.to_dict() if config._classifier else None
+    return data
+
+
+def config_from_dict(data: Dict[str, Any]) -> Config:
+    """由 config_to_dict 的結果還原配置"""
+    data = dict(data)
+    params = data.pop('params', None) or []
+    params_file = data.pop('params_file', None)
+    params_sha256 = data.pop('params_sha256', None)
+    headers = data.pop('headers', None) or {}
+    profile = data.pop('profile', None)
+    signatures = data.pop('signatures', None)
+    config = Config(**data)
+    if params_file:
+        if not os.path.isfile(params_file):
+            raise ValueError(f"參數文件超過 {MAX_INLINE_PARAMS_BYTES // 1024 ** 2}MB，"
+                             f"須在代理機器的相同路徑上存在：{params_file}")
+        if _file_sha256(params_file) != params_sha256:
+            raise ValueError(f"代理機器上的參數文件內容與控制器不一致：{params_file}")
+        params = Corpus(params_file, config.params_index_cache)
+    config._params = params
+    config._headers = headers
+    if profile:
+        config._profile = LoadProfile.from_dict(profile)
+    if signatures:
+        config._classifier = ResponseClassifier.from_dict(signatures)
+    config.compile_templates()
+    return config
+
+
+class Agent:
+    """代理：監聽控制器下發的測試，在約定的開始時間運行並返回統計數據"""
+
+    def __init__(self, token: Optional[str] = None, port: int = DEFAULT_AGENT_PORT):
+        self.token = token
+        self.port = port
+        self._lock = asyncio.Lock()
+
+    def _authorized(self, request: web.Request) -> bool:
+        return not self.token or request.headers.get(TOKEN_HEADER) == self.token
+
+    async def handle_status(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            return web.json_response({'error': 'unauthorized'}, status=401)
+        return web.json_response({'time': time.time(), 'busy': self._lock.locked()})
+
+    async def handle_run(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            return web.json_response({'error': 'unauthorized'}, status=401)
+        if self._lock.locked():
+            return web.json_response({'error': '代理正在執行其他測試'}, status=409)
+        async with self._lock:
+            body = await request.json()
+            try:
+                config = config_from_dict(body['config'])
+            except (KeyError, TypeError, ValueError) as e:
+                return web.json_response({'error': str(e)}, status=400)
+
+            # 等待到共同的開始時間
+            delay = body.get('start_at', 0) - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            from waf_tester import WAFTester
+            # 詳細結果按代理端口分開保存，同一台機器上的多個代理不會互相覆蓋
+            fmt = config.output_format
+            tester = WAFTester(config, create_sink(fmt, sink_path(fmt, f'agent{self.port}')))
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, tester.run)
+            except Exception as e:
+                return web.json_response({'error': str(e)}, status=500)
+            return web.json_response(tester.export_stats())
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=256 * 1024 ** 2)
+        app.router.add_get('/status', self.handle_status)
+        app.router.add_post('/run', self.handle_run)
+        return app
+
+
+def run_agent(host: str = '127.0.0.1', port: int = DEFAULT_AGENT_PORT, token: Optional[str] = None):
+    """啟動代理並一直運行"""
+    web.run_app(Agent(token, port).make_app(), host=host, port=port, print=None)
+
+
+def parse_agents(agents: str) -> List[str]:
+    """解析 host:port 列表，返回代理的基礎URL"""
+    urls = []
+    for item in agents.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if not item.startswith(('http://', 'https://')):
+            if ':' not in item:
+                item = f'{item}:{DEFAULT_AGENT_PORT}'
+            item = f'http://{item}'
+        urls.append(item.rstrip('/'))
+    if not urls:
+        raise ValueError("代理列表不能為空")
+    return urls
+
+
+def split_for_agents(config: Config, count: int) -> List[Config]:
+    """按代理拆分並發線程數和速率，每個代理內部仍可使用多進程"""
+    if count > config.threads:
+        raise ValueError("代理數量不能超過並發線程數")
+    if config.replay_file:
+        raise ValueError("訪問日誌回放不支持代理模式（日誌文件只在本機）")
+    if 0 < config.rate_limit < count:
+        raise ValueError("請求速率限制不能小於代理數量")
+    if config._profile and any((stage.threads or count) < count or (stage.rate or count) < count
+                               for stage in config._profile.stages):
+        raise ValueError("每個負載階段的並發數和速率不能小於代理數量")
+    configs = split_config(config, count)
+    for child in configs:
+        limit = child.threads if child.rate_limit == 0 else min(child.threads, child.rate_limit)
+        child.processes = min(config.processes, limit)
+    return configs
+
+
+async def _clock_offset(session: aiohttp.ClientSession, url: str, headers: Dict[str, str]) -> float:
+    """估算代理時鐘相對本機的偏移（秒）"""
+    sent = time.time()
+    async with session.get(f'{url}/status', headers=headers) as resp:
+        if resp.status != 200:
+            raise RuntimeError(f"代理 {url} 不可用：HTTP {resp.status}")
+        data = await resp.json()
+    received = time.time()
+    if data.get('busy'):
+        raise RuntimeError(f"代理 {url} 正在執行其他測試")
+    return data['time'] - (sent + received) / 2
+
+
+async def _run_controller(tester, agents: List[str], token: Optional[str], start_delay: float,
+                          progress_callback=None) -> List[Dict[str, Any]]:
+    headers = {TOKEN_HEADER: token} if token else {}
+    configs = split_for_agents(tester.config, len(agents))
+    timeout = aiohttp.ClientTimeout(total=start_delay + tester.config.duration + 300)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        offsets = await asyncio.gather(*(_clock_offset(session, url, headers) for url in agents))
+        start_at = time.time() + start_delay
+
+        async def run_one(url: str, config: Config, offset: float) -> Dict[str, Any]:
+            payload = {'config': config_to_dict(config), 'start_at': start_at + offset}
+            async with session.post(f'{url}/run', json=payload, headers=headers) as resp:
+                # 錯誤響應不一定是JSON（例如反向代理返回的HTML頁面），先檢查狀態碼
+                if resp.status != 200:
+                    raise RuntimeError(f"代理 {url} 拒絕：HTTP {resp.status} {await resp.text()}")
+                return await resp.json()
+
+        runs = asyncio.gather(*(run_one(url, config, offset)
+                                for url, config, offset in zip(agents, configs, offsets)))
+        while not runs.done():
+            if progress_callback:
+                progress_callback()
+            await asyncio.sleep(0.1)
+        return runs.result()
+
+
+def run_controller(tester, agents: List[str], token: Optional[str] = None, start_delay: float = 3.0,
+                   progress_callback=None):
+    """控制器：把配置推送給各代理，約定共同開始時間，並把返回的統計合併到 tester"""
+    tester.start_time = time.time() + start_delay
+    payloads = asyncio.run(_run_controller(tester, agents, token, start_delay, progress_callback))
+    tester.end_time = time.time()
+    for payload in payloads:
+        tester.merge_stats(payload)
+    # 詳細結果保存在各代理機器上，本地只保留合併後的統計
+    tester.results = MultiSink([])
+    tester.results.count = tester.stats.total
+    return tester.results
@@ -16,14 +16,16 @@ https://opensource.org/licenses/MIT
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from rich.console import Console
-import threading
-import queue
-from waf_tester import WAFTester
 from config import Config
-import time
+from gui_engine import EngineProcess
+from live_chart import LiveChart
+from capacity import HIGH_CONCURRENCY_MAX_RATE, HIGH_CONCURRENCY_MAX_THREADS, MAX_RATE, MAX_THREADS
 import os
 import json
 
+# 界面輪詢測試引擎進程的間隔(毫秒)，即進度和圖表的刷新幀率
+FRAME_INTERVAL_MS = 100
+
 # 免責聲明文本
 DISCLAIMER_TEXT = {
     'zh_TW': """
@@ -98,7 +100,18 @@ TRANSLATIONS = {
         'disclaimer_title': "免責聲明",
         'must_agree': "您必須同意免責聲明才能使用本工具",
         'basic_settings': "基本設置",
-        'custom_request': "自定義請求內容"
+        'custom_request': "自定義請求內容",
+        'pool_settings': "連接池設置",
+        'conn_limit': "連接數上限:",
+        'conn_limit_per_host': "每主機連接上限:",
+        'keepalive_timeout': "Keep-Alive超時(秒):",
+        'dns_cache_ttl': "DNS緩存時間(秒):",
+        'force_close': "每個請求使用新連接",
+        'high_concurrency': "高並發模式（並發數和速率上限提高到10萬和100萬）",
+        'live_stats': "吞吐量 {rps:.0f}/s   p99 {p99:.1f}ms   403 {blocked:.1f}%   錯誤 {errors:.1f}%",
+        'draining': "收尾中：{count} 個請求仍在進行",
+        'chart_rps': "吞吐量 (req/s)",
+        'chart_p99': "p99 延遲 (ms)"
     },
     'en_US': {
         'title': "WAF Testing Tool",
@@ -126,7 +139,18 @@ TRANSLATIONS = {
         'disclaimer_title': "Disclaimer",
         'must_agree': "You must agree to the disclaimer to use this tool",
         'basic_settings': "Basic Settings",
-        'custom_request': "Custom Request Content"
+        'custom_request': "Custom Request Content",
+        'pool_settings': "Connection Pool",
+        'conn_limit': "Connection Limit:",
+        'conn_limit_per_host': "Per-host Limit:",
+        'keepalive_timeout': "Keep-Alive (sec):",
+        'dns_cache_ttl': "DNS Cache TTL (sec):",
+        'force_close': "New connection per request",
+        'high_concurrency': "High-concurrency mode (caps raised to 100k users and 1M req/s)",
+        'live_stats': "Throughput {rps:.0f}/s   p99 {p99:.1f}ms   403 {blocked:.1f}%   Errors {errors:.1f}%",
+        'draining': "Finishing: {count} requests still in flight",
+        'chart_rps': "Throughput (req/s)",
+        'chart_p99': "p99 latency (ms)"
     }
 }
 
@@ -136,7 +160,7 @@ class WAFTesterGUI:
         self.root = root
         self.current_lang = 'zh_TW'  # 默認使用中文
         self.root.title(TRANSLATIONS[self.current_lang]['title'])
-        self.root.geometry("600x550")
+        self.root.geometry("600x900")
 
         # 設置最小視窗尺寸
         self.root.minsize(500, 450)
@@ -146,6 +170,10 @@ class WAFTesterGUI:
         self.root.grid_columnconfigure(0, weight=1)
 
         self.console = Console()
+        # 測試引擎進程及界面輪詢狀態
+        self.engine = None
+        self.live_second = None
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
         # 創建菜單欄
         self.menubar = tk.Menu(self.root)
@@ -231,6 +259,10 @@ class WAFTesterGUI:
                         elif current_text in [TRANSLATIONS['zh_TW']['custom_request'], TRANSLATIONS['en_US']['custom_request']]:
                             child.config(
                                 text=TRANSLATIONS[self.current_lang]['custom_request'])
+                        # 連接池設置
+                        elif current_text in [TRANSLATIONS['zh_TW']['pool_settings'], TRANSLATIONS['en_US']['pool_settings']]:
+                            child.config(
+                                text=TRANSLATIONS[self.current_lang]['pool_settings'])
                         # 測試進度
                         elif current_text in [TRANSLATIONS['zh_TW']['progress'], TRANSLATIONS['en_US']['progress']]:
                             child.config(
@@ -266,6 +298,12 @@ class WAFTesterGUI:
                                 elif current_text in [TRANSLATIONS['zh_TW']['headers_file'], TRANSLATIONS['en_US']['headers_file']]:
                                     subchild.config(
                                         text=TRANSLATIONS[self.current_lang]['headers_file'])
+                                # 連接池設置
+                                else:
+                                    for key in ('conn_limit', 'conn_limit_per_host', 'keepalive_timeout', 'dns_cache_ttl'):
+                                        if current_text in [TRANSLATIONS['zh_TW'][key], TRANSLATIONS['en_US'][key]]:
+                                            subchild.config(
+                                                text=TRANSLATIONS[self.current_lang][key])
 
                             # 更新瀏覽按鈕文字
                             if isinstance(subchild, ttk.Button) and subchild != self.lang_button:
@@ -274,6 +312,18 @@ class WAFTesterGUI:
                                     subchild.config(
                                         text=TRANSLATIONS[self.current_lang]['browse'])
 
+        # 更新連接池選項文字
+        self.force_close_check.config(
+            text=TRANSLATIONS[self.current_lang]['force_close'])
+        self.high_concurrency_check.config(
+            text=TRANSLATIONS[self.current_lang]['high_concurrency'])
+
+        # 更新實時圖表標題
+        self.rps_chart.set_title(TRANSLATIONS[self.current_lang]['chart_rps'])
+        self.p99_chart.set_title(TRANSLATIONS[self.current_lang]['chart_p99'])
+        self.rps_chart.draw()
+        self.p99_chart.draw()
+
         # 更新開始按鈕文字
         self.start_button.config(
             text=TRANSLATIONS[self.current_lang]['start_test'])
@@ -293,11 +343,51 @@ class WAFTesterGUI:
             self.status_label.config(
                 text=TRANSLATIONS[self.current_lang]['test_failed'])
 
-    def update_progress(self, current_time, total_time):
+    def update_progress(self, current_time, total_time, snapshot=None):
         progress = (current_time / total_time) * 100
         self.progress_var.set(progress)
         self.progress_label.config(text=f"{progress:.1f}%")
-        self.root.update_idletasks()
+        if snapshot and snapshot['total']:
+            self.live_label.config(text=TRANSLATIONS[self.current_lang]['live_stats'].format(
+                rps=snapshot['rps'], p99=snapshot['p99'],
+                blocked=snapshot['blocked_rate'] * 100, errors=snapshot['error_rate'] * 100))
+        if snapshot and current_time >= total_time and snapshot['in_flight']:
+            # 已到持續時間，寬限期內等待進行中的請求
+            self.live_label.config(text=TRANSLATIONS[self.current_lang]['draining'].format(
+                count=snapshot['in_flight']))
+
+    def add_chart_point(self, snapshot):
+        """每個經過的秒向圖表添加一個點（快照中的吞吐量和延遲是最近一個完整秒的值）"""
+        second = int(snapshot['time'])
+        if not snapshot['total'] or second == self.live_second:
+            return
+        self.live_second = second
+        self.rps_chart.add(second, snapshot['rps'])
+        self.p99_chart.add(second, snapshot['p99'])
+
+    def poll_engine(self):
+        """按固定幀率取出引擎進程的快照批次，只用每幀最新的快照更新進度"""
+        if self.engine is None:
+            return
+        latest = None
+        for kind, data in self.engine.poll():
+            if kind == 'progress':
+                for snapshot in data:
+                    self.add_chart_point(snapshot)
+                latest = data[-1] if data else latest
+            elif kind == 'done':
+                self.engine = None
+                self.test_completed()
+                return
+            else:
+                self.engine = None
+                self.test_failed(data)
+                return
+        if latest is not None:
+            self.update_progress(latest['time'], self.test_duration, latest)
+        self.rps_chart.draw()
+        self.p99_chart.draw()
+        self.root.after(FRAME_INTERVAL_MS, self.poll_engine)
 
     def validate_inputs(self):
         """驗證所有輸入"""
@@ -310,15 +400,19 @@ class WAFTesterGUI:
             raise ValueError("URL必須以http://或https://開頭" if self.current_lang ==
                              'zh_TW' else "URL must start with http:// or https://")
 
+        high_concurrency = self.high_concurrency_var.get()
+        max_threads = HIGH_CONCURRENCY_MAX_THREADS if high_concurrency else MAX_THREADS
+        max_rate = HIGH_CONCURRENCY_MAX_RATE if high_concurrency else MAX_RATE
+
         # 驗證線程數
         try:
             threads = int(self.threads_var.get())
             if threads < 1:
                 raise ValueError("並發線程數必須大於0" if self.current_lang ==
                                  'zh_TW' else "Thread count must be greater than 0")
-            if threads > 100:
-                raise ValueError("並發線程數不能超過100" if self.current_lang ==
-                                 'zh_TW' else "Thread count cannot exceed 100")
+            if threads > max_threads:
+                raise ValueError(f"並發線程數不能超過{max_threads}" if self.current_lang ==
+                                 'zh_TW' else f"Thread count cannot exceed {max_threads}")
         except ValueError:
             raise ValueError("並發線程數必須是有效的整數" if self.current_lang ==
                              'zh_TW' else "Thread count must be a valid integer")
@@ -342,9 +436,9 @@ class WAFTesterGUI:
             if rate_limit < 0:
                 raise ValueError("請求速率限制不能為負數" if self.current_lang ==
                                  'zh_TW' else "Request rate limit cannot be negative")
-            if rate_limit > 1000:
-                raise ValueError("請求速率限制不能超過1000次/秒" if self.current_lang ==
-                                 'zh_TW' else "Request rate limit cannot exceed 1000 requests/second")
+            if rate_limit > max_rate:
+                raise ValueError(f"請求速率限制不能超過{max_rate}次/秒" if self.current_lang ==
+                                 'zh_TW' else f"Request rate limit cannot exceed {max_rate} requests/second")
         except ValueError:
             raise ValueError("請求速率限制必須是有效的整數" if self.current_lang ==
                              'zh_TW' else "Request rate limit must be a valid integer")
@@ -368,13 +462,33 @@ class WAFTesterGUI:
                 raise ValueError("Headers文件必須是.json格式" if self.current_lang ==
                                  'zh_TW' else "Headers file must be in .json format")
 
-        return url, threads, duration, rate_limit, params_file, headers_file
+        # 驗證連接池設置
+        pool_fields = (
+            ('conn_limit', self.conn_limit_var, int, "連接數上限", "Connection limit"),
+            ('conn_limit_per_host', self.conn_limit_per_host_var, int, "每主機連接上限", "Per-host limit"),
+            ('keepalive_timeout', self.keepalive_var, float, "Keep-Alive超時", "Keep-alive timeout"),
+            ('dns_cache_ttl', self.dns_ttl_var, int, "DNS緩存時間", "DNS cache TTL"),
+        )
+        pool_options = {}
+        for key, var, cast, name_zh, name_en in pool_fields:
+            try:
+                value = cast(var.get())
+            except ValueError:
+                value = -1
+            if value < 0:
+                raise ValueError(f"{name_zh}必須是非負數" if self.current_lang ==
+                                 'zh_TW' else f"{name_en} must be a non-negative number")
+            pool_options[key] = value
+        pool_options['force_close'] = self.force_close_var.get()
+        pool_options['high_concurrency'] = high_concurrency
+
+        return url, threads, duration, rate_limit, params_file, headers_file, pool_options
 
     def start_test(self):
         """開始測試"""
         try:
             # 驗證輸入
-            url, threads, duration, rate_limit, params_file, headers_file = self.validate_inputs()
+            url, threads, duration, rate_limit, params_file, headers_file, pool_options = self.validate_inputs()
 
             # 禁用開始按鈕
             self.start_button.state(['disabled'])
@@ -392,30 +506,18 @@ class WAFTesterGUI:
                 duration=duration,
                 rate_limit=rate_limit,
                 params_file=params_file or None,
-                headers_file=headers_file or None
+                headers_file=headers_file or None,
+                **pool_options
             )
 
-            # 在新線程中運行測試
-            def run_test():
-                try:
-                    tester = WAFTester(config)
-                    # 設置當前語言
-                    tester.set_language(self.current_lang)
-                    start_time = time.time()
-
-                    def progress_callback():
-                        current_time = min(time.time() - start_time, duration)
-                        self.root.after(0, lambda: self.update_progress(
-                            current_time, duration))
-                        return current_time >= duration
-
-                    results = tester.run(progress_callback)
-                    tester.generate_report(results)
-                    self.root.after(0, lambda: self.test_completed())
-                except Exception as e:
-                    self.root.after(0, lambda: self.test_failed(str(e)))
-
-            threading.Thread(target=run_test, daemon=True).start()
+            # 在獨立進程中運行測試，界面按固定幀率輪詢進度
+            self.test_duration = config.duration
+            self.live_second = None
+            self.rps_chart.clear()
+            self.p99_chart.clear()
+            self.engine = EngineProcess(config, self.current_lang)
+            self.engine.start()
+            self.root.after(FRAME_INTERVAL_MS, self.poll_engine)
 
         except ValueError as e:
             messagebox.showerror(
@@ -433,6 +535,14 @@ class WAFTesterGUI:
             text=TRANSLATIONS[self.current_lang]['ready'], anchor="center")
         self.progress_var.set(0)
         self.progress_label.config(text="0%")
+        self.live_label.config(text="")
+
+    def on_close(self):
+        """關閉窗口時結束仍在運行的測試引擎進程"""
+        if self.engine is not None:
+            self.engine.stop()
+            self.engine = None
+        self.root.destroy()
 
     def test_completed(self):
         """測試完成處理"""
@@ -616,10 +726,59 @@ class WAFTesterGUI:
         ttk.Button(custom_frame, text=TRANSLATIONS[self.current_lang]['browse'], width=8,
                    command=lambda: self.browse_file(self.headers_var)).grid(row=1, column=2)
 
+        # 連接池設置框架
+        pool_frame = ttk.LabelFrame(
+            main_frame, text=TRANSLATIONS[self.current_lang]['pool_settings'], padding="10")
+        pool_frame.grid(row=3, column=0, columnspan=3,
+                        sticky=(tk.W, tk.E), pady=(0, 20))
+        pool_frame.grid_columnconfigure(1, weight=1)
+        pool_frame.grid_columnconfigure(3, weight=1)
+
+        # 連接數上限
+        ttk.Label(pool_frame, text=TRANSLATIONS[self.current_lang]['conn_limit'], width=15).grid(
+            row=0, column=0, sticky=tk.W, pady=5)
+        self.conn_limit_var = tk.StringVar(value="100")
+        ttk.Entry(pool_frame, textvariable=self.conn_limit_var, width=10).grid(
+            row=0, column=1, sticky=tk.W, padx=(10, 0), pady=5)
+
+        # 每主機連接上限
+        ttk.Label(pool_frame, text=TRANSLATIONS[self.current_lang]['conn_limit_per_host'], width=15).grid(
+            row=0, column=2, sticky=tk.W, pady=5)
+        self.conn_limit_per_host_var = tk.StringVar(value="0")
+        ttk.Entry(pool_frame, textvariable=self.conn_limit_per_host_var, width=10).grid(
+            row=0, column=3, sticky=tk.W, padx=(10, 0), pady=5)
+
+        # Keep-Alive超時
+        ttk.Label(pool_frame, text=TRANSLATIONS[self.current_lang]['keepalive_timeout'], width=15).grid(
+            row=1, column=0, sticky=tk.W, pady=5)
+        self.keepalive_var = tk.StringVar(value="15")
+        ttk.Entry(pool_frame, textvariable=self.keepalive_var, width=10).grid(
+            row=1, column=1, sticky=tk.W, padx=(10, 0), pady=5)
+
+        # DNS緩存時間
+        ttk.Label(pool_frame, text=TRANSLATIONS[self.current_lang]['dns_cache_ttl'], width=15).grid(
+            row=1, column=2, sticky=tk.W, pady=5)
+        self.dns_ttl_var = tk.StringVar(value="10")
+        ttk.Entry(pool_frame, textvariable=self.dns_ttl_var, width=10).grid(
+            row=1, column=3, sticky=tk.W, padx=(10, 0), pady=5)
+
+        # 每個請求使用新連接
+        self.force_close_var = tk.BooleanVar(value=False)
+        self.force_close_check = ttk.Checkbutton(
+            pool_frame, text=TRANSLATIONS[self.current_lang]['force_close'], variable=self.force_close_var)
+        self.force_close_check.grid(row=2, column=0, columnspan=2, sticky=tk.W, pady=5)
+
+        # 高並發模式
+        self.high_concurrency_var = tk.BooleanVar(value=False)
+        self.high_concurrency_check = ttk.Checkbutton(
+            pool_frame, text=TRANSLATIONS[self.current_lang]['high_concurrency'],
+            variable=self.high_concurrency_var)
+        self.high_concurrency_check.grid(row=2, column=2, columnspan=2, sticky=tk.W, pady=5)
+
         # 進度框架
         progress_frame = ttk.LabelFrame(
             main_frame, text=TRANSLATIONS[self.current_lang]['progress'], padding="10")
-        progress_frame.grid(row=3, column=0, columnspan=3,
+        progress_frame.grid(row=4, column=0, columnspan=3,
                             sticky=(tk.W, tk.E), pady=(0, 20))
         progress_frame.grid_columnconfigure(0, weight=1)
 
@@ -634,12 +793,28 @@ class WAFTesterGUI:
         self.progress_label = ttk.Label(progress_frame, text="0%", width=6)
         self.progress_label.grid(row=0, column=1)
 
+        # 最近一秒的吞吐量和延遲
+        self.live_label = ttk.Label(progress_frame, text="")
+        self.live_label.grid(row=1, column=0, columnspan=2, sticky=tk.W, padx=5)
+
+        # 實時吞吐量和 p99 延遲圖表
+        chart_frame = ttk.Frame(progress_frame)
+        chart_frame.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(5, 0))
+        chart_frame.grid_columnconfigure(0, weight=1)
+        chart_frame.grid_columnconfigure(1, weight=1)
+        rps_canvas = tk.Canvas(chart_frame, height=110, background='white', highlightthickness=0)
+        rps_canvas.grid(row=0, column=0, sticky=(tk.W, tk.E), padx=(5, 5))
+        p99_canvas = tk.Canvas(chart_frame, height=110, background='white', highlightthickness=0)
+        p99_canvas.grid(row=0, column=1, sticky=(tk.W, tk.E), padx=(5, 5))
+        self.rps_chart = LiveChart(rps_canvas, TRANSLATIONS[self.current_lang]['chart_rps'])
+        self.p99_chart = LiveChart(p99_canvas, TRANSLATIONS[self.current_lang]['chart_p99'], color='#d62728')
+
         # 開始按鈕 (使用自定義樣式)
         style = ttk.Style()
         style.configure('Large.TButton', padding=(20, 10))  # 創建大按鈕樣式
 
         button_frame = ttk.Frame(main_frame)
-        button_frame.grid(row=4, column=0, columnspan=3,
+        button_frame.grid(row=5, column=0, columnspan=3,
                           sticky=(tk.W, tk.E), pady=(0, 10))
         button_frame.grid_columnconfigure(0, weight=1)
 
@@ -649,7 +824,7 @@ class WAFTesterGUI:
 
         # 狀態標籤框架
         status_frame = ttk.Frame(main_frame)
-        status_frame.grid(row=5, column=0, columnspan=3, sticky=(tk.W, tk.E))
+        status_frame.grid(row=6, column=0, columnspan=3, sticky=(tk.W, tk.E))
         status_frame.grid_columnconfigure(0, weight=1)
 
         # 狀態標籤（置中）
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import multiprocessing
+import queue
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config
+
+# 子進程累積快照後批量發送的間隔(秒)
+SNAPSHOT_BATCH_INTERVAL = 0.25
+# 每次輪詢最多取出的消息數，避免積壓時阻塞界面
+MAX_MESSAGES_PER_POLL = 64
+
+
+def _run_engine(config: Config, lang: str, updates):
+    """子進程入口：運行測試並生成報告，進度以快照批次發送給界面進程
+
+    消息格式為 (類型, 數據)：('progress', [快照, ...])、('done', None) 或 ('error', 錯誤信息)。
+    """
+    try:
+        from waf_tester import WAFTester
+
+        tester = WAFTester(config)
+        tester.set_language(lang)
+        duration = config.duration
+        start_time = time.time()
+        batch: List[Dict[str, Any]] = []
+        last_flush = start_time
+
+        def progress_callback():
+            nonlocal last_flush
+            now = time.time()
+            snapshot = tester.snapshot()
+            snapshot['time'] = min(now - start_time, duration)
+            batch.append(snapshot)
+            finished = snapshot['time'] >= duration and not snapshot['in_flight']
+            if finished or now - last_flush >= SNAPSHOT_BATCH_INTERVAL:
+                updates.put(('progress', batch[:]))
+                batch.clear()
+                last_flush = now
+            return finished
+
+        results = tester.run(progress_callback)
+        if batch:
+            updates.put(('progress', batch[:]))
+        tester.generate_report(results)
+        updates.put(('done', None))
+    except Exception as e:
+        updates.put(('error', str(e)))
+
+
+class EngineProcess:
+    """在獨立進程中運行測試引擎，界面進程按固定幀率輪詢進度
+
+    測試和界面不再共享 GIL：負載循環不受界面重繪影響，界面也不會因負載循環而卡頓。
+    引擎進程不是守護進程，因為多進程模式下它還要啟動自己的子進程。
+    """
+
+    def __init__(self, config: Config, lang: str):
+        # 與多進程模式相同使用 spawn，子進程不繼承 Tk 的狀態
+        ctx = multiprocessing.get_context('spawn')
+        self.updates = ctx.Queue()
+        self.process = ctx.Process(target=_run_engine, args=(config, lang, self.updates))
+        self.finished = False
+
+    def start(self):
+        self.process.start()
+
+    def poll(self) -> List[Tuple[str, Any]]:
+        """取出已到達的消息；引擎進程異常退出而沒有發送結果時返回 ('error', ...)"""
+        messages = []
+        while len(messages) < MAX_MESSAGES_PER_POLL:
+            try:
+                message = self.updates.get_nowait()
+            except queue.Empty:
+                break
+            messages.append(message)
+            if message[0] in ('done', 'error'):
+                self.finished = True
+                break
+        if not messages and not self.finished and not self.process.is_alive():
+            self.finished = True
+            messages.append(('error', f"exit code {self.process.exitcode}"))
+        return messages
+
+    def stop(self, timeout: Optional[float] = 1.0):
+        """結束引擎進程（關閉窗口時）"""
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout)
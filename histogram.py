@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import math
+from array import array
+from typing import Any, Dict, Iterator, Tuple
+
+
+class LatencyHistogram:
+    """HDR風格的對數分桶延遲直方圖：固定內存、可合併，記錄單位為微秒
+
+    每個2的冪區間再細分為 sub_bucket_count 個線性子桶，
+    相對誤差約為 10^-significant_figures。
+    """
+
+    def __init__(self, highest_us: int = 3_600_000_000, significant_figures: int = 2):
+        if not 1 <= significant_figures <= 5:
+            raise ValueError("有效位數必須在1到5之間")
+        self.highest_us = highest_us
+        self.significant_figures = significant_figures
+        largest_single_unit = 2 * 10 ** significant_figures
+        self._sub_bucket_half_magnitude = max(
+            int(math.ceil(math.log2(largest_single_unit))) - 1, 0)
+        self._sub_bucket_count = 1 << (self._sub_bucket_half_magnitude + 1)
+        self._sub_bucket_half = self._sub_bucket_count // 2
+        self._sub_bucket_mask = self._sub_bucket_count - 1
+        # 覆蓋 highest_us 所需的桶數
+        bucket_count = 1
+        smallest_untrackable = self._sub_bucket_count
+        while smallest_untrackable <= highest_us:
+            smallest_untrackable <<= 1
+            bucket_count += 1
+        self.counts = array('Q', bytes(8 * (bucket_count + 1) * self._sub_bucket_half))
+        self.total = 0
+        self.sum_us = 0
+        self.min_us = 0
+        self.max_us = 0
+
+    def _index(self, value: int) -> int:
+        bucket = (value | self._sub_bucket_mask).bit_length() - (self._sub_bucket_half_magnitude + 1)
+        sub_bucket = value >> bucket
+        return ((bucket + 1) << self._sub_bucket_half_magnitude) + sub_bucket - self._sub_bucket_half
+
+    def _bucket_range(self, index: int) -> Tuple[int, int]:
+        """索引對應的數值區間 [low, high]"""
+        bucket = (index >> self._sub_bucket_half_magnitude) - 1
+        sub_bucket = (index & (self._sub_bucket_half - 1)) + self._sub_bucket_half
+        if bucket < 0:
+            bucket = 0
+            sub_bucket -= self._sub_bucket_half
+        low = sub_bucket << bucket
+        return low, low + (1 << bucket) - 1
+
+    def record(self, value_us: int, count: int = 1):
+        """記錄一個延遲值（微秒）"""
+        if value_us < 0:
+            value_us = 0
+        elif value_us > self.highest_us:
+            value_us = self.highest_us
+        self.counts[self._index(value_us)] += count
+        if self.total == 0 or value_us < self.min_us:
+            self.min_us = value_us
+        if value_us > self.max_us:
+            self.max_us = value_us
+        self.total += count
+        self.sum_us += value_us * count
+
+    def record_array(self, values_us):
+        """一次記錄一組延遲值（微秒，整數數組），以 numpy 向量化計算分桶
+
+        用於由已保存的結果重建統計；numpy 只在這裡按需導入，熱路徑不需要它。
+        """
+        import numpy as np
+
+        values = np.clip(np.asarray(values_us, dtype=np.int64), 0, self.highest_us)
+        if not values.size:
+            return
+        # 對整數 v > 0，frexp 的指數即 v.bit_length()（數值小於 2^53 時精確）
+        bit_length = np.frexp((values | self._sub_bucket_mask).astype(np.float64))[1]
+        bucket = bit_length - (self._sub_bucket_half_magnitude + 1)
+        index = ((bucket + 1) << self._sub_bucket_half_magnitude) + (values >> bucket) - self._sub_bucket_half
+        counts = np.frombuffer(self.counts, dtype=np.uint64)
+        counts += np.bincount(index, minlength=len(counts)).astype(np.uint64)
+
+        low, high = int(values.min()), int(values.max())
+        if self.total == 0 or low < self.min_us:
+            self.min_us = low
+        self.max_us = max(self.max_us, high)
+        self.total += int(values.size)
+        self.sum_us += int(values.sum())
+
+    def merge(self, other: 'LatencyHistogram'):
+        """合併另一個相同配置的直方圖"""
+        if (other.highest_us, other.significant_figures) != (self.highest_us, self.significant_figures):
+            raise ValueError("只能合併相同配置的直方圖")
+        if other.total == 0:
+            return
+        counts = self.counts
+        for i, c in enumerate(other.counts):
+            if c:
+                counts[i] += c
+        if self.total == 0 or other.min_us < self.min_us:
+            self.min_us = other.min_us
+        self.max_us = max(self.max_us, other.max_us)
+        self.total += other.total
+        self.sum_us += other.sum_us
+
+    @property
+    def mean_us(self) -> float:
+        return self.sum_us / self.total if self.total else 0.0
+
+    def percentile(self, pct: float) -> int:
+        """返回百分位數（微秒），取所在桶的上界，不超過最大值"""
+        return self.percentiles((pct,))[pct]
+
+    def percentiles(self, pcts) -> Dict[float, int]:
+        """一次掃描計算多個百分位數"""
+        result = {}
+        if self.total == 0:
+            return {p: 0 for p in pcts}
+        pending = sorted(pcts)
+        targets = [max(1, int(math.ceil(p / 100.0 * self.total))) for p in pending]
+        seen = 0
+        i = 0
+        for index, count in enumerate(self.counts):
+            if not count:
+                continue
+            seen += count
+            while i < len(pending) and seen >= targets[i]:
+                result[pending[i]] = min(self._bucket_range(index)[1], self.max_us)
+                i += 1
+            if i == len(pending):
+                break
+        for p in pending[i:]:
+            result[p] = self.max_us
+        return result
+
+    def buckets(self) -> Iterator[Tuple[int, int, int]]:
+        """遍歷非空桶，返回 (下界, 上界, 計數)"""
+        for index, count in enumerate(self.counts):
+            if count:
+                low, high = self._bucket_range(index)
+                yield low, high, count
+
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化為緊湊的字典（只保存非空桶），可用JSON傳輸"""
+        return {
+            'highest_us': self.highest_us,
+            'significant_figures': self.significant_figures,
+            'total': self.total,
+            'sum_us': self.sum_us,
+            'min_us': self.min_us,
+            'max_us': self.max_us,
+            'counts': [[i, c] for i, c in enumerate(self.counts) if c],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'LatencyHistogram':
+        """由 to_dict 的結果還原直方圖"""
+        hist = cls(data['highest_us'], data['significant_figures'])
+        for index, count in data['counts']:
+            hist.counts[index] = count
+        hist.total = data['total']
+        hist.sum_us = data['sum_us']
+        hist.min_us = data['min_us']
+        hist.max_us = data['max_us']
+        return hist
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+from typing import List, Sequence, Tuple
+
+# 每個抽稀桶佔用的像素寬度
+PIXELS_PER_BUCKET = 2
+# 圖表內邊距(像素)
+PADDING = 4
+
+
+def decimate(points: Sequence[Tuple[float, float]], buckets: int) -> List[Tuple[float, float]]:
+    """把點列抽稀到最多 2 * buckets 個點：每個桶保留最小值和最大值（按原順序），峰值不會丟失"""
+    if len(points) <= 2 * buckets:
+        return list(points)
+    result = []
+    size = len(points) / buckets
+    for b in range(buckets):
+        chunk = points[int(b * size):int((b + 1) * size)]
+        if not chunk:
+            continue
+        low = min(range(len(chunk)), key=lambda i: chunk[i][1])
+        high = max(range(len(chunk)), key=lambda i: chunk[i][1])
+        for i in sorted({low, high}):
+            result.append(chunk[i])
+    return result
+
+
+class LiveChart:
+    """在 Tk Canvas 上繪製的實時折線圖，按畫布寬度抽稀，只在數據變化時重繪"""
+
+    def __init__(self, canvas, title: str, color: str = '#1f77b4'):
+        self.canvas = canvas
+        self.title = title
+        self.color = color
+        self.points: List[Tuple[float, float]] = []
+        self._dirty = True
+        # 畫布大小變化後需要按新寬度重新抽稀
+        canvas.bind('<Configure>', self._resized)
+
+    def _resized(self, event):
+        self._dirty = True
+        self.draw()
+
+    def add(self, x: float, y: float):
+        self.points.append((x, y))
+        self._dirty = True
+
+    def set_title(self, title: str):
+        self.title = title
+        self._dirty = True
+
+    def clear(self):
+        self.points = []
+        self._dirty = True
+
+    def draw(self):
+        if not self._dirty:
+            return
+        self._dirty = False
+        canvas = self.canvas
+        canvas.delete('all')
+        width = canvas.winfo_width()
+        height = canvas.winfo_height()
+        peak = max((y for _, y in self.points), default=0.0)
+        canvas.create_text(PADDING, PADDING, anchor='nw', text=f"{self.title}  max {peak:.1f}")
+        if len(self.points) < 2 or width <= 2 * PADDING or height <= 2 * PADDING:
+            return
+        points = decimate(self.points, max((width - 2 * PADDING) // PIXELS_PER_BUCKET, 1))
+        x0, x1 = points[0][0], points[-1][0]
+        span = (x1 - x0) or 1.0
+        top = peak * 1.1 or 1.0
+        coords = []
+        for x, y in points:
+            coords.append(PADDING + (x - x0) / span * (width - 2 * PADDING))
+            coords.append(height - PADDING - y / top * (height - 2 * PADDING))
+        canvas.create_line(*coords, fill=self.color, width=1)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import json
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Tuple
+
+RAMP_MODES = ('step', 'linear')
+
+# 拐點判定：吞吐量增幅低於負載目標增幅的此比例，視為吞吐量不再隨負載上升
+KNEE_GAIN_RATIO = 0.5
+# p99 延遲相對上一階段增大到此倍數視為跳升
+KNEE_P99_RATIO = 1.5
+# 403 或錯誤比例相對上一階段增加的百分點
+KNEE_RATE_JUMP = 0.05
+
+
+@dataclass
+class Stage:
+    """負載階段：持續時間內以目標並發數或目標速率運行"""
+    duration: int
+    threads: Optional[int] = None
+    rate: Optional[int] = None
+    ramp: str = 'step'
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'duration': self.duration, 'threads': self.threads, 'rate': self.rate, 'ramp': self.ramp}
+
+
+class LoadProfile:
+    """分階段負載：每個階段的目標值可以階躍切換，或由上一階段的目標線性過渡"""
+
+    def __init__(self, stages: List[Stage]):
+        if not stages:
+            raise ValueError("負載階段列表不能為空")
+        self.stages = stages
+        # 所有階段都以速率為目標時使用開環調度器，否則按並發數控制
+        self.rate_based = all(stage.rate for stage in stages)
+        if not self.rate_based and not all(stage.threads for stage in stages):
+            raise ValueError("負載階段必須全部指定並發數(threads)或全部指定速率(rate)")
+
+    @classmethod
+    def from_dict(cls, data: Any) -> 'LoadProfile':
+        """由JSON數據創建：階段列表，或包含 stages 和默認 ramp 的對象"""
+        default_ramp = 'step'
+        if isinstance(data, dict):
+            default_ramp = data.get('ramp', default_ramp)
+            data = data.get('stages')
+        if not isinstance(data, list):
+            raise ValueError("負載配置必須包含階段列表")
+        stages = []
+        for i, item in enumerate(data):
+            if not isinstance(item, dict):
+                raise ValueError(f"第{i + 1}個負載階段必須是鍵值對格式")
+            stage = Stage(duration=item.get('duration'), threads=item.get('threads'),
+                          rate=item.get('rate'), ramp=item.get('ramp', default_ramp))
+            for name in ('duration', 'threads', 'rate'):
+                value = getattr(stage, name)
+                if value is not None and (not isinstance(value, int) or value < 1):
+                    raise ValueError(f"第{i + 1}個負載階段的{name}必須是正整數")
+            if stage.duration is None:
+                raise ValueError(f"第{i + 1}個負載階段缺少duration")
+            if stage.ramp not in RAMP_MODES:
+                raise ValueError(f"第{i + 1}個負載階段的ramp必須是以下之一：{', '.join(RAMP_MODES)}")
+            stages.append(stage)
+        return cls(stages)
+
+    @classmethod
+    def load(cls, path: str) -> 'LoadProfile':
+        """從JSON文件載入"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls.from_dict(json.load(f))
+        except json.JSONDecodeError:
+            raise ValueError("負載配置文件格式錯誤，必須是有效的JSON格式")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'stages': [stage.to_dict() for stage in self.stages]}
+
+    @property
+    def duration(self) -> int:
+        return sum(stage.duration for stage in self.stages)
+
+    def max_threads(self) -> int:
+        return max((stage.threads or 0) for stage in self.stages)
+
+    def max_rate(self) -> int:
+        return max((stage.rate or 0) for stage in self.stages)
+
+    def mean_rate(self) -> float:
+        """整個負載曲線的平均目標速率（線性過渡按梯形面積計算）"""
+        previous = None
+        area = 0.0
+        for stage in self.stages:
+            start = stage.rate if stage.ramp == 'step' else (previous or 1)
+            area += (start + stage.rate) / 2 * stage.duration
+            previous = stage.rate
+        return area / self.duration
+
+    def with_targets(self, targets: List[Tuple[int, int]]) -> 'LoadProfile':
+        """以新的 (threads, rate) 目標替換各階段，用於在進程或代理間拆分負載"""
+        stages = [replace(stage, threads=threads if stage.threads else None, rate=rate if stage.rate else None)
+                  for stage, (threads, rate) in zip(self.stages, targets)]
+        return LoadProfile(stages)
+
+    def target_at(self, elapsed: float) -> Tuple[int, Optional[int], Optional[int]]:
+        """經過 elapsed 秒時所在的階段及當時的目標並發數和速率"""
+        start = 0.0
+        previous = None
+        for index, stage in enumerate(self.stages):
+            if elapsed < start + stage.duration or index == len(self.stages) - 1:
+                if stage.ramp == 'step':
+                    return index, stage.threads, stage.rate
+                # 線性過渡從上一階段的目標開始，第一個階段從最小負載開始
+                progress = min(max((elapsed - start) / stage.duration, 0.0), 1.0)
+                begin = previous or Stage(stage.duration, 1 if stage.threads else None, 1 if stage.rate else None)
+                threads = rate = None
+                if stage.threads:
+                    threads = max(1, round(begin.threads + (stage.threads - begin.threads) * progress))
+                if stage.rate:
+                    rate = max(1, round(begin.rate + (stage.rate - begin.rate) * progress))
+                return index, threads, rate
+            start += stage.duration
+            previous = stage
+        raise ValueError("負載階段列表不能為空")
+
+
+def stage_rows(profile: LoadProfile, stage_stats) -> List[Dict[str, Any]]:
+    """整理各階段的吞吐量、延遲和阻擋/錯誤比例"""
+    rows = []
+    for index, (stage, stats) in enumerate(zip(profile.stages, stage_stats)):
+        latency = stats.overall().percentiles((50, 99))
+        total = stats.total
+        rows.append({
+            'stage': index + 1,
+            'duration': stage.duration,
+            'ramp': stage.ramp,
+            'threads': stage.threads,
+            'rate': stage.rate,
+            'requests': total,
+            'throughput': total / stage.duration,
+            'p50': latency[50] / 1000,
+            'p99': latency[99] / 1000,
+            'blocked_rate': stats.blocked / total if total else 0.0,
+            'error_rate': stats.status_counts.get(-1, 0) / total if total else 0.0,
+        })
+    return rows
+
+
+def find_knee(rows: List[Dict[str, Any]]) -> Optional[int]:
+    """找出拐點：提高負載後吞吐量不再相應上升，同時 p99 延遲或 403/錯誤比例明顯跳升的第一個階段
+
+    返回該階段在 rows 中的下標，沒有拐點時返回 None。
+    """
+    for i in range(1, len(rows)):
+        prev, cur = rows[i - 1], rows[i]
+        # 只在負載目標提高的階段判斷
+        load_gain = (cur['rate'] or cur['threads']) / (prev['rate'] or prev['threads']) - 1
+        if load_gain <= 0 or not prev['throughput']:
+            continue
+        if cur['throughput'] / prev['throughput'] - 1 >= load_gain * KNEE_GAIN_RATIO:
+            continue
+        degraded = (
+            (prev['p99'] > 0 and cur['p99'] >= prev['p99'] * KNEE_P99_RATIO)
+            or cur['blocked_rate'] - prev['blocked_rate'] >= KNEE_RATE_JUMP
+            or cur['error_rate'] - prev['error_rate'] >= KNEE_RATE_JUMP
+        )
+        if degraded:
+            return i
+    return None
@@ -12,24 +12,89 @@ https://opensource.org/licenses/MIT
 嚴重的法律後果。使用本工具即表示您同意承擔所有相關風險和責任。
 """
 
+import time
+
 import click
 from rich.console import Console
-from rich.progress import Progress
+from rich.progress import Progress, TextColumn
 from waf_tester import WAFTester
 from config import Config
+from capacity import format_preflight, preflight
+from distributed import DEFAULT_AGENT_PORT, parse_agents, run_agent, run_controller
+from charts import CHART_FORMATS
+from result_sink import DEFAULT_BATCH_SIZE, SINK_FORMATS
+from replay import REPLAY_FORMATS
+from selection import SELECTION_STRATEGIES
 
 console = Console()
 
 
-@click.command()
-@click.option('--url', required=True, help='目標URL')
+@click.group(invoke_without_command=True)
+@click.option('--url', help='目標URL')
 @click.option('--threads', default=10, help='並發線程數')
 @click.option('--duration', default=10, help='測試持續時間(秒)')
-@click.option('--rate-limit', default=0, help='請求速率限制(每秒請求數，0表示無限制)')
+@click.option('--rate-limit', default=0, help='目標請求速率(所有線程合計的每秒請求數，0表示無限制)')
 @click.option('--params', help='GET參數列表文件路徑')
 @click.option('--headers', help='自定義Headers文件路徑(JSON格式)')
-def main(url: str, threads: int, duration: int, rate_limit: int, params: str, headers: str):
+@click.option('--selection', default='random', type=click.Choice(list(SELECTION_STRATEGIES)),
+              help='參數項選擇策略(random隨機，round-robin按工作協程分片輪詢，weighted按JSON項中的_weight加權（權重在建立偏移索引時讀取並隨.idx緩存），'
+                   'exhaustive每項恰好發送一次後結束)')
+@click.option('--seed', type=int, help='隨機種子，指定後random和weighted的選擇序列可重現')
+@click.option('--params-index-cache/--no-params-index-cache', default=True,
+              help='把參數文件的偏移索引緩存到文件旁(<文件名>.idx)，再次載入時不需重新掃描')
+@click.option('--output-format', default='csv', type=click.Choice(list(SINK_FORMATS)),
+              help='詳細結果輸出格式(測試過程中按批寫入磁盤，memory表示保留在內存，none表示只保留統計)')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, help='每批寫入磁盤的記錄數')
+@click.option('--processes', default=1, help='負載生成進程數(並發線程數和速率在各進程間平均分配)')
+@click.option('--high-concurrency', is_flag=True,
+              help='高並發模式：並發數和速率上限提高到10萬和100萬，按需創建請求任務並在開始前估算資源')
+@click.option('--conn-limit', default=100, help='連接池總連接數上限(0表示無限制)')
+@click.option('--conn-limit-per-host', default=0, help='每個主機的連接數上限(0表示無限制)')
+@click.option('--keepalive-timeout', default=15.0, help='空閒連接的Keep-Alive超時(秒)')
+@click.option('--dns-cache-ttl', default=10, help='DNS緩存時間(秒，0表示不緩存)')
+@click.option('--force-close/--reuse-connections', default=False,
+              help='每個請求使用新連接 / 復用連接(默認)')
+@click.option('--connect-timeout', default=10.0, help='建立連接的超時(秒，0表示不限制)')
+@click.option('--read-timeout', default=30.0, help='兩次讀取響應數據之間的超時(秒，0表示不限制)')
+@click.option('--total-timeout', default=30.0, help='單個請求的總超時(秒，0表示不限制)')
+@click.option('--grace-period', default=5.0,
+              help='到達持續時間後等待進行中請求完成的寬限期(秒)，之後取消剩餘請求並在報告中單獨統計')
+@click.option('--profile', help='分階段負載配置文件(JSON格式)，指定後由各階段決定持續時間、並發數和速率')
+@click.option('--adaptive', is_flag=True,
+              help='自適應並發：以 --threads 為上限自動調整並發數，保持 p99 延遲和錯誤率在目標之內，並報告最大可持續吞吐量')
+@click.option('--target-p99', default=500.0, help='自適應並發的目標 p99 延遲(毫秒)')
+@click.option('--max-error-rate', default=0.01, help='自適應並發允許的錯誤率(請求錯誤及5xx，0到1)')
+@click.option('--replay', help='訪問日誌回放：按日誌時間發送 nginx/Apache combined 格式或 JSONL 日誌(可為.gz)中的GET請求，'
+              '路徑和查詢串取自日誌，--threads 為進行中請求數上限，--duration 為最長時間')
+@click.option('--replay-format', default='auto', type=click.Choice(list(REPLAY_FORMATS)),
+              help='訪問日誌格式(auto按擴展名判斷：.jsonl/.ndjson/.json為JSONL，其餘為combined)')
+@click.option('--replay-speed', default=1.0, help='回放倍速(1為原始間隔，2為兩倍速，0表示不等待、以最大吞吐量發送)')
+@click.option('--signatures', help='阻擋頁特徵文件(JSON格式)，按狀態碼、響應頭和響應體前綴識別403以外的阻擋響應')
+@click.option('--metrics-port', default=0,
+              help='測試期間在此端口提供 Prometheus/OpenMetrics 指標(/metrics，0表示不啟用；多進程時每個進程依次使用後續端口)')
+@click.option('--metrics-host', default='127.0.0.1', help='指標服務監聽地址')
+@click.option('--trace-phases', is_flag=True, help='記錄每個請求的DNS、連接(含TLS)、首字節和響應體耗時')
+@click.option('--no-report', is_flag=True, help='只在終端顯示摘要，不生成報告文件和圖表')
+@click.option('--chart-format', default='png', type=click.Choice(list(CHART_FORMATS)),
+              help='圖表格式(png為300dpi點陣圖，svg為矢量圖，html把所有圖表內嵌到charts.html)')
+@click.option('--agents', help='控制器模式：代理地址列表(host:port，以逗號分隔)，負載在各代理間平均分配')
+@click.option('--agent-token', help='代理認證令牌(須與代理啟動時的 --token 相同)')
+@click.option('--start-delay', default=3.0, help='控制器模式：下發配置到共同開始的間隔(秒)')
+@click.pass_context
+def main(ctx, url: str, threads: int, duration: int, rate_limit: int, params: str, headers: str,
+         params_index_cache: bool, selection: str, seed: int,
+         output_format: str, batch_size: int, processes: int, high_concurrency: bool, conn_limit: int,
+         conn_limit_per_host: int, keepalive_timeout: float, dns_cache_ttl: int, force_close: bool,
+         connect_timeout: float, read_timeout: float, total_timeout: float, grace_period: float,
+         profile: str, adaptive: bool, target_p99: float, max_error_rate: float,
+         replay: str, replay_format: str, replay_speed: float,
+         signatures: str, metrics_port: int, metrics_host: str, trace_phases: bool, no_report: bool,
+         chart_format: str, agents: str, agent_token: str, start_delay: float):
     """WAF規則壓力測試工具"""
+    if ctx.invoked_subcommand is not None:
+        return
+    if not url:
+        raise click.UsageError("缺少選項 '--url'")
     try:
         # 載入配置
         config = Config(
@@ -38,26 +103,112 @@ def main(url: str, threads: int, duration: int, rate_limit: int, params: str, he
             duration=duration,
             rate_limit=rate_limit,
             params_file=params,
-            headers_file=headers
+            params_index_cache=params_index_cache,
+            selection=selection,
+            seed=seed,
+            headers_file=headers,
+            # 不生成報告時也不保存詳細結果
+            output_format='none' if no_report else output_format,
+            batch_size=batch_size,
+            processes=processes,
+            high_concurrency=high_concurrency,
+            conn_limit=conn_limit,
+            conn_limit_per_host=conn_limit_per_host,
+            keepalive_timeout=keepalive_timeout,
+            dns_cache_ttl=dns_cache_ttl,
+            force_close=force_close,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            total_timeout=total_timeout,
+            grace_period=grace_period,
+            profile_file=profile,
+            signatures_file=signatures,
+            adaptive=adaptive,
+            target_p99=target_p99,
+            max_error_rate=max_error_rate,
+            replay_file=replay,
+            replay_format=replay_format,
+            replay_speed=replay_speed,
+            metrics_host=metrics_host,
+            metrics_port=metrics_port,
+            trace_phases=trace_phases,
+            chart_format=chart_format
         )
+        duration = config.duration
+        if config.high_concurrency:
+            lines, warnings = format_preflight(preflight(config))
+            for line in lines:
+                console.print(f"[cyan]{line}")
+            for warning in warnings:
+                console.print(f"[yellow]{warning}")
 
         # 初始化測試器
         tester = WAFTester(config)
 
-        with Progress() as progress:
+        with Progress(*Progress.get_default_columns(), TextColumn("{task.fields[live]}")) as progress:
             # 開始測試
-            task = progress.add_task("[cyan]執行測試中...", total=duration)
-            results = tester.run(progress, task)
+            task = progress.add_task("[cyan]執行測試中...", total=duration, live='')
+            start_time = time.time() + (start_delay if agents else 0)
+
+            def finish_replay():
+                # 日誌在持續時間之前發送完畢時，以實際用時作為進度條總長並填滿
+                replay_elapsed = tester.replay_stats.elapsed if tester.replay_stats is not None else None
+                if replay_elapsed is not None:
+                    progress.update(task, total=replay_elapsed, completed=replay_elapsed)
+
+            def progress_callback():
+                elapsed = min(max(time.time() - start_time, 0), duration)
+                # 本進程發送請求時顯示最近一秒的吞吐量和延遲
+                snap = tester.snapshot()
+                live = ''
+                if snap['total']:
+                    live = (f"{snap['rps']:.0f} req/s  p99 {snap['p99']:.1f}ms  "
+                            f"403 {snap['blocked_rate'] * 100:.1f}%  err {snap['error_rate'] * 100:.1f}%")
+                    if snap['stage']:
+                        live = f"stage {snap['stage']}  " + live
+                    if snap['concurrency']:
+                        live = f"conc {snap['concurrency']}  " + live
+                    if snap['saturated']:
+                        live += "  [red]負載生成器飽和"
+                if elapsed >= duration and snap['in_flight']:
+                    live += f"  [yellow]收尾中：{snap['in_flight']} 個請求"
+                progress.update(task, completed=elapsed, live=live)
+                finish_replay()
+                # 寬限期內仍有請求進行中時繼續更新
+                return elapsed >= duration and not snap['in_flight']
+
+            if agents:
+                results = run_controller(tester, parse_agents(agents), agent_token, start_delay,
+                                         progress_callback)
+            else:
+                results = tester.run(progress_callback)
+            # 多進程回放的統計在所有子進程結束後才合併
+            finish_replay()
 
             # 生成報告
-            tester.generate_report(results)
+            if not no_report:
+                tester.generate_report(results)
 
-        console.print("[green]測試完成！請查看報告文件。")
+        if no_report:
+            console.print(tester.summary())
+            console.print("[green]測試完成！")
+        else:
+            console.print("[green]測試完成！請查看報告文件。")
 
     except Exception as e:
         console.print(f"[red]錯誤：{str(e)}")
         raise click.Abort()
 
 
+@main.command()
+@click.option('--host', default='127.0.0.1', help='監聽地址(接受遠程控制器時使用 0.0.0.0)')
+@click.option('--port', default=DEFAULT_AGENT_PORT, help='監聽端口')
+@click.option('--token', help='認證令牌，控制器須以 --agent-token 提供相同的值')
+def agent(host: str, port: int, token: str):
+    """代理模式：等待控制器下發測試配置並返回統計數據"""
+    console.print(f"[cyan]代理已啟動，監聽 {host}:{port}")
+    run_agent(host, port, token)
+
+
 if __name__ == '__main__':
     main()
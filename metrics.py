@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import asyncio
+import threading
+from typing import List, Optional
+
+from aiohttp import web
+
+from histogram import LatencyHistogram
+
+DEFAULT_METRICS_PORT = 9464
+PREFIX = 'waf_tester'
+# 延遲直方圖的上界（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _histogram_lines(name: str, labels: str, hist: LatencyHistogram) -> List[str]:
+    """把延遲直方圖折算為累計的 le 分桶"""
+    cumulative = [0] * len(LATENCY_BUCKETS)
+    for _, high, count in hist.buckets():
+        seconds = high / 1e6
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                cumulative[i] += count
+                break
+    lines = []
+    running = 0
+    for bound, count in zip(LATENCY_BUCKETS, cumulative):
+        running += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {running}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.total}')
+    lines.append(f'{name}_sum{{{labels}}} {_format(hist.sum_us / 1e6)}')
+    lines.append(f'{name}_count{{{labels}}} {hist.total}')
+    return lines
+
+
+def render_metrics(tester, openmetrics: bool = False) -> str:
+    """把測試器的實時計數器渲染為 Prometheus 文本格式（或 OpenMetrics）
+
+    只讀取熱路徑上已有的計數器和直方圖，不加鎖；字典先整體複製再遍歷。
+    """
+    lines = []
+
+    def family(name: str, kind: str, help_text: str):
+        # OpenMetrics 的 counter 家族名不帶 _total 後綴
+        family_name = name[:-len('_total')] if openmetrics and kind == 'counter' else name
+        lines.append(f'# HELP {family_name} {help_text}')
+        lines.append(f'# TYPE {family_name} {kind}')
+
+    name = f'{PREFIX}_requests_total'
+    family(name, 'counter', 'Completed requests by HTTP status (-1 = transport error).')
+    for status, count in sorted(dict(tester.stats.status_counts).items()):
+        lines.append(f'{name}{{status="{status}"}} {count}')
+
+    name = f'{PREFIX}_errors_total'
+    family(name, 'counter', 'Failed requests by exception type.')
+    for error_type, count in sorted(dict(tester.error_types).items()):
+        lines.append(f'{name}{{type="{_escape(error_type)}"}} {count}')
+
+    name = f'{PREFIX}_in_flight_requests'
+    family(name, 'gauge', 'Requests sent and waiting for a response.')
+    lines.append(f'{name} {tester.in_flight}')
+
+    name = f'{PREFIX}_cancelled_requests_total'
+    family(name, 'counter', 'Requests still in flight after the grace period and cancelled.')
+    lines.append(f'{name} {tester.cancelled}')
+
+    snapshot = tester.snapshot()
+    name = f'{PREFIX}_target_rate'
+    family(name, 'gauge', 'Current target request rate per second (0 = unlimited).')
+    lines.append(f'{name} {_format(float(tester.scheduler.rate) if tester.scheduler else 0.0)}')
+    name = f'{PREFIX}_achieved_rate'
+    family(name, 'gauge', 'Requests completed in the last complete second.')
+    lines.append(f'{name} {_format(snapshot["rps"])}')
+    name = f'{PREFIX}_elapsed_seconds'
+    family(name, 'gauge', 'Seconds since the test started.')
+    lines.append(f'{name} {_format(snapshot["elapsed"])}')
+    name = f'{PREFIX}_generator_saturated'
+    family(name, 'gauge', '1 when the load generator itself was saturated in the last complete second.')
+    lines.append(f'{name} {int(snapshot["saturated"])}')
+    if snapshot['stage']:
+        name = f'{PREFIX}_stage'
+        family(name, 'gauge', 'Current load profile stage (1-based).')
+        lines.append(f'{name} {snapshot["stage"]}')
+
+    name = f'{PREFIX}_request_duration_seconds'
+    family(name, 'histogram', 'Request latency by status class, from the intended send time.')
+    for cls, hist in sorted(dict(tester.stats.histograms).items()):
+        lines.extend(_histogram_lines(name, f'class="{cls}"', hist))
+
+    if openmetrics:
+        lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """在獨立線程的事件循環中提供 /metrics，抓取不佔用發送請求的事件循環"""
+
+    def __init__(self, tester, host: str = '127.0.0.1', port: int = DEFAULT_METRICS_PORT):
+        self.tester = tester
+        self.host = host
+        self.port = port
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        openmetrics = 'application/openmetrics-text' in request.headers.get('Accept', '')
+        body = render_metrics(self.tester, openmetrics)
+        content_type = OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE
+        return web.Response(body=body.encode('utf-8'), headers={'Content-Type': content_type})
+
+    def _serve(self):
+        loop = self._loop = asyncio.new_event_loop()
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle_metrics)
+        runner = web.AppRunner(app, access_log=None)
+        try:
+            loop.run_until_complete(runner.setup())
+            loop.run_until_complete(web.TCPSite(runner, self.host, self.port).start())
+        except BaseException as e:
+            self._error = e
+            self._started.set()
+            loop.run_until_complete(runner.cleanup())
+            loop.close()
+            return
+        self._started.set()
+        try:
+            loop.run_forever()
+        finally:
+            loop.run_until_complete(runner.cleanup())
+            loop.close()
+
+    def start(self):
+        """啟動服務，端口無法監聽時拋出 ValueError"""
+        self._thread = threading.Thread(target=self._serve, name='metrics', daemon=True)
+        self._thread.start()
+        self._started.wait()
+        if self._error:
+            raise ValueError(f"無法啟動指標服務 {self.host}:{self.port}：{self._error}")
+
+    def stop(self):
+        if self._thread and self._thread.is_alive():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
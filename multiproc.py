@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import copy
+import multiprocessing
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_EXCEPTION
+from typing import Any, Dict, Iterable, List
+
+from config import Config
+from result_sink import MultiSink, create_sink, sink_path
+
+# 子進程發送實時快照的間隔(秒)
+SNAPSHOT_INTERVAL = 0.5
+
+# 子進程中由 _init_child 設置的快照隊列，父進程不需要實時進度時為 None
+_updates = None
+
+
+def _split(total: int, parts: int) -> List[int]:
+    """將整數盡量平均地分成 parts 份"""
+    base, extra = divmod(total, parts)
+    return [base + (1 if i < extra else 0) for i in range(parts)]
+
+
+def split_config(config: Config, processes: int) -> List[Config]:
+    """按進程拆分並發線程數和目標速率"""
+    configs = []
+    for threads, rate_limit in zip(_split(config.threads, processes),
+                                   _split(config.rate_limit, processes)):
+        # 直接複製已載入參數的配置，避免子進程重新讀取文件
+        child = copy.copy(config)
+        child.threads = threads
+        child.rate_limit = rate_limit
+        child.processes = 1
+        configs.append(child)
+    # 子配置各自成為一個分片：已是分片的配置（代理）再按進程細分
+    for i, child in enumerate(configs):
+        child.shard_index = config.shard_index * processes + i
+        child.shard_count = config.shard_count * processes
+    if config.metrics_port:
+        # 每個進程在各自的端口提供指標
+        for i, child in enumerate(configs):
+            child.metrics_port = config.metrics_port + i
+    if config._profile:
+        # 每個負載階段的目標同樣平均分配
+        stage_targets = [list(zip(_split(stage.threads or 0, processes), _split(stage.rate or 0, processes)))
+                         for stage in config._profile.stages]
+        for i, child in enumerate(configs):
+            child._profile = config._profile.with_targets([targets[i] for targets in stage_targets])
+    return configs
+
+
+def _init_child(updates):
+    global _updates
+    _updates = updates
+
+
+def _run_child(config: Config, index: int) -> Dict[str, Any]:
+    """子進程入口：運行測試並返回緊湊的統計數據，需要時定期發送實時快照"""
+    from waf_tester import WAFTester
+
+    fmt = config.output_format
+    tester = WAFTester(config, create_sink(fmt, sink_path(fmt, f'p{index}')))
+    progress_callback = None
+    if _updates is not None:
+        last_sent = 0.0
+
+        def progress_callback():
+            nonlocal last_sent
+            now = time.monotonic()
+            if now - last_sent >= SNAPSHOT_INTERVAL:
+                last_sent = now
+                _updates.put((index, tester.snapshot()))
+            return False
+
+    tester.run(progress_callback)
+    if _updates is not None:
+        # 最後一個快照不受發送間隔限制，父進程看到的進行中請求數歸零
+        _updates.put((index, tester.snapshot()))
+    return tester.export_stats()
+
+
+def merge_snapshots(snapshots: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """合併各子進程的實時快照：計數和吞吐量相加，比率按吞吐量加權，延遲取各進程的最大值"""
+    snapshots = list(snapshots)
+    rps = sum(snap['rps'] for snap in snapshots)
+
+    def weighted(key: str) -> float:
+        return sum(snap[key] * snap['rps'] for snap in snapshots) / rps if rps else 0.0
+
+    return {
+        'rps': rps,
+        'p50': max(snap['p50'] for snap in snapshots),
+        'p99': max(snap['p99'] for snap in snapshots),
+        'blocked_rate': weighted('blocked_rate'),
+        'error_rate': weighted('error_rate'),
+        'elapsed': max(snap['elapsed'] for snap in snapshots),
+        'total': sum(snap['total'] for snap in snapshots),
+        'stage': max((snap['stage'] or 0 for snap in snapshots), default=0) or None,
+        'saturated': any(snap['saturated'] for snap in snapshots),
+        'in_flight': sum(snap['in_flight'] for snap in snapshots),
+        'concurrency': sum(snap['concurrency'] or 0 for snap in snapshots) or None,
+    }
+
+
+def run_multiprocess(tester, progress_callback=None):
+    """在多個進程中運行測試，並把各進程的統計合併到 tester
+
+    需要實時進度時，各子進程定期把快照發送到隊列，tester.snapshot() 返回合併後的快照。
+    """
+    config = tester.config
+    configs = split_config(config, config.processes)
+    # 使用 spawn 啟動子進程，每個進程有獨立的事件循環和 aiohttp 會話
+    ctx = multiprocessing.get_context('spawn')
+    updates = ctx.Queue() if progress_callback else None
+
+    def drain_updates():
+        while True:
+            try:
+                index, snapshot = updates.get_nowait()
+            except queue.Empty:
+                return
+            tester.child_snapshots[index] = snapshot
+
+    with ProcessPoolExecutor(max_workers=len(configs), mp_context=ctx,
+                             initializer=_init_child, initargs=(updates,)) as pool:
+        futures = [pool.submit(_run_child, child, i) for i, child in enumerate(configs)]
+        pending = futures
+        while pending:
+            done, pending = wait(pending, timeout=0.1, return_when=FIRST_EXCEPTION)
+            if any(f.exception() for f in done):
+                break
+            if progress_callback:
+                drain_updates()
+                progress_callback()
+        payloads = [f.result() for f in futures]
+    # 子進程已結束，之後的快照來自合併後的統計
+    tester.child_snapshots.clear()
+
+    sinks = []
+    for payload in payloads:
+        tester.merge_stats(payload)
+        sink = create_sink(payload['output_format'], payload['path'])
+        sink.count = payload['count']
+        sinks.append(sink)
+    tester.results = MultiSink(sinks)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import time
+from array import array
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# 批次中的定長欄位及其 array 類型碼
+FIELDS = (
+    ('ts_ns', 'q'),       # 響應結束時間（monotonic 納秒）
+    ('status', 'h'),      # HTTP狀態碼，-1 表示請求錯誤
+    ('latency_ns', 'q'),  # 響應時間（納秒）
+    ('param_idx', 'i'),   # 參數列表索引，-1 表示無參數
+    ('error_idx', 'i'),   # 錯誤信息表索引，-1 表示無錯誤
+)
+
+# 參數字串表示最多緩存的數量
+PARAM_REPR_CACHE_SIZE = 65536
+
+# 不依賴參數表和錯誤表即可解碼的欄位
+NUMERIC_COLUMNS = ('status', 'response_time')
+
+
+class RecordBatch:
+    """一批請求記錄，欄位為預分配的 typed array
+
+    日誌回放時 replayed 為每條記錄的 (請求目標, User-Agent)，隨批次寫出後即釋放。
+    """
+
+    __slots__ = ('capacity', 'size', 'replayed') + tuple(name for name, _ in FIELDS)
+
+    def __init__(self, capacity: int, replay: bool = False):
+        self.capacity = capacity
+        self.size = 0
+        self.replayed: Optional[List[Tuple[str, Optional[str]]]] = [] if replay else None
+        for name, typecode in FIELDS:
+            setattr(self, name, array(typecode, bytes(array(typecode).itemsize * capacity)))
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, array]) -> 'RecordBatch':
+        """由已有欄位建立批次（用於讀回磁盤數據）"""
+        batch = cls.__new__(cls)
+        batch.size = batch.capacity = len(arrays['status'])
+        batch.replayed = arrays.get('replayed')
+        for name, _ in FIELDS:
+            setattr(batch, name, arrays[name])
+        return batch
+
+    def column(self, name: str) -> array:
+        """返回已填充部分的欄位"""
+        col = getattr(self, name)
+        return col if self.size == self.capacity else col[:self.size]
+
+
+class RecordStore:
+    """緊湊的請求記錄存儲：以 typed array 批次累積記錄，批次寫滿後交給結果輸出"""
+
+    def __init__(self, sink, params: Optional[Sequence[Dict]] = None,
+                 headers: Optional[Dict] = None, batch_size: int = 10000, replay: bool = False):
+        self.sink = sink
+        self.params = params or []
+        self.headers = headers or {}
+        self.batch_size = batch_size
+        # 日誌回放時每條記錄在批次中保存請求目標和 User-Agent
+        self.replay = replay
+        # 錯誤信息駐留表，相同錯誤只保存一次
+        self.errors: List[str] = []
+        self._error_index: Dict[str, int] = {}
+        self._param_reprs: Dict[int, str] = {}
+        self._headers_repr = str(self.headers)
+        # 回放時按 User-Agent 緩存的Headers字串表示
+        self._agent_headers_reprs: Dict[str, str] = {}
+        # 時鐘錨點：將 monotonic 時間換算為牆上時間
+        self.mono_anchor_ns = time.monotonic_ns()
+        self.wall_anchor_ns = time.time_ns()
+        self._batch = RecordBatch(batch_size, replay)
+        sink.bind(self)
+
+    def __len__(self):
+        return len(self.sink) + self._batch.size
+
+    def append(self, ts_ns: int, status: int, latency_ns: int, param_idx: int = -1,
+               error: Optional[str] = None, replayed: Optional[Tuple[str, Optional[str]]] = None):
+        """追加一條記錄，replayed 為回放請求的 (請求目標, User-Agent)"""
+        batch = self._batch
+        i = batch.size
+        if batch.replayed is not None:
+            batch.replayed.append(replayed)
+        batch.ts_ns[i] = ts_ns
+        batch.status[i] = status
+        batch.latency_ns[i] = latency_ns
+        batch.param_idx[i] = param_idx
+        batch.error_idx[i] = -1 if error is None else self.intern_error(error)
+        batch.size = i + 1
+        if batch.size == batch.capacity:
+            self.flush()
+
+    def intern_error(self, error: str) -> int:
+        """返回錯誤信息在駐留表中的索引"""
+        idx = self._error_index.get(error)
+        if idx is None:
+            idx = self._error_index[error] = len(self.errors)
+            self.errors.append(error)
+        return idx
+
+    def flush(self):
+        """將當前批次交給結果輸出"""
+        if self._batch.size:
+            batch, self._batch = self._batch, RecordBatch(self.batch_size, self.replay)
+            self.sink.write_batch(batch)
+
+    def close(self):
+        """寫出剩餘記錄並關閉結果輸出"""
+        self.flush()
+        self.sink.close()
+
+    def param_repr(self, idx: int) -> Optional[str]:
+        """參數的字串表示（與舊版 CSV 相同）"""
+        if idx < 0:
+            return None
+        text = self._param_reprs.get(idx)
+        if text is None:
+            # 大型參數列表只緩存最近用到的項
+            if len(self._param_reprs) >= PARAM_REPR_CACHE_SIZE:
+                del self._param_reprs[next(iter(self._param_reprs))]
+            text = self._param_reprs[idx] = str(self.params[idx])
+        return text
+
+    def headers_repr(self, agent: Optional[str]) -> str:
+        """請求Headers的字串表示；回放的請求使用實際發送的 User-Agent"""
+        if agent is None or agent == self.headers.get('User-Agent'):
+            return self._headers_repr
+        text = self._agent_headers_reprs.get(agent)
+        if text is None:
+            if len(self._agent_headers_reprs) >= PARAM_REPR_CACHE_SIZE:
+                del self._agent_headers_reprs[next(iter(self._agent_headers_reprs))]
+            headers = dict(self.headers)
+            headers['User-Agent'] = agent
+            text = self._agent_headers_reprs[agent] = str(headers)
+        return text
+
+    def decode(self, batch: RecordBatch, columns: Sequence[str]) -> Dict[str, Any]:
+        """將批次解碼為報告使用的欄位"""
+        out = decode_numeric(batch, [name for name in columns if name in NUMERIC_COLUMNS])
+        for name in columns:
+            if name == 'timestamp':
+                offset = self.wall_anchor_ns - self.mono_anchor_ns
+                out[name] = [datetime.fromtimestamp((ts + offset) / 1e9).isoformat()
+                             for ts in batch.column('ts_ns')]
+            elif name == 'params':
+                if batch.replayed is not None:
+                    out[name] = [target for target, _ in batch.replayed]
+                else:
+                    out[name] = [self.param_repr(i) for i in batch.column('param_idx')]
+            elif name == 'headers':
+                if batch.replayed is not None:
+                    out[name] = [self.headers_repr(agent) for _, agent in batch.replayed]
+                else:
+                    out[name] = [self._headers_repr] * batch.size
+            elif name == 'error':
+                errors = self.errors
+                out[name] = [errors[i] if i >= 0 else None for i in batch.column('error_idx')]
+        return {name: out[name] for name in columns}
+
+
+def decode_numeric(batch: RecordBatch, columns: Sequence[str]) -> Dict[str, Any]:
+    """解碼數值欄位，不需要參數表和錯誤表"""
+    out = {}
+    for name in columns:
+        if name == 'status':
+            out[name] = batch.column('status')
+        elif name == 'response_time':
+            out[name] = [ns / 1e9 for ns in batch.column('latency_ns')]
+        else:
+            raise ValueError(f"無法在沒有記錄存儲的情況下解碼欄位：{name}")
+    return out
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import asyncio
+import calendar
+import gzip
+import json
+import queue
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+from templates import RequestTemplate
+
+# 訪問日誌格式：auto 按文件擴展名判斷（.jsonl/.ndjson/.json 為 JSONL，其餘為 combined）
+REPLAY_FORMATS = ('auto', 'combined', 'jsonl')
+# 解析線程每批交給發送循環的請求數
+REPLAY_BATCH = 1024
+# 解析線程最多領先發送循環的批數（限制內存）
+REPLAY_PREFETCH = 16
+# 按日誌中的 User-Agent 緩存的只讀Headers數量上限
+HEADER_CACHE_SIZE = 1024
+
+# nginx/Apache combined 格式：遠端地址 身份 用戶 [時間] "請求行" 狀態碼 字節數 "Referer" "User-Agent"
+_COMBINED = re.compile(r'\S+ \S+ \S+ \[([^\]]+)\] "(\S+) (\S+)[^"]*" \d{3} \S+(?: "[^"]*" "([^"]*)")?')
+# nginx 以 \xHH 轉義日誌中的引號和不可打印字節，Apache 另有 \"
+_ESCAPE = re.compile(r'\\x([0-9A-Fa-f]{2})|\\"')
+_MONTHS = {name: i + 1 for i, name in enumerate(
+    ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'))}
+
+# JSONL 日誌中各字段可能使用的鍵（按順序取第一個存在的）
+_TIME_KEYS = ('time', 'timestamp', '@timestamp', 'ts', 'msec', 'time_iso8601', 'time_local')
+_METHOD_KEYS = ('method', 'request_method')
+_TARGET_KEYS = ('request_uri', 'uri', 'path', 'url')
+_QUERY_KEYS = ('args', 'query', 'query_string')
+_AGENT_KEYS = ('user_agent', 'http_user_agent', 'agent')
+
+
+class LogEntry(NamedTuple):
+    """一條 GET 請求：日誌時間(Unix秒)、請求目標（路徑和查詢串）和 User-Agent"""
+    time: float
+    target: str
+    user_agent: Optional[str]
+
+
+def parse_clf_time(value: str) -> float:
+    """解析 combined 格式的時間（例如 10/Oct/2000:13:55:36 -0700），不依賴區域設置"""
+    day, month, year = int(value[0:2]), _MONTHS[value[3:6]], int(value[7:11])
+    hour, minute, second = int(value[12:14]), int(value[15:17]), int(value[18:20])
+    offset = 0
+    if len(value) >= 26:
+        offset = int(value[22:24]) * 3600 + int(value[24:26]) * 60
+        if value[21] == '-':
+            offset = -offset
+    return calendar.timegm((year, month, day, hour, minute, second)) - offset
+
+
+def parse_time(value: Any) -> float:
+    """解析 JSONL 日誌的時間：Unix 秒或毫秒、ISO 8601 或 combined 格式"""
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        value = str(value)
+        try:
+            seconds = float(value)
+        except ValueError:
+            if '/' in value[:7]:
+                return parse_clf_time(value)
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=timezone.utc)
+            return parsed.timestamp()
+    # 毫秒時間戳
+    return seconds / 1000 if seconds > 1e11 else seconds
+
+
+def _target(target: str) -> Optional[str]:
+    """請求目標的路徑和查詢串；絕對URL取其路徑部分，其他形式（例如 * 或 CONNECT 的目標）返回 None"""
+    if target.startswith(('http://', 'https://')):
+        slash = target.find('/', target.find('//') + 2)
+        target = target[slash:] if slash >= 0 else '/'
+    return target if target.startswith('/') else None
+
+
+def _unescape(value: str) -> str:
+    """把日誌中的轉義還原為URL中的百分號編碼"""
+    return _ESCAPE.sub(lambda m: '%' + m.group(1).upper() if m.group(1) else '%22', value)
+
+
+def parse_combined(line: str) -> Optional[Tuple[str, LogEntry]]:
+    """解析一行 combined 格式日誌，返回 (請求方法, 請求)，無法解析時返回 None"""
+    match = _COMBINED.match(line)
+    if match is None:
+        return None
+    stamp, method, target, agent = match.groups()
+    target = _target(target)
+    if target is None:
+        return None
+    if '\\' in target:
+        target = _unescape(target)
+    if agent in (None, '', '-'):
+        agent = None
+    try:
+        return method, LogEntry(parse_clf_time(stamp), target, agent)
+    except (KeyError, ValueError):
+        return None
+
+
+def _first(record: Dict[str, Any], keys: Tuple[str, ...]) -> Any:
+    for key in keys:
+        value = record.get(key)
+        if value not in (None, '', '-'):
+            return value
+    return None
+
+
+def parse_jsonl(line: str) -> Optional[Tuple[str, LogEntry]]:
+    """解析一行 JSONL 日誌，返回 (請求方法, 請求)，無法解析時返回 None
+
+    缺少方法和目標字段時使用 request 字段中的請求行（例如 "GET /path HTTP/1.1"）。
+    """
+    try:
+        record = json.loads(line)
+        stamp = _first(record, _TIME_KEYS)
+        if stamp is None:
+            return None
+        method = _first(record, _METHOD_KEYS)
+        target = _first(record, _TARGET_KEYS)
+        if target is None and isinstance(record.get('request'), str):
+            parts = record['request'].split(' ')
+            if len(parts) >= 2:
+                method, target = method or parts[0], parts[1]
+        if target is None:
+            return None
+        target = _target(str(target))
+        if target is None:
+            return None
+        query = _first(record, _QUERY_KEYS)
+        if query is not None and '?' not in target:
+            target = f"{target}?{query}"
+        agent = _first(record, _AGENT_KEYS)
+        return str(method or 'GET').upper(), LogEntry(parse_time(stamp), target,
+                                                      None if agent is None else str(agent))
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+def detect_format(path: str) -> str:
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'jsonl' if name.endswith(('.jsonl', '.ndjson', '.json')) else 'combined'
+
+
+def _open_log(path: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, 'r', encoding='utf-8', errors='replace')
+
+
+class ReplayStats:
+    """回放統計：發送、跳過（非GET）和無法解析的行數，日誌時間跨度，以及日誌發送完畢時的用時"""
+
+    def __init__(self):
+        self.sent = 0
+        self.skipped = 0
+        self.malformed = 0
+        self.log_span = 0.0
+        # 日誌全部發送完畢時距離開始的秒數；到達持續時間而停止時為 None
+        self.elapsed: Optional[float] = None
+
+    def merge(self, other: 'ReplayStats'):
+        self.sent += other.sent
+        self.skipped += other.skipped
+        self.malformed += other.malformed
+        self.log_span = max(self.log_span, other.log_span)
+        if other.elapsed is not None:
+            self.elapsed = max(self.elapsed or 0.0, other.elapsed)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'sent': self.sent, 'skipped': self.skipped, 'malformed': self.malformed,
+                'log_span': self.log_span, 'elapsed': self.elapsed}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ReplayStats':
+        stats = cls()
+        stats.sent = data['sent']
+        stats.skipped = data['skipped']
+        stats.malformed = data['malformed']
+        stats.log_span = data['log_span']
+        stats.elapsed = data['elapsed']
+        return stats
+
+
+class ReplaySource:
+    """流式讀取訪問日誌並編譯為請求模板
+
+    解析在後台線程中進行，通過有界隊列按批領先發送循環，不把整個日誌載入內存；
+    發送循環只在隊列為空時才等待解析。多進程時第 shard_index 個進程只解析行號
+    與之對應的行，各進程的時間軸都以日誌第一條可解析記錄的時間為起點。
+    combined 格式的時間精度為秒：同一秒的請求在這一秒內均勻分佈。
+    除了有上限的Headers緩存外不保留已發送的請求，詳細結果由記錄批次直接保存請求目標和 User-Agent。
+    """
+
+    def __init__(self, path: str, fmt: str, base_url: str, headers: CIMultiDictProxy,
+                 replay_user_agent: bool = True, shard_index: int = 0, shard_count: int = 1):
+        self.path = path
+        self.parse = parse_jsonl if (detect_format(path) if fmt == 'auto' else fmt) == 'jsonl' else parse_combined
+        self.origin = str(URL(base_url).origin())
+        self.headers = headers
+        self.replay_user_agent = replay_user_agent
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.stats = ReplayStats()
+        self._queue: queue.Queue = queue.Queue(maxsize=REPLAY_PREFETCH)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._header_cache: Dict[str, CIMultiDictProxy] = {}
+
+    def _headers_for(self, agent: Optional[str]) -> CIMultiDictProxy:
+        """日誌中有 User-Agent 時以其替換默認值（Headers文件指定的 User-Agent 優先）"""
+        if agent is None or not self.replay_user_agent:
+            return self.headers
+        headers = self._header_cache.get(agent)
+        if headers is None:
+            compiled = CIMultiDict(self.headers)
+            compiled['User-Agent'] = agent
+            headers = CIMultiDictProxy(compiled)
+            if len(self._header_cache) >= HEADER_CACHE_SIZE:
+                del self._header_cache[next(iter(self._header_cache))]
+            self._header_cache[agent] = headers
+        return headers
+
+    def _entries(self) -> Iterator[LogEntry]:
+        """本分片的 GET 請求；同時更新跳過和無法解析的計數"""
+        shard_index, shard_count = self.shard_index, self.shard_count
+        parse = self.parse
+        stats = self.stats
+        with _open_log(self.path) as f:
+            for number, line in enumerate(f):
+                if number % shard_count != shard_index or not line.strip():
+                    continue
+                if self._stop.is_set():
+                    return
+                parsed = parse(line)
+                if parsed is None:
+                    stats.malformed += 1
+                elif parsed[0] != 'GET':
+                    stats.skipped += 1
+                else:
+                    yield parsed[1]
+
+    def _first_time(self) -> Optional[float]:
+        """日誌第一條可解析記錄的時間，各分片以此為共同起點"""
+        with _open_log(self.path) as f:
+            for line in f:
+                parsed = self.parse(line) if line.strip() else None
+                if parsed is not None:
+                    return parsed[1].time
+        return None
+
+    def _produce(self):
+        """解析線程：按時間把請求分組，同一秒內的請求均勻分佈，再按批放入隊列"""
+        try:
+            start = self._first_time()
+            batch: List[Tuple[float, RequestTemplate]] = []
+            group: List[LogEntry] = []
+            last = 0.0
+
+            def flush_group():
+                nonlocal last
+                # 時間相同的一組請求：整秒時間戳在這一秒內均勻分佈
+                spread = 1.0 if group[0].time == int(group[0].time) else 0.0
+                for i, entry in enumerate(group):
+                    # 按請求開始時間記錄的日誌（例如 Apache）會略微亂序，時間軸不回退
+                    offset = last = max(entry.time - start + spread * i / len(group), last)
+                    url = URL(self.origin + entry.target, encoded=True)
+                    batch.append((offset, RequestTemplate(url, self._headers_for(entry.user_agent))))
+                    if len(batch) >= REPLAY_BATCH:
+                        self._put(batch[:])
+                        batch.clear()
+                self.stats.log_span = max(self.stats.log_span, group[-1].time - start)
+                group.clear()
+
+            for entry in self._entries():
+                if group and entry.time != group[0].time:
+                    flush_group()
+                group.append(entry)
+            if group:
+                flush_group()
+            if batch:
+                self._put(batch)
+        except Exception as e:
+            self._put(e)
+            return
+        self._put(None)
+
+    def _put(self, item):
+        # 發送循環已停止時不再阻塞
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self):
+        """在線程池中等待下一批；停止後返回 None，線程不會一直阻塞"""
+        while not self._stop.is_set():
+            try:
+                return self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._produce, name='replay-parser', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    async def batches(self) -> AsyncIterator[List[Tuple[float, RequestTemplate]]]:
+        """按批取出 (距日誌起點的秒數, 請求模板)；隊列中已有數據時不切換線程"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                item = await loop.run_in_executor(None, self._get)
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise ValueError(f"無法讀取訪問日誌：{item}")
+            yield item
+
+    async def requests(self, start_ns: int, deadline_ns: int,
+                       speed: float) -> AsyncIterator[Tuple[int, RequestTemplate, Optional[int]]]:
+        """按日誌時間給出 (參數項索引, 請求模板, 計劃發送時間)，參數項索引固定為 -1
+
+        speed 為時間倍速（1 為原始間隔），0 表示不等待、以最大吞吐量發送。
+        發送計數由調度協程在實際創建請求後累加，到達截止時間而丟棄的請求不計入。
+        """
+        self.start()
+        try:
+            async for batch in self.batches():
+                for offset, template in batch:
+                    intended_ns = None
+                    if speed:
+                        intended_ns = start_ns + int(offset / speed * 1e9)
+                        if intended_ns >= deadline_ns:
+                            return
+                        delay = intended_ns - time.monotonic_ns()
+                        if delay > 0:
+                            await asyncio.sleep(delay / 1e9)
+                    if time.monotonic_ns() >= deadline_ns:
+                        return
+                    yield -1, template, intended_ns
+            self.stats.elapsed = (time.monotonic_ns() - start_ns) / 1e9
+        finally:
+            self.stop()
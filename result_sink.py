@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import csv
+import gzip
+import json
+import queue
+import struct
+import threading
+import time
+import zlib
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from records import FIELDS, NUMERIC_COLUMNS, RecordBatch, decode_numeric
+
+# 詳細結果的欄位順序（與舊版 detailed_results.csv 相同）
+COLUMNS = ('timestamp', 'status', 'response_time', 'params', 'headers', 'error')
+
+DEFAULT_BATCH_SIZE = 10000
+# 重建統計時每次從文本格式讀取的行數
+NUMERIC_CHUNK_ROWS = 500000
+
+# 支持的輸出格式及默認文件名
+SINK_FORMATS = {
+    'memory': None,
+    'none': None,
+    'csv': 'detailed_results.csv',
+    'csv.gz': 'detailed_results.csv.gz',
+    'jsonl.gz': 'detailed_results.jsonl.gz',
+    'columnar': 'detailed_results.wafcol',
+}
+
+_MAGIC = b'WAFC'
+_FRAME_HEADER = struct.Struct('<4sI')
+
+
+def records_to_columns(records: List[Dict[str, Any]],
+                       columns: Sequence[str] = COLUMNS) -> Dict[str, list]:
+    """將字典格式的記錄轉換為欄位格式"""
+    out = {}
+    for name in columns:
+        values = [r.get(name) for r in records]
+        if name not in ('status', 'response_time'):
+            values = [v if v is None or isinstance(v, str) else str(v) for v in values]
+        out[name] = values
+    return out
+
+
+def _seconds_to_ns(values):
+    """響應時間（秒）欄位向量化轉換為納秒整數數組"""
+    import numpy as np
+
+    return np.rint(np.asarray(values, dtype=np.float64) * 1e9).astype(np.int64)
+
+
+class ResultSink:
+    """結果輸出基類：接收記錄批次，並由後台線程寫入磁盤"""
+
+    def __init__(self, path: Optional[str] = None, max_pending: int = 4):
+        self.path = path
+        self.max_pending = max_pending
+        self.count = 0
+        self.store = None
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        # 寫入線程落後、隊列已滿時生產者等待的次數和累計時間（納秒），供飽和檢測歸因
+        self.stalls = 0
+        self.stall_ns = 0
+
+    def __len__(self):
+        return self.count
+
+    def bind(self, store):
+        """綁定記錄存儲，用於解碼參數、錯誤信息和時間戳"""
+        self.store = store
+
+    def open(self):
+        """打開輸出文件並啟動寫入線程"""
+        if self._thread is not None:
+            return
+        self._open_file()
+        # 有界隊列：寫入落後時阻塞生產者，保證內存上限
+        self._queue = queue.Queue(maxsize=self.max_pending)
+        self._thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._thread.start()
+
+    def write_batch(self, batch: RecordBatch):
+        """將一批記錄交給寫入線程
+
+        隊列未滿時立即返回；已滿時為保證內存上限等待寫入線程，並記錄等待次數和時間。
+        生產者是事件循環，等待期間不能發送請求，這段時間由飽和檢測歸因為寫入阻塞。
+        """
+        if self._error is not None:
+            raise IOError(f"寫入結果文件失敗：{self._error}")
+        self.open()
+        self.count += batch.size
+        try:
+            self._queue.put_nowait(batch)
+        except queue.Full:
+            start_ns = time.monotonic_ns()
+            self._queue.put(batch)
+            self.stalls += 1
+            self.stall_ns += time.monotonic_ns() - start_ns
+
+    def close(self):
+        """等待寫入完成並關閉文件"""
+        if self._closed:
+            return
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+            self._close_file()
+        self._closed = True
+        if self._error is not None:
+            raise IOError(f"寫入結果文件失敗：{self._error}")
+
+    def _writer_loop(self):
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                break
+            if self._error is not None:
+                continue
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                self._error = e
+
+    def iter_chunks(self, columns: Sequence[str] = COLUMNS) -> Iterator[Dict[str, Any]]:
+        """按塊讀回已保存的結果，每塊為欄位字典"""
+        raise NotImplementedError
+
+    def iter_numeric(self) -> Iterator[Tuple[Sequence[int], Sequence[int]]]:
+        """按塊讀回 (狀態碼, 延遲納秒) 兩個欄位，供報告重建統計
+
+        列式數據直接返回原始 typed array，不逐行解碼。
+        """
+        for chunk in self.iter_chunks(NUMERIC_COLUMNS):
+            for name in NUMERIC_COLUMNS:
+                if chunk.get(name) is None:
+                    raise KeyError(name)
+            yield chunk['status'], _seconds_to_ns(chunk['response_time'])
+
+    def _open_file(self):
+        raise NotImplementedError
+
+    def _close_file(self):
+        self._file.close()
+
+    def _write_batch(self, batch: RecordBatch):
+        raise NotImplementedError
+
+
+class MemorySink(ResultSink):
+    """內存輸出：保留所有記錄批次（僅適用於短時間測試）"""
+
+    def __init__(self, records: Optional[List[Dict[str, Any]]] = None):
+        super().__init__(None)
+        # 兼容舊版的字典記錄列表
+        self.records = records
+        self.batches: List[RecordBatch] = []
+        self.count = len(records) if records else 0
+
+    def write_batch(self, batch):
+        self.batches.append(batch)
+        self.count += batch.size
+
+    def close(self):
+        self._closed = True
+
+    def iter_chunks(self, columns=COLUMNS):
+        if self.records:
+            for i in range(0, len(self.records), DEFAULT_BATCH_SIZE):
+                yield records_to_columns(self.records[i:i + DEFAULT_BATCH_SIZE], columns)
+        for batch in self.batches:
+            yield self.store.decode(batch, columns)
+
+    def iter_numeric(self):
+        if self.records:
+            for i in range(0, len(self.records), DEFAULT_BATCH_SIZE):
+                chunk = records_to_columns(self.records[i:i + DEFAULT_BATCH_SIZE], NUMERIC_COLUMNS)
+                yield chunk['status'], _seconds_to_ns(chunk['response_time'])
+        for batch in self.batches:
+            yield batch.column('status'), batch.column('latency_ns')
+
+
+class NullSink(ResultSink):
+    """丟棄詳細結果，只計數；報告和摘要使用測試過程中累積的統計"""
+
+    def write_batch(self, batch):
+        self.count += batch.size
+
+    def close(self):
+        self._closed = True
+
+    def iter_chunks(self, columns=COLUMNS):
+        return iter(())
+
+    def iter_numeric(self):
+        return iter(())
+
+
+class CsvSink(ResultSink):
+    """CSV輸出，可選gzip壓縮"""
+
+    def __init__(self, path: str, compress: bool = False, **kwargs):
+        super().__init__(path, **kwargs)
+        self.compress = compress
+
+    def _open(self, mode: str):
+        if self.compress:
+            return gzip.open(self.path, mode + 't', encoding='utf-8', newline='', compresslevel=1)
+        return open(self.path, mode, encoding='utf-8', newline='')
+
+    def _open_file(self):
+        self._file = self._open('w')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(COLUMNS)
+
+    def _write_batch(self, batch):
+        columns = self.store.decode(batch, COLUMNS)
+        self._writer.writerows(zip(*(columns[name] for name in COLUMNS)))
+
+    def iter_chunks(self, columns=COLUMNS):
+        if self.count == 0:
+            return
+        with self._open('r') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            rows = []
+            for row in reader:
+                rows.append(row)
+                if len(rows) >= DEFAULT_BATCH_SIZE:
+                    yield self._rows_to_columns(rows, columns)
+                    rows = []
+            if rows:
+                yield self._rows_to_columns(rows, columns)
+
+    def iter_numeric(self):
+        if self.count == 0:
+            return
+        # 只解析需要的兩列，由 pandas 的 C 解析器按大塊讀取
+        import pandas as pd
+
+        reader = pd.read_csv(self.path, usecols=list(NUMERIC_COLUMNS), chunksize=NUMERIC_CHUNK_ROWS,
+                             compression='gzip' if self.compress else None,
+                             dtype={'status': 'int64', 'response_time': 'float64'})
+        with reader:
+            for frame in reader:
+                yield frame['status'].to_numpy(), _seconds_to_ns(frame['response_time'].to_numpy())
+
+    @staticmethod
+    def _rows_to_columns(rows: List[List[str]], columns: Sequence[str]) -> Dict[str, list]:
+        out = {}
+        for name, values in zip(COLUMNS, zip(*rows)):
+            if name not in columns:
+                continue
+            if name == 'status':
+                out[name] = [int(v) for v in values]
+            elif name == 'response_time':
+                out[name] = [float(v) for v in values]
+            else:
+                out[name] = [v or None for v in values]
+        return out
+
+
+class JsonlSink(ResultSink):
+    """gzip壓縮的JSON Lines輸出"""
+
+    def _open_file(self):
+        self._file = gzip.open(self.path, 'wt', encoding='utf-8', compresslevel=1)
+
+    def _write_batch(self, batch):
+        columns = self.store.decode(batch, COLUMNS)
+        dumps = json.dumps
+        self._file.write(''.join(
+            dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + '\n'
+            for row in zip(*(columns[name] for name in COLUMNS))
+        ))
+
+    def iter_chunks(self, columns=COLUMNS):
+        if self.count == 0:
+            return
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            records = []
+            for line in f:
+                records.append(json.loads(line))
+                if len(records) >= DEFAULT_BATCH_SIZE:
+                    yield records_to_columns(records, columns)
+                    records = []
+            if records:
+                yield records_to_columns(records, columns)
+
+
+class ColumnarSink(ResultSink):
+    """分塊列式輸出：每個批次為一個幀，各欄位以 zlib 壓縮的原始 typed array 保存"""
+
+    def _open_file(self):
+        self._file = open(self.path, 'wb')
+
+    def _write_batch(self, batch):
+        payloads = []
+        meta = []
+        for name, typecode in FIELDS:
+            data = zlib.compress(batch.column(name).tobytes(), 1)
+            payloads.append(data)
+            meta.append({'name': name, 'type': typecode, 'size': len(data)})
+        if batch.replayed is not None:
+            # 回放的請求目標和 User-Agent 以 JSON 字串列保存
+            data = zlib.compress(json.dumps(batch.replayed, ensure_ascii=False).encode('utf-8'), 1)
+            payloads.append(data)
+            meta.append({'name': 'replayed', 'type': 'json', 'size': len(data)})
+        header = json.dumps({'rows': batch.size, 'columns': meta}).encode('utf-8')
+        self._file.write(_FRAME_HEADER.pack(_MAGIC, len(header)))
+        self._file.write(header)
+        for data in payloads:
+            self._file.write(data)
+
+    def iter_batches(self) -> Iterator[RecordBatch]:
+        """逐幀讀回原始記錄批次"""
+        if self.count == 0:
+            return
+        with open(self.path, 'rb') as f:
+            while True:
+                head = f.read(_FRAME_HEADER.size)
+                if not head:
+                    break
+                magic, header_len = _FRAME_HEADER.unpack(head)
+                if magic != _MAGIC:
+                    raise ValueError(f"結果文件格式錯誤：{self.path}")
+                header = json.loads(f.read(header_len))
+                arrays = {}
+                for col in header['columns']:
+                    data = zlib.decompress(f.read(col['size']))
+                    if col['type'] == 'json':
+                        arrays[col['name']] = [tuple(item) for item in json.loads(data)]
+                    else:
+                        arrays[col['name']] = array(col['type'], data)
+                yield RecordBatch.from_arrays(arrays)
+
+    def iter_chunks(self, columns=COLUMNS):
+        # 由其他進程寫入的文件沒有記錄存儲，只能讀回數值欄位
+        decode = self.store.decode if self.store is not None else decode_numeric
+        for batch in self.iter_batches():
+            yield decode(batch, columns)
+
+    def iter_numeric(self):
+        for batch in self.iter_batches():
+            yield batch.column('status'), batch.column('latency_ns')
+
+
+class MultiSink(ResultSink):
+    """組合多個子結果輸出（例如多進程測試中各進程各自寫入的文件）"""
+
+    def __init__(self, sinks: List[ResultSink]):
+        super().__init__(None)
+        self.sinks = sinks
+        self.count = sum(len(sink) for sink in sinks)
+
+    def write_batch(self, batch):
+        raise IOError("組合輸出為只讀")
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+        self._closed = True
+
+    def iter_chunks(self, columns=COLUMNS):
+        for sink in self.sinks:
+            yield from sink.iter_chunks(columns)
+
+    def iter_numeric(self):
+        for sink in self.sinks:
+            yield from sink.iter_numeric()
+
+
+def sink_path(fmt: str, suffix: str) -> Optional[str]:
+    """在默認文件名的擴展名前加上後綴，例如 detailed_results.p0.csv"""
+    path = SINK_FORMATS[fmt]
+    if path is None:
+        return None
+    stem, ext = path.split('.', 1)
+    return f"{stem}.{suffix}.{ext}"
+
+
+def create_sink(fmt: str = 'csv', path: Optional[str] = None) -> ResultSink:
+    """根據格式創建結果輸出"""
+    if fmt not in SINK_FORMATS:
+        raise ValueError(f"不支持的輸出格式：{fmt}")
+    if fmt == 'memory':
+        return MemorySink()
+    if fmt == 'none':
+        return NullSink()
+    path = path or SINK_FORMATS[fmt]
+    if fmt == 'csv':
+        return CsvSink(path)
+    if fmt == 'csv.gz':
+        return CsvSink(path, compress=True)
+    if fmt == 'jsonl.gz':
+        return JsonlSink(path)
+    return ColumnarSink(path)
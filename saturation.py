@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from scheduler import ArrivalScheduler
+
+# 探測事件循環延遲的間隔(秒)
+PROBE_INTERVAL = 0.05
+# 一秒內事件循環的最大延遲超過此值(毫秒)視為飽和
+LOOP_LAG_THRESHOLD_MS = 50.0
+# 事件循環線程的CPU使用率超過此比例視為飽和
+CPU_THRESHOLD = 0.9
+# 一秒內事件循環等待結果寫入線程的累計時間超過此值(毫秒)視為飽和
+SINK_STALL_THRESHOLD_MS = 10.0
+# 計劃發送時間已過但尚未發出的積壓超過此值(毫秒)視為過載
+BACKLOG_THRESHOLD_MS = 100.0
+
+REASONS = ('loop_lag', 'cpu', 'sink_stall', 'backlog')
+# 積壓但事件循環不忙且沒有空閒並發：瓶頸是目標的響應時間和並發上限，不是負載生成器
+TARGET_BOUND = 'target_bound'
+
+
+class SaturationSample:
+    """一秒內負載生成器自身的狀態"""
+    __slots__ = ('second', 'stage', 'lag_max_ms', 'lag_sum_ms', 'probes', 'loop_cpu', 'process_cpu',
+                 'backlog_max_ms', 'backlog_idle_ms', 'sink_stall_ms')
+
+    def __init__(self, second: int, stage: int = -1):
+        self.second = second
+        self.stage = stage
+        self.lag_max_ms = 0.0
+        self.lag_sum_ms = 0.0
+        self.probes = 0
+        self.loop_cpu = 0.0
+        self.process_cpu = 0.0
+        self.backlog_max_ms = 0.0
+        # 同時存在空閒並發（工作協程或槽位）時的最大積壓
+        self.backlog_idle_ms = 0.0
+        # 等待結果寫入線程的累計時間
+        self.sink_stall_ms = 0.0
+
+    @property
+    def reasons(self) -> Tuple[str, ...]:
+        """負載生成器飽和的原因；積壓只在事件循環忙或有空閒並發卻未按時發送時才算作飽和"""
+        reasons = []
+        if self.lag_max_ms > LOOP_LAG_THRESHOLD_MS:
+            reasons.append('loop_lag')
+        if self.loop_cpu > CPU_THRESHOLD:
+            reasons.append('cpu')
+        if self.sink_stall_ms > SINK_STALL_THRESHOLD_MS:
+            reasons.append('sink_stall')
+        if self.backlog_max_ms > BACKLOG_THRESHOLD_MS and (reasons or self.backlog_idle_ms > BACKLOG_THRESHOLD_MS):
+            reasons.append('backlog')
+        return tuple(reasons)
+
+    @property
+    def target_bound(self) -> bool:
+        """積壓來自所有並發都在等待目標響應，不影響結果的可信度"""
+        return self.backlog_max_ms > BACKLOG_THRESHOLD_MS and not self.reasons
+
+    def to_list(self) -> List:
+        return [self.second, self.stage, round(self.lag_max_ms, 3), round(self.lag_sum_ms, 3), self.probes,
+                round(self.loop_cpu, 4), round(self.process_cpu, 4), round(self.backlog_max_ms, 3),
+                round(self.backlog_idle_ms, 3), round(self.sink_stall_ms, 3)]
+
+    @classmethod
+    def from_list(cls, data: List) -> 'SaturationSample':
+        sample = cls(data[0], data[1])
+        (sample.lag_max_ms, sample.lag_sum_ms, sample.probes, sample.loop_cpu,
+         sample.process_cpu, sample.backlog_max_ms, sample.backlog_idle_ms,
+         sample.sink_stall_ms) = data[2:]
+        return sample
+
+
+class SaturationMonitor:
+    """監測負載生成器自身是否成為瓶頸：事件循環延遲、事件循環線程CPU、結果寫入阻塞和調度積壓
+
+    在發送請求的事件循環中運行，按秒匯總。多個進程的結果合併時，
+    任一進程飽和的秒都視為飽和。idle_of 返回當前空閒的並發數，
+    用於區分負載生成器來不及發送和目標響應慢導致的積壓；
+    stall_of 返回等待結果寫入線程的累計納秒數。
+    """
+
+    def __init__(self, second_of: Callable[[int], int], scheduler: Optional[ArrivalScheduler] = None,
+                 stage_of: Optional[Callable[[], int]] = None, idle_of: Optional[Callable[[], int]] = None,
+                 stall_of: Optional[Callable[[], int]] = None):
+        self.second_of = second_of
+        self.scheduler = scheduler
+        self.idle_of = idle_of
+        self.stall_of = stall_of
+        # 分階段負載時記錄每一秒所在的階段
+        self.stage_of = stage_of
+        self.samples: Dict[int, SaturationSample] = {}
+        self._current: Optional[SaturationSample] = None
+
+    @property
+    def saturated_now(self) -> bool:
+        """最近一個完整秒是否飽和"""
+        if self._current is None:
+            return False
+        previous = self.samples.get(self._current.second - 1)
+        return bool(previous and previous.reasons)
+
+    async def run(self):
+        """持續探測，直到任務被取消"""
+        interval_ns = int(PROBE_INTERVAL * 1e9)
+        wall_start = time.monotonic_ns()
+        thread_start = time.thread_time()
+        process_start = time.process_time()
+        stall_ns = self.stall_of() if self.stall_of else 0
+        try:
+            while True:
+                expected_ns = time.monotonic_ns() + interval_ns
+                await asyncio.sleep(PROBE_INTERVAL)
+                now_ns = time.monotonic_ns()
+                second = self.second_of(now_ns)
+                if self._current is None or second != self._current.second:
+                    if self._current is not None:
+                        # 以線程CPU時間衡量事件循環，進程CPU時間包括寫入線程等
+                        wall = (now_ns - wall_start) / 1e9
+                        self._current.loop_cpu = (time.thread_time() - thread_start) / wall
+                        self._current.process_cpu = (time.process_time() - process_start) / wall
+                        wall_start = now_ns
+                        thread_start = time.thread_time()
+                        process_start = time.process_time()
+                    stage = self.stage_of() if self.stage_of else -1
+                    self._current = self.samples[second] = SaturationSample(second, stage)
+                sample = self._current
+                lag_ms = max(0, now_ns - expected_ns) / 1e6
+                sample.lag_max_ms = max(sample.lag_max_ms, lag_ms)
+                sample.lag_sum_ms += lag_ms
+                sample.probes += 1
+                if self.stall_of:
+                    # 兩次探測之間新增的寫入等待時間計入當前秒
+                    total_ns = self.stall_of()
+                    sample.sink_stall_ms += (total_ns - stall_ns) / 1e6
+                    stall_ns = total_ns
+                if self.scheduler and self.scheduler.start_ns is not None:
+                    backlog_ms = (now_ns - self.scheduler.peek()) / 1e6
+                    sample.backlog_max_ms = max(sample.backlog_max_ms, backlog_ms)
+                    if backlog_ms > BACKLOG_THRESHOLD_MS and self.idle_of and self.idle_of() > 0:
+                        sample.backlog_idle_ms = max(sample.backlog_idle_ms, backlog_ms)
+        except asyncio.CancelledError:
+            # 最後一秒不完整，CPU使用率按已經過的時間計算
+            if self._current is not None:
+                wall = max((time.monotonic_ns() - wall_start) / 1e9, PROBE_INTERVAL)
+                self._current.loop_cpu = (time.thread_time() - thread_start) / wall
+                self._current.process_cpu = (time.process_time() - process_start) / wall
+
+    def saturated_seconds(self) -> Dict[int, Tuple[str, ...]]:
+        return {second: sample.reasons for second, sample in self.samples.items() if sample.reasons}
+
+    def target_bound_seconds(self) -> List[int]:
+        return sorted(second for second, sample in self.samples.items() if sample.target_bound)
+
+    def intervals(self) -> List[Tuple[int, int, Tuple[str, ...]]]:
+        """相鄰的飽和秒合併為區間 (開始秒, 結束秒, 原因)"""
+        return self._merge_intervals(self.saturated_seconds())
+
+    def target_bound_intervals(self) -> List[Tuple[int, int, Tuple[str, ...]]]:
+        """相鄰的受目標限制的秒合併為區間"""
+        return self._merge_intervals({second: (TARGET_BOUND,) for second in self.target_bound_seconds()})
+
+    @staticmethod
+    def _merge_intervals(seconds: Dict[int, Tuple[str, ...]]) -> List[Tuple[int, int, Tuple[str, ...]]]:
+        result = []
+        order = REASONS + (TARGET_BOUND,)
+        for second, reasons in sorted(seconds.items()):
+            if result and result[-1][1] == second - 1:
+                start, _, previous = result[-1]
+                result[-1] = (start, second, tuple(r for r in order if r in previous or r in reasons))
+            else:
+                result.append((second, second, reasons))
+        return result
+
+    def merge(self, other: 'SaturationMonitor'):
+        for second, sample in other.samples.items():
+            mine = self.samples.get(second)
+            if mine is None:
+                self.samples[second] = sample
+                continue
+            mine.lag_max_ms = max(mine.lag_max_ms, sample.lag_max_ms)
+            mine.lag_sum_ms += sample.lag_sum_ms
+            mine.probes += sample.probes
+            # 取最忙的進程，任一進程飽和即視為飽和
+            mine.loop_cpu = max(mine.loop_cpu, sample.loop_cpu)
+            mine.process_cpu = max(mine.process_cpu, sample.process_cpu)
+            mine.backlog_max_ms = max(mine.backlog_max_ms, sample.backlog_max_ms)
+            mine.backlog_idle_ms = max(mine.backlog_idle_ms, sample.backlog_idle_ms)
+            mine.sink_stall_ms = max(mine.sink_stall_ms, sample.sink_stall_ms)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'samples': [sample.to_list() for _, sample in sorted(self.samples.items())]}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'SaturationMonitor':
+        monitor = cls(lambda mono_ns: 0)
+        for item in data['samples']:
+            sample = SaturationSample.from_list(item)
+            monitor.samples[sample.second] = sample
+        return monitor
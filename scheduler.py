@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import asyncio
+import time
+from typing import Optional
+
+from histogram import LatencyHistogram
+
+# 等待計劃時間時每段睡眠的上限，期間調整的速率可以及時生效
+MAX_WAIT_NS = 50_000_000
+
+
+class ArrivalScheduler:
+    """開環恆定到達率調度器
+
+    所有工作協程共享同一條到達時間線：第 i 個請求的計劃發送時間為 start + i / rate，
+    與目標響應快慢無關。工作協程全部忙碌時，計劃時間已過的請求會立即發送，
+    並從計劃時間開始計算延遲（協調遺漏校正）。
+    同一時刻只有一個空閒協程等待下一個計劃時間，未到的時間不會被提前領取，
+    因此可以在運行中用 set_rate 調整速率。
+    """
+
+    def __init__(self, rate: float):
+        if rate <= 0:
+            raise ValueError("請求速率必須大於0")
+        self.rate = rate
+        self.interval_ns = 1e9 / rate
+        self.start_ns: Optional[int] = None
+        self.issued = 0
+        # 調整速率後，時間線從最近一個計劃時間 (_base_ns, 第 _base_issued 個請求) 重新排列
+        self._base_ns: Optional[int] = None
+        self._base_issued = 0
+        self._last_ns: Optional[int] = None
+        self._lock = asyncio.Lock()
+        # 實際發送時間落後計劃時間的分佈
+        self.send_lag = LatencyHistogram()
+
+    def start(self, start_ns: Optional[int] = None):
+        """設置時間線起點"""
+        self.start_ns = time.monotonic_ns() if start_ns is None else start_ns
+        self.issued = 0
+        self._base_ns = self.start_ns
+        self._base_issued = 0
+        self._last_ns = None
+
+    def set_rate(self, rate: float):
+        """調整目標速率，已領取的計劃時間不變，之後的請求按新間隔排列"""
+        if rate <= 0:
+            raise ValueError("請求速率必須大於0")
+        if rate == self.rate:
+            return
+        if self._last_ns is not None:
+            self._base_ns = self._last_ns
+            self._base_issued = self.issued - 1
+        self.rate = rate
+        self.interval_ns = 1e9 / rate
+
+    def peek(self) -> int:
+        """下一個計劃發送時間（monotonic 納秒），不領取"""
+        if self.start_ns is None:
+            self.start()
+        return self._base_ns + int((self.issued - self._base_issued) * self.interval_ns)
+
+    def next_slot(self) -> int:
+        """領取下一個計劃發送時間（monotonic 納秒）"""
+        intended_ns = self.peek()
+        self._last_ns = intended_ns
+        self.issued += 1
+        return intended_ns
+
+    async def wait(self) -> int:
+        """等待到下一個計劃發送時間，返回該計劃時間"""
+        async with self._lock:
+            while True:
+                delay_ns = self.peek() - time.monotonic_ns()
+                if delay_ns <= 0:
+                    break
+                await asyncio.sleep(min(delay_ns, MAX_WAIT_NS) / 1e9)
+            intended_ns = self.next_slot()
+        self.send_lag.record((time.monotonic_ns() - intended_ns) // 1000)
+        return intended_ns
+
+    def expected(self, elapsed: float) -> int:
+        """經過 elapsed 秒後按目標速率應發送的請求數"""
+        return int(elapsed * self.rate)
+
+
+class ConcurrencySlots:
+    """上限可在運行中調整的並發槽位（信號量）
+
+    高並發模式下由單一調度協程領取槽位並為每個請求創建任務，請求完成時釋放槽位；
+    只有進行中的請求佔用協程，不需要為每個虛擬用戶常駐一個協程。只支持一個等待者。
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._waiter: Optional[asyncio.Future] = None
+
+    def set_limit(self, limit: int):
+        self.limit = limit
+        self._wake()
+
+    async def acquire(self):
+        while self.used >= self.limit:
+            self._waiter = asyncio.get_running_loop().create_future()
+            await self._waiter
+        self.used += 1
+
+    def release(self):
+        self.used -= 1
+        self._wake()
+
+    def _wake(self):
+        waiter = self._waiter
+        if waiter is not None and not waiter.done() and self.used < self.limit:
+            waiter.set_result(None)
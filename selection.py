@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import random
+from array import array
+from typing import Any, Callable, Dict, Optional, Sequence
+
+# 參數項的選擇策略
+SELECTION_STRATEGIES = ('random', 'round-robin', 'weighted', 'exhaustive')
+# JSON參數項中表示權重的鍵，不會編碼進URL
+WEIGHT_KEY = '_weight'
+
+
+class AliasTable:
+    """Vose 別名表：預先計算後每次按權重抽樣為 O(1)"""
+
+    def __init__(self, weights: Sequence[float]):
+        n = len(weights)
+        total = float(sum(weights))
+        if n == 0 or total <= 0:
+            raise ValueError("權重之和必須大於0")
+        self.n = n
+        self.prob = array('d', bytes(8 * n))
+        self.alias = array('i', bytes(4 * n))
+        scaled = [w * n / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        # 剩餘項因浮點誤差而接近 1
+        for i in large + small:
+            self.prob[i] = 1.0
+            self.alias[i] = i
+
+    def draw(self, rng: random.Random) -> int:
+        u = rng.random() * self.n
+        i = int(u)
+        return i if u - i < self.prob[i] else self.alias[i]
+
+
+def load_weights(params: Sequence[Dict[str, Any]]) -> array:
+    """讀取每個參數項的權重（缺省為 1）
+
+    Corpus 在建立索引時已記錄權重（緩存在 .idx 中），直接使用，不需要逐項解碼JSON。
+    """
+    if hasattr(params, 'item_weights'):
+        weights = params.item_weights()
+        if weights and min(weights) < 0:
+            i = next(i for i, weight in enumerate(weights) if weight < 0)
+            raise ValueError(f"參數文件第{i + 1}項的權重必須是非負數")
+        return weights
+    weights = array('d', bytes(8 * len(params)))
+    for i in range(len(params)):
+        item = params[i]
+        weight = item.get(WEIGHT_KEY, 1) if isinstance(item, dict) else 1
+        if not isinstance(weight, (int, float)) or weight < 0:
+            raise ValueError(f"參數文件第{i + 1}項的權重必須是非負數")
+        weights[i] = weight
+    return weights
+
+
+class ParamSelector:
+    """為各工作協程生成參數項索引的函數
+
+    多進程或多代理時，每個分片（shard_index / shard_count）擁有索引 shard_index + shard_count * j
+    的子序列；round-robin 和 exhaustive 只在本分片內選擇，各分片之間不需要協調。
+    round-robin 和 exhaustive 的工作協程共享一個每次調用都前進的游標，暫停的工作協程
+    （負載配置或自適應並發）不會使部分參數項永遠不被發送；同一事件循環中共享游標不需要鎖。
+    """
+
+    def __init__(self, strategy: str, params: Sequence[Dict[str, Any]],
+                 seed: Optional[int] = None, shard_index: int = 0, shard_count: int = 1):
+        if strategy not in SELECTION_STRATEGIES:
+            raise ValueError(f"參數選擇策略必須是以下之一：{', '.join(SELECTION_STRATEGIES)}")
+        self.strategy = strategy
+        self.count = len(params)
+        self.seed = seed
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        # 本分片擁有的索引數量
+        self.shard_size = len(range(shard_index, self.count, shard_count))
+        self.table = AliasTable(load_weights(params)) if strategy == 'weighted' and self.count else None
+        self._cursor = 0
+
+    def _rng(self, worker_id: int) -> random.Random:
+        if self.seed is None:
+            return random.Random()
+        # 每個工作協程有獨立且可重現的隨機序列
+        return random.Random(f"{self.seed}:{self.shard_index}:{worker_id}")
+
+    def for_worker(self, worker_id: int) -> Callable[[], Optional[int]]:
+        """返回工作協程的選擇函數：沒有參數時返回 -1，exhaustive 模式選完後返回 None"""
+        count = self.count
+        if not count:
+            return lambda: -1
+        if self.strategy == 'random':
+            rng = self._rng(worker_id)
+            return lambda: rng.randrange(count)
+        if self.strategy == 'weighted':
+            rng = self._rng(worker_id)
+            table = self.table
+            return lambda: table.draw(rng)
+
+        start, step, size = self.shard_index, self.shard_count, self.shard_size
+        if self.strategy == 'round-robin':
+            if not size:
+                # 分片數多於參數項時退回整個列表
+                start, step, size = 0, 1, count
+
+            def next_round_robin() -> int:
+                j = self._cursor
+                self._cursor = (j + 1) % size
+                return start + step * j
+            return next_round_robin
+
+        def next_exhaustive() -> Optional[int]:
+            j = self._cursor
+            if j >= size:
+                return None
+            self._cursor = j + 1
+            return start + step * j
+        return next_exhaustive
+
+
+class PayloadStats:
+    """每個參數項的阻擋（403 或匹配阻擋頁特徵）、放行和錯誤次數"""
+
+    def __init__(self, count: int):
+        self.count = count
+        self.blocked = array('I', bytes(4 * count))
+        self.passed = array('I', bytes(4 * count))
+        self.errors = array('I', bytes(4 * count))
+
+    def record(self, idx: int, status: int, blocked: Optional[bool] = None):
+        if blocked or (blocked is None and status == 403):
+            self.blocked[idx] += 1
+        elif status < 0:
+            self.errors[idx] += 1
+        else:
+            self.passed[idx] += 1
+
+    def sent(self, idx: int) -> int:
+        return self.blocked[idx] + self.passed[idx] + self.errors[idx]
+
+    def rows(self):
+        """已發送的參數項 (索引, 阻擋, 放行, 錯誤)"""
+        for idx in range(self.count):
+            blocked, passed, errors = self.blocked[idx], self.passed[idx], self.errors[idx]
+            if blocked or passed or errors:
+                yield idx, blocked, passed, errors
+
+    def merge(self, other: 'PayloadStats'):
+        for idx, blocked, passed, errors in other.rows():
+            self.blocked[idx] += blocked
+            self.passed[idx] += passed
+            self.errors[idx] += errors
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'count': self.count, 'rows': [list(row) for row in self.rows()]}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'PayloadStats':
+        stats = cls(data['count'])
+        for idx, blocked, passed, errors in data['rows']:
+            stats.blocked[idx] = blocked
+            stats.passed[idx] = passed
+            stats.errors[idx] = errors
+        return stats
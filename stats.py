@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+from histogram import LatencyHistogram
+
+# 報告中輸出的百分位
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def status_class(status: int) -> str:
+    """狀態碼所屬類別，例如 200 -> 2xx，-1 -> error"""
+    if status < 0:
+        return 'error'
+    return f'{status // 100}xx'
+
+
+class RunStats:
+    """測試統計：狀態碼計數、被阻擋請求計數及各狀態類別的延遲直方圖，可合併"""
+
+    def __init__(self):
+        self.total = 0
+        self.status_counts: Dict[int, int] = {}
+        # 按狀態碼統計的被阻擋請求：默認為 403，啟用響應分類時也包括匹配阻擋頁特徵的其他狀態碼
+        self.blocked_counts: Dict[int, int] = {}
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        # 狀態碼到直方圖的快取，避免熱路徑上重複計算類別
+        self._by_status: Dict[int, LatencyHistogram] = {}
+
+    def _histogram_for(self, status: int) -> LatencyHistogram:
+        cls = status_class(status)
+        hist = self.histograms.get(cls)
+        if hist is None:
+            hist = self.histograms[cls] = LatencyHistogram()
+        self._by_status[status] = hist
+        return hist
+
+    @property
+    def blocked(self) -> int:
+        return sum(self.blocked_counts.values())
+
+    def record(self, status: int, latency_ns: int, blocked: Optional[bool] = None):
+        """記錄一個請求結果，blocked 未指定時以 403 視為被阻擋"""
+        hist = self._by_status.get(status) or self._histogram_for(status)
+        hist.record(latency_ns // 1000)
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+        if blocked or (blocked is None and status == 403):
+            self.blocked_counts[status] = self.blocked_counts.get(status, 0) + 1
+        self.total += 1
+
+    def record_arrays(self, status: Sequence[int], latency_ns: Sequence[int]):
+        """一次記錄一塊結果：按狀態碼分組後整組寫入直方圖，不逐行處理"""
+        import numpy as np
+
+        status = np.asarray(status, dtype=np.int64)
+        latency_us = np.asarray(latency_ns, dtype=np.int64) // 1000
+        codes, counts = np.unique(status, return_counts=True)
+        for code, count in zip(codes.tolist(), counts.tolist()):
+            self.status_counts[code] = self.status_counts.get(code, 0) + count
+            if code == 403:
+                # 已保存的結果不含分類結果，只按狀態碼判斷
+                self.blocked_counts[code] = self.blocked_counts.get(code, 0) + count
+            hist = self._by_status.get(code) or self._histogram_for(code)
+            hist.record_array(latency_us[status == code] if len(codes) > 1 else latency_us)
+        self.total += int(status.size)
+
+    def merge(self, other: 'RunStats'):
+        """合併另一份統計"""
+        for status, count in other.status_counts.items():
+            self.status_counts[status] = self.status_counts.get(status, 0) + count
+        for status, count in other.blocked_counts.items():
+            self.blocked_counts[status] = self.blocked_counts.get(status, 0) + count
+        for cls, hist in other.histograms.items():
+            if cls not in self.histograms:
+                self.histograms[cls] = LatencyHistogram(hist.highest_us, hist.significant_figures)
+            self.histograms[cls].merge(hist)
+        self._by_status.clear()
+        self.total += other.total
+
+    def overall(self) -> LatencyHistogram:
+        """所有狀態類別合併後的直方圖"""
+        merged = LatencyHistogram()
+        for hist in self.histograms.values():
+            merged.merge(hist)
+        return merged
+
+    def latency_summary(self) -> Dict[str, Dict[str, float]]:
+        """各狀態類別的延遲摘要（毫秒），最後一項為全部請求"""
+        summary = {}
+        items = sorted(self.histograms.items())
+        items.append(('all', self.overall()))
+        for cls, hist in items:
+            row = {'count': hist.total, 'mean': hist.mean_us / 1000}
+            for pct, value in hist.percentiles(PERCENTILES).items():
+                row[f'p{pct:g}'] = value / 1000
+            row['max'] = hist.max_us / 1000
+            summary[cls] = row
+        return summary
+
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化為可用JSON傳輸的字典"""
+        return {
+            'total': self.total,
+            'status_counts': [[status, count] for status, count in self.status_counts.items()],
+            'blocked_counts': [[status, count] for status, count in self.blocked_counts.items()],
+            'histograms': {cls: hist.to_dict() for cls, hist in self.histograms.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'RunStats':
+        """由 to_dict 的結果還原統計"""
+        stats = cls()
+        stats.total = data['total']
+        stats.status_counts = {int(status): count for status, count in data['status_counts']}
+        stats.blocked_counts = {int(status): count for status, count in data['blocked_counts']}
+        stats.histograms = {name: LatencyHistogram.from_dict(hist)
+                            for name, hist in data['histograms'].items()}
+        return stats
+
+    @classmethod
+    def from_columns(cls, columns: Iterable[Tuple[Sequence[int], Sequence[int]]]) -> 'RunStats':
+        """由已保存結果的 (狀態碼, 延遲納秒) 欄位塊重建統計，每塊向量化處理"""
+        stats = cls()
+        for status, latency_ns in columns:
+            stats.record_arrays(status, latency_ns)
+        return stats
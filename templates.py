@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from multidict import CIMultiDict, CIMultiDictProxy, MultiDict
+from yarl import URL
+
+from selection import WEIGHT_KEY
+
+DEFAULT_USER_AGENT = 'WAF-Tester/1.0'
+# 按需編譯的模板最多緩存的數量，超出後丟棄最早編譯的
+TEMPLATE_CACHE_SIZE = 65536
+
+
+class RequestTemplate(NamedTuple):
+    """預編譯的請求：最終編碼好的URL和共享的只讀Headers"""
+    url: URL
+    headers: CIMultiDictProxy
+
+
+def compile_headers(headers: Optional[Dict]) -> CIMultiDictProxy:
+    """構建所有請求共享的只讀Headers，未指定User-Agent時使用默認值"""
+    compiled = CIMultiDict(headers or {})
+    if not compiled.get('User-Agent'):
+        compiled['User-Agent'] = DEFAULT_USER_AGENT
+    return CIMultiDictProxy(compiled)
+
+
+def compile_url(base: URL, params: Optional[Dict] = None) -> URL:
+    """將參數編碼進URL（與 aiohttp 處理 params 的方式相同：追加在原有查詢串之後）"""
+    url = base
+    if params and WEIGHT_KEY in params:
+        # 權重只用於選擇參數項，不發送
+        params = {key: value for key, value in params.items() if key != WEIGHT_KEY}
+    if params:
+        query = MultiDict(base.query)
+        query.extend(base.with_query(params).query)
+        url = base.with_query(query)
+    # 以已編碼的形式保存，發送時不再重新編碼
+    return URL(str(url), encoded=True)
+
+
+class LazyTemplates:
+    """按需編譯的請求模板：參數項被抽中時才解碼並編譯，已編譯的模板有上限地緩存
+
+    用於內存映射的大型參數列表，載入時不需要遍歷所有參數項。
+    """
+
+    def __init__(self, url: str, params_list: Sequence[Dict], headers: CIMultiDictProxy,
+                 cache_size: int = TEMPLATE_CACHE_SIZE):
+        self.base = URL(url)
+        self.params_list = params_list
+        self.headers = headers
+        self.cache_size = cache_size
+        self._cache: Dict[int, RequestTemplate] = {}
+
+    def __len__(self) -> int:
+        return len(self.params_list)
+
+    def __getitem__(self, idx: int) -> RequestTemplate:
+        template = self._cache.get(idx)
+        if template is None:
+            try:
+                template = RequestTemplate(compile_url(self.base, self.params_list[idx]), self.headers)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"參數文件第{idx + 1}項無法編碼為URL：{e}")
+            if len(self._cache) >= self.cache_size:
+                del self._cache[next(iter(self._cache))]
+            self._cache[idx] = template
+        return template
+
+
+def compile_templates(url: str, params_list: List[Dict], headers: CIMultiDictProxy) -> List[RequestTemplate]:
+    """為每個參數項預編譯請求模板"""
+    base = URL(url)
+    templates = []
+    for i, params in enumerate(params_list):
+        try:
+            templates.append(RequestTemplate(compile_url(base, params), headers))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"參數文件第{i + 1}項無法編碼為URL：{e}")
+    return templates
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+from aiohttp import web
+
+# 模塊位於倉庫根目錄，與 benchmarks 相同按路徑導入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def serve():
+    """在後台線程的事件循環中運行 aiohttp 應用；serve(app) 返回臨時分配的端口"""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    runners = []
+
+    async def setup(app: web.Application) -> web.AppRunner:
+        # 測試結束時不等待仍在處理的慢請求
+        runner = web.AppRunner(app, shutdown_timeout=0.1)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', 0).start()
+        return runner
+
+    def start(app: web.Application) -> int:
+        runner = asyncio.run_coroutine_threadsafe(setup(app), loop).result()
+        runners.append(runner)
+        return runner.addresses[0][1]
+
+    async def cancel_handlers():
+        # 客戶端斷開後 aiohttp 不取消處理函數，慢請求的處理函數可能仍在等待
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    yield start
+    for runner in runners:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+    asyncio.run_coroutine_threadsafe(cancel_handlers(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
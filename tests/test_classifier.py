@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import asyncio
+import pickle
+
+import pytest
+
+import classifier
+from classifier import ResponseClassifier, read_prefix
+
+SIGNATURES = [
+    {'name': 'cloudflare', 'status': [403, 503], 'headers': {'Server': 'cloudflare'}},
+    {'name': 'challenge', 'status': [200, 429], 'body': r'cf-chl-|Checking your browser'},
+    {'name': 'captcha', 'body': r'captcha', 'ignore_case': True},
+    {'name': 'repeat', 'body': r'(blocked)-\1'},
+    {'name': 'rate', 'status': 429},
+]
+
+
+@pytest.fixture
+def clf():
+    return ResponseClassifier.from_dict(SIGNATURES)
+
+
+def test_combined_matchers_group_by_flags(clf):
+    # 區分大小寫的特徵合併為一個正則，不區分大小寫的一個，含反向引用的單獨匹配
+    assert len(clf._matchers) == 3
+
+
+@pytest.mark.parametrize('status, headers, body, expected', [
+    (403, {'Server': 'cloudflare'}, b'', 0),
+    (403, {'Server': 'nginx'}, b'', None),
+    (200, {}, b'<p>Checking your browser</p>', 1),
+    (200, {}, b'<div id="cf-chl-widget">', 1),
+    (404, {}, b'Checking your browser', None),
+    (200, {}, b'please solve the CAPTCHA', 2),
+    (500, {}, b'blocked-blocked', 3),
+    (500, {}, b'blocked-allowed', None),
+    (429, {}, b'too many requests', 4),
+    # 按文件順序：第一個匹配的特徵
+    (429, {}, b'Checking your browser', 1),
+    (200, {}, b'hello', None),
+])
+def test_classify(clf, status, headers, body, expected):
+    assert clf.classify(status, headers, body) == expected
+
+
+def test_wants_body(clf):
+    assert clf.wants_body(200)
+    # 沒有狀態碼限制的響應體特徵適用於所有狀態碼
+    assert clf.wants_body(404)
+    only_headers = ResponseClassifier.from_dict(SIGNATURES[:1])
+    assert not only_headers.wants_body(403)
+
+
+def test_body_cache_skips_rescan(clf, monkeypatch):
+    body = b'<html>Checking your browser</html>'
+    assert clf.classify(200, {}, body) == 1
+    assert len(clf._cache) == 1
+
+    class Fail:
+        def search(self, data):
+            raise AssertionError("重複的響應體應從緩存取得結果")
+    monkeypatch.setattr(clf, '_matchers', [Fail()])
+    monkeypatch.setattr(clf, '_body', {i: Fail() for i in clf._body})
+    assert clf.classify(200, {}, body) == 1
+    assert clf.classify(429, {}, body) == 1
+
+
+def test_body_cache_is_bounded(clf, monkeypatch):
+    monkeypatch.setattr(classifier, 'BODY_CACHE_SIZE', 4)
+    for i in range(10):
+        clf.classify(200, {}, f'page {i}'.encode())
+    assert len(clf._cache) == 4
+
+
+def test_invalid_signatures():
+    with pytest.raises(ValueError):
+        ResponseClassifier.from_dict([])
+    with pytest.raises(ValueError):
+        ResponseClassifier.from_dict([{'name': 'empty'}])
+    with pytest.raises(ValueError):
+        ResponseClassifier.from_dict([{'body': '('}])
+    with pytest.raises(ValueError):
+        ResponseClassifier.from_dict([{'status': 'x'}])
+    with pytest.raises(ValueError):
+        ResponseClassifier.from_dict({'signatures': [{'status': 403}], 'body_bytes': 0})
+
+
+def test_round_trip_and_pickle(clf):
+    other = pickle.loads(pickle.dumps(clf))
+    assert other.to_dict() == clf.to_dict()
+    assert other.classify(200, {}, b'cf-chl-x') == 1
+
+
+def test_read_prefix_stops_at_limit():
+    class Stream:
+        def __init__(self, chunks):
+            self.chunks = list(chunks)
+
+        async def read(self, n):
+            if not self.chunks:
+                return b''
+            chunk = self.chunks.pop(0)
+            if len(chunk) > n:
+                self.chunks.insert(0, chunk[n:])
+                chunk = chunk[:n]
+            return chunk
+
+    assert asyncio.run(read_prefix(Stream([b'abc', b'defgh', b'ij']), 6)) == b'abcdef'
+    assert asyncio.run(read_prefix(Stream([b'ab']), 6)) == b'ab'
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import json
+import os
+import pickle
+
+import pytest
+
+import corpus
+from corpus import INDEX_SUFFIX, Corpus
+
+
+def write(path, data: bytes):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+def test_text_lines_skip_blank_lines(tmp_path):
+    path = write(tmp_path / 'p.txt', b'id=1\n\n  \nq=<script>\r\nlast')
+    params = Corpus(path, cache_index=False)
+    assert len(params) == 3
+    assert list(params) == [{'param': 'id=1'}, {'param': 'q=<script>'}, {'param': 'last'}]
+    assert params[-1] == {'param': 'last'}
+    with pytest.raises(IndexError):
+        params[3]
+
+
+def test_json_items_across_chunk_boundaries(tmp_path, monkeypatch):
+    # 很小的讀取塊，對象和多字節字符都會跨越塊邊界
+    monkeypatch.setattr(corpus, 'JSON_CHUNK_BYTES', 7)
+    items = [{'q': f'值{i}', 'nested': {'a': [i, '}]"']}} for i in range(50)]
+    path = write(tmp_path / 'p.json', b'\xef\xbb\xbf' + json.dumps(items, ensure_ascii=False).encode('utf-8'))
+    params = Corpus(path, cache_index=False)
+    assert list(params) == items
+
+
+def test_invalid_json_raises(tmp_path):
+    with pytest.raises(ValueError):
+        Corpus(write(tmp_path / 'bad.json', b'[{"a": 1},'), cache_index=False)
+    with pytest.raises(ValueError):
+        Corpus(write(tmp_path / 'empty.json', b''), cache_index=False)
+
+
+def test_empty_text_file(tmp_path):
+    params = Corpus(write(tmp_path / 'empty.txt', b''))
+    assert len(params) == 0
+    assert not params
+
+
+def test_index_cache_is_written_and_reused(tmp_path, monkeypatch):
+    path = write(tmp_path / 'p.txt', b'a\nb\nc\n')
+    first = Corpus(path)
+    assert os.path.exists(path + INDEX_SUFFIX)
+
+    def fail(self):
+        raise AssertionError("索引應從緩存讀取")
+    monkeypatch.setattr(Corpus, '_build_index', fail)
+    second = Corpus(path)
+    assert second._offsets == first._offsets
+    assert list(second) == [{'param': 'a'}, {'param': 'b'}, {'param': 'c'}]
+
+
+def test_index_cache_invalidated_by_size_change(tmp_path):
+    path = write(tmp_path / 'p.txt', b'a\nb\n')
+    Corpus(path)
+    with open(path, 'ab') as f:
+        f.write(b'c\n')
+    assert list(Corpus(path)) == [{'param': 'a'}, {'param': 'b'}, {'param': 'c'}]
+
+
+def test_index_cache_invalidated_by_mtime_change(tmp_path):
+    path = write(tmp_path / 'p.txt', b'aa\nbb\n')
+    Corpus(path)
+    stat = os.stat(path)
+    # 大小不變、內容和修改時間改變
+    write(path, b'aa\n\nb\n')
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert list(Corpus(path)) == [{'param': 'aa'}, {'param': 'b'}]
+
+
+def test_corrupt_index_cache_is_rebuilt(tmp_path):
+    path = write(tmp_path / 'p.txt', b'a\nb\n')
+    Corpus(path)
+    with open(path + INDEX_SUFFIX, 'r+b') as f:
+        f.truncate(10)
+    assert list(Corpus(path)) == [{'param': 'a'}, {'param': 'b'}]
+
+
+def test_no_cache_leaves_no_index_file(tmp_path):
+    path = write(tmp_path / 'p.txt', b'a\n')
+    Corpus(path, cache_index=False)
+    assert not os.path.exists(path + INDEX_SUFFIX)
+
+
+def test_pickle_remaps_file(tmp_path):
+    path = write(tmp_path / 'p.txt', b'x\ny\n')
+    for cache_index in (True, False):
+        params = pickle.loads(pickle.dumps(Corpus(path, cache_index)))
+        assert list(params) == [{'param': 'x'}, {'param': 'y'}]
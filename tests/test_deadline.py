@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+
+from config import Config
+from waf_tester import WAFTester
+
+
+@pytest.fixture
+def slow_url(serve):
+    """第一個請求 30 秒後才響應，其餘請求 0.4 秒"""
+    count = [0]
+
+    async def slow(request: web.Request) -> web.Response:
+        count[0] += 1
+        await asyncio.sleep(30 if count[0] == 1 else 0.4)
+        return web.Response(text='ok')
+
+    async def hang(request: web.Request) -> web.Response:
+        await asyncio.sleep(30)
+        return web.Response(text='ok')
+
+    app = web.Application()
+    app.router.add_get('/slow', slow)
+    app.router.add_get('/hang', hang)
+    return f'http://127.0.0.1:{serve(app)}'
+
+
+def run(config: Config):
+    tester = WAFTester(config)
+    start = time.monotonic()
+    tester.run()
+    return tester, time.monotonic() - start
+
+
+def test_run_ends_by_duration_plus_grace(slow_url):
+    config = Config(url=f'{slow_url}/slow', threads=2, duration=1, rate_limit=0, grace_period=1,
+                    output_format='memory')
+    tester, wall = run(config)
+    # 30 秒的請求在寬限期結束時被取消
+    assert 1.9 <= wall < 2.6
+
+    # 另一個工作協程在截止前完成 0、0.4、0.8 秒發出的請求中的前兩個，第三個在寬限期內完成
+    assert tester.drained == 1
+    assert tester.cancelled == 1
+    assert tester.in_flight_at_deadline == tester.drained + tester.cancelled == 2
+    assert tester.in_flight == 0
+
+    # 被取消的請求不計入結果
+    assert tester.stats.total == len(tester.results) == 3
+    assert tester.stats.status_counts == {200: 3}
+    statuses = [s for batch in tester.results.batches for s in batch.column('status')]
+    assert statuses == [200, 200, 200]
+    assert tester.error_types == {}
+
+
+def test_zero_grace_cancels_at_deadline(slow_url):
+    config = Config(url=f'{slow_url}/hang', threads=3, duration=1, rate_limit=0, grace_period=0,
+                    output_format='memory')
+    tester, wall = run(config)
+    assert wall < 1.6
+    assert tester.cancelled == tester.in_flight_at_deadline == 3
+    assert tester.drained == 0
+    assert tester.in_flight == 0
+    assert tester.stats.total == len(tester.results) == 0
+
+
+def test_client_timeout_is_split():
+    config = Config(url='http://127.0.0.1/', threads=1, duration=1, rate_limit=0, connect_timeout=2, read_timeout=5, total_timeout=0)
+    timeout = WAFTester(config)._client_timeout()
+    assert (timeout.total, timeout.sock_connect, timeout.sock_read) == (None, 2, 5)
+    config = Config(url='http://127.0.0.1/', threads=1, duration=1, rate_limit=0, connect_timeout=0, read_timeout=0, total_timeout=7)
+    timeout = WAFTester(config)._client_timeout()
+    assert (timeout.total, timeout.sock_connect, timeout.sock_read) == (7, None, None)
+
+
+def test_read_timeout_is_an_error_not_a_cancellation(slow_url):
+    config = Config(url=f'{slow_url}/hang', threads=2, duration=1, rate_limit=0, grace_period=1,
+                    read_timeout=0.3, total_timeout=0, output_format='memory')
+    tester, wall = run(config)
+    # 讀取超時在截止前結束請求，不需要等待寬限期
+    assert wall < 1.9
+    assert tester.cancelled == 0
+    assert tester.stats.total == tester.stats.status_counts[-1] >= 4
+    assert list(tester.error_types) == ['SocketTimeoutError']
+    assert tester.in_flight == 0
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import asyncio
+import os
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+import distributed
+from config import Config
+from corpus import Corpus
+from distributed import TOKEN_HEADER, Agent, config_from_dict, config_to_dict, run_controller, split_for_agents
+from stats import RunStats
+from waf_tester import WAFTester
+
+TOKEN = 'secret'
+
+
+async def target(request: web.Request) -> web.Response:
+    # 每三個請求中有一個被阻擋
+    target.count = getattr(target, 'count', 0) + 1
+    return web.Response(status=403 if target.count % 3 == 0 else 200, text='ok')
+
+
+@pytest.fixture
+def target_url(serve):
+    app = web.Application()
+    app.router.add_get('/', target)
+    return f'http://127.0.0.1:{serve(app)}/'
+
+
+@pytest.fixture
+def agents(serve):
+    """兩個監聽臨時端口的代理，返回代理地址列表"""
+    urls = []
+    for _ in range(2):
+        agent = Agent(TOKEN)
+        agent.port = serve(agent.make_app())
+        urls.append(f'http://127.0.0.1:{agent.port}')
+    return urls
+
+
+@pytest.fixture
+def params_file(tmp_path):
+    path = tmp_path / 'params.txt'
+    path.write_text(''.join(f'id={i}\n' for i in range(100)))
+    return str(path)
+
+
+def test_controller_merges_agent_stats(tmp_path, monkeypatch, target_url, agents, params_file):
+    monkeypatch.chdir(tmp_path)
+    received = []
+    original_from_dict = distributed.config_from_dict
+
+    def recording_from_dict(data):
+        config = original_from_dict(data)
+        received.append(config)
+        return config
+    monkeypatch.setattr(distributed, 'config_from_dict', recording_from_dict)
+
+    config = Config(url=target_url, threads=5, duration=1, rate_limit=41, params_file=params_file,
+                    selection='round-robin', grace_period=1)
+    tester = WAFTester(config)
+    payloads = []
+    merge_stats = tester.merge_stats
+
+    def recording_merge(payload):
+        payloads.append(payload)
+        merge_stats(payload)
+    monkeypatch.setattr(tester, 'merge_stats', recording_merge)
+
+    run_controller(tester, agents, TOKEN, start_delay=0.2)
+
+    # 並發線程數和速率在代理間平均分配，各代理負責互不重疊的參數分片
+    assert sorted((c.threads, c.rate_limit) for c in received) == [(2, 20), (3, 21)]
+    assert sorted((c.shard_index, c.shard_count) for c in received) == [(0, 2), (1, 2)]
+    assert all(len(c._params) == 100 for c in received)
+
+    # 合併後的統計等於各代理導出統計之和
+    assert len(payloads) == 2
+    parts = [RunStats.from_dict(payload['stats']) for payload in payloads]
+    assert tester.stats.total == sum(part.total for part in parts) > 0
+    assert tester.stats.blocked == sum(part.blocked for part in parts) > 0
+    for status in (200, 403):
+        assert tester.stats.status_counts[status] == sum(part.status_counts.get(status, 0) for part in parts)
+    assert tester.stats.overall().total == tester.stats.total
+    assert tester.payload_stats is not None
+    assert sum(tester.payload_stats.sent(i) for i in range(100)) == tester.stats.total
+    # 開環速率 41/s 運行 1 秒
+    assert 30 <= tester.stats.total <= 50
+
+    # 詳細結果按代理端口分開保存
+    for url in agents:
+        port = url.rsplit(':', 1)[1]
+        assert os.path.exists(tmp_path / f'detailed_results.agent{port}.csv')
+
+
+def test_wrong_token_is_rejected(target_url, agents):
+    config = Config(url=target_url, threads=2, duration=1, rate_limit=0, output_format='none')
+    with pytest.raises(RuntimeError, match='401'):
+        run_controller(WAFTester(config), agents, 'wrong', start_delay=0.1)
+
+    async def post(token):
+        headers = {TOKEN_HEADER: token} if token else {}
+        async with aiohttp.ClientSession() as session:
+            async with session.post(f'{agents[0]}/run', json={}, headers=headers) as resp:
+                return resp.status
+    assert asyncio.run(post(None)) == 401
+    assert asyncio.run(post('wrong')) == 401
+
+
+def test_agent_rejects_invalid_config(agents):
+    async def post():
+        async with aiohttp.ClientSession() as session:
+            async with session.post(f'{agents[0]}/run', json={'config': {'bogus': 1}},
+                                    headers={TOKEN_HEADER: TOKEN}) as resp:
+                return resp.status, await resp.json()
+    status, data = asyncio.run(post())
+    assert status == 400
+    assert 'bogus' in data['error']
+
+
+def test_split_for_agents_limits(target_url, tmp_path):
+    config = Config(url=target_url, threads=3, duration=1, rate_limit=10, processes=2, output_format='none')
+    parts = split_for_agents(config, 3)
+    assert [(c.threads, c.rate_limit, c.processes) for c in parts] == [(1, 4, 1), (1, 3, 1), (1, 3, 1)]
+    with pytest.raises(ValueError):
+        split_for_agents(config, 4)
+    with pytest.raises(ValueError):
+        split_for_agents(Config(url=target_url, threads=8, duration=1, rate_limit=2), 3)
+    log = tmp_path / 'access.log'
+    log.write_text('')
+    with pytest.raises(ValueError):
+        split_for_agents(Config(url=target_url, threads=4, duration=1, rate_limit=0, replay_file=str(log)), 2)
+
+
+def test_small_params_are_inlined(params_file):
+    config = Config(url='http://127.0.0.1/', threads=1, duration=1, rate_limit=0, params_file=params_file)
+    data = config_to_dict(config)
+    assert 'params_file' not in data
+    assert data['params'][:2] == [{'param': 'id=0'}, {'param': 'id=1'}]
+    restored = config_from_dict(data)
+    assert list(restored._params) == list(config._params)
+
+
+def test_large_params_are_sent_as_path_and_hash(params_file, monkeypatch):
+    monkeypatch.setattr(distributed, 'MAX_INLINE_PARAMS_BYTES', 100)
+    config = Config(url='http://127.0.0.1/', threads=1, duration=1, rate_limit=0, params_file=params_file)
+    data = config_to_dict(config)
+    assert 'params' not in data
+    assert data['params_file'] == os.path.abspath(params_file)
+    assert len(data['params_sha256']) == 64
+
+    restored = config_from_dict(data)
+    assert isinstance(restored._params, Corpus)
+    assert list(restored._params) == list(config._params)
+    assert restored._templates[5].url == config._templates[5].url
+
+    # 代理上的文件內容不同或不存在時拒絕
+    with open(params_file, 'a') as f:
+        f.write('extra\n')
+    with pytest.raises(ValueError, match='不一致'):
+        config_from_dict(data)
+    with pytest.raises(ValueError, match='相同路徑'):
+        config_from_dict(dict(data, params_file=params_file + '.missing'))
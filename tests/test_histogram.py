@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import numpy as np
+import pytest
+
+from histogram import LatencyHistogram
+
+PERCENTILES = (1, 25, 50, 75, 90, 99, 99.9, 100)
+
+
+@pytest.fixture
+def values():
+    # 對數正態分佈的延遲（微秒），跨越數個數量級
+    rng = np.random.default_rng(42)
+    return rng.lognormal(mean=9, sigma=1.5, size=50_000).astype(np.int64)
+
+
+def recorded(values) -> LatencyHistogram:
+    hist = LatencyHistogram()
+    for value in values.tolist():
+        hist.record(value)
+    return hist
+
+
+def assert_close_to_numpy(hist: LatencyHistogram, values):
+    """百分位數不小於精確值（取桶上界），相對誤差不超過一個子桶寬度"""
+    # 兩位有效數字：每個2的冪區間分為128個線性子桶
+    tolerance = 1 / 128
+    result = hist.percentiles(PERCENTILES)
+    for pct in PERCENTILES:
+        exact = int(np.percentile(values, pct, method='inverted_cdf'))
+        assert exact <= result[pct] <= exact * (1 + tolerance) + 1, pct
+
+
+def test_percentiles_match_numpy(values):
+    hist = recorded(values)
+    assert_close_to_numpy(hist, values)
+    assert hist.total == len(values)
+    assert hist.min_us == values.min()
+    assert hist.max_us == values.max()
+    assert hist.mean_us == pytest.approx(values.mean())
+    assert hist.percentile(100) == values.max()
+
+
+def test_small_values_are_exact():
+    values = np.arange(1, 201)
+    hist = recorded(values)
+    for pct in PERCENTILES:
+        assert hist.percentile(pct) == int(np.percentile(values, pct, method='inverted_cdf'))
+
+
+def test_record_array_matches_record(values):
+    vectorized = LatencyHistogram()
+    vectorized.record_array(values)
+    scalar = recorded(values)
+    assert vectorized.counts == scalar.counts
+    assert (vectorized.total, vectorized.sum_us, vectorized.min_us, vectorized.max_us) == \
+        (scalar.total, scalar.sum_us, scalar.min_us, scalar.max_us)
+
+
+def test_merge_equals_single_histogram(values):
+    merged = LatencyHistogram()
+    for part in np.array_split(values, 4):
+        merged.merge(recorded(part))
+    single = recorded(values)
+    assert merged.counts == single.counts
+    assert (merged.total, merged.sum_us, merged.min_us, merged.max_us) == \
+        (single.total, single.sum_us, single.min_us, single.max_us)
+    assert_close_to_numpy(merged, values)
+
+
+def test_merge_empty_keeps_min():
+    hist = LatencyHistogram()
+    hist.record(500)
+    hist.merge(LatencyHistogram())
+    assert (hist.total, hist.min_us, hist.max_us) == (1, 500, 500)
+
+
+def test_merge_rejects_different_config():
+    with pytest.raises(ValueError):
+        LatencyHistogram().merge(LatencyHistogram(significant_figures=3))
+
+
+def test_values_are_clamped():
+    hist = LatencyHistogram(highest_us=1_000_000)
+    hist.record(-5)
+    hist.record(5_000_000)
+    assert hist.min_us == 0
+    assert hist.max_us == 1_000_000
+    assert hist.percentile(100) == 1_000_000
+
+
+def test_empty_histogram():
+    hist = LatencyHistogram()
+    assert hist.percentiles((50, 99)) == {50: 0, 99: 0}
+    assert hist.mean_us == 0.0
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import pytest
+
+from load_profile import KNEE_GAIN_RATIO, KNEE_P99_RATIO, KNEE_RATE_JUMP, LoadProfile, Stage, find_knee
+
+
+def row(rate, throughput, p99=10.0, blocked_rate=0.0, error_rate=0.0, threads=None):
+    return {'rate': rate, 'threads': threads, 'throughput': throughput, 'p99': p99,
+            'blocked_rate': blocked_rate, 'error_rate': error_rate}
+
+
+def test_knee_requires_flat_throughput_and_degradation():
+    rows = [row(100, 100), row(200, 198), row(400, 210, p99=40.0), row(800, 215, p99=200.0)]
+    assert find_knee(rows) == 2
+    # 吞吐量持平但延遲和比例沒有變化：不是拐點
+    assert find_knee([row(100, 100), row(200, 100)]) is None
+    # 延遲跳升但吞吐量仍隨負載上升：不是拐點
+    assert find_knee([row(100, 100), row(200, 200, p99=100.0)]) is None
+
+
+def test_knee_gain_threshold():
+    # 負載翻倍（增幅 100%），吞吐量增幅恰好達到 KNEE_GAIN_RATIO 倍時仍視為隨負載上升
+    at = 100 * (1 + KNEE_GAIN_RATIO)
+    assert find_knee([row(100, 100), row(200, at, p99=50.0)]) is None
+    assert find_knee([row(100, 100), row(200, at - 1, p99=50.0)]) == 1
+
+
+def test_knee_p99_threshold():
+    assert find_knee([row(100, 100), row(200, 100, p99=10.0 * KNEE_P99_RATIO)]) == 1
+    assert find_knee([row(100, 100), row(200, 100, p99=10.0 * KNEE_P99_RATIO - 0.1)]) is None
+    # 上一階段沒有延遲數據時不按延遲判斷
+    assert find_knee([row(100, 100, p99=0.0), row(200, 100, p99=50.0)]) is None
+
+
+@pytest.mark.parametrize('field', ['blocked_rate', 'error_rate'])
+def test_knee_rate_jump_threshold(field):
+    base = {field: 0.10}
+    assert find_knee([row(100, 100, **base), row(200, 100, **{field: 0.10 + KNEE_RATE_JUMP})]) == 1
+    assert find_knee([row(100, 100, **base), row(200, 100, **{field: 0.10 + KNEE_RATE_JUMP - 0.01})]) is None
+
+
+def test_knee_skips_stages_without_more_load():
+    rows = [row(200, 200), row(200, 150, p99=100.0), row(100, 90, p99=200.0)]
+    assert find_knee(rows) is None
+    # 上一階段沒有吞吐量時無法比較
+    assert find_knee([row(100, 0), row(200, 0, p99=100.0)]) is None
+    # 按並發數分階段時比較並發數
+    rows = [row(None, 100, threads=10), row(None, 105, p99=30.0, threads=20)]
+    assert find_knee(rows) == 1
+
+
+def test_target_at_step():
+    profile = LoadProfile([Stage(10, rate=100), Stage(5, rate=200), Stage(5, rate=50)])
+    assert profile.target_at(0) == (0, None, 100)
+    assert profile.target_at(9.99) == (0, None, 100)
+    assert profile.target_at(10) == (1, None, 200)
+    assert profile.target_at(15) == (2, None, 50)
+    # 最後一個階段之後保持最後的目標
+    assert profile.target_at(100) == (2, None, 50)
+    assert profile.mean_rate() == pytest.approx((100 * 10 + 200 * 5 + 50 * 5) / 20)
+
+
+def test_target_at_linear():
+    profile = LoadProfile([Stage(10, threads=11, ramp='linear'), Stage(10, threads=31, ramp='linear'),
+                           Stage(10, threads=31)])
+    # 第一個階段從 1 開始
+    assert profile.target_at(0) == (0, 1, None)
+    assert profile.target_at(5) == (0, 6, None)
+    # 之後從上一階段的目標開始
+    assert profile.target_at(10) == (1, 11, None)
+    assert profile.target_at(15) == (1, 21, None)
+    assert profile.target_at(19.99) == (1, 31, None)
+    assert profile.target_at(25) == (2, 31, None)
+
+
+def test_mean_rate_linear():
+    profile = LoadProfile.from_dict({'ramp': 'linear', 'stages': [{'duration': 10, 'rate': 101},
+                                                                  {'duration': 10, 'rate': 101}]})
+    # 第一個階段由 1 線性升到 101，面積 510；第二個階段保持 101
+    assert profile.mean_rate() == pytest.approx((510 + 1010) / 20)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import json
+
+import pytest
+
+from config import Config
+from multiproc import _split, merge_snapshots, split_config
+from selection import ParamSelector
+
+
+@pytest.mark.parametrize('total, parts', [(10, 3), (7, 7), (0, 4), (1000, 6)])
+def test_split_sums_to_total(total, parts):
+    values = _split(total, parts)
+    assert len(values) == parts
+    assert sum(values) == total
+    assert max(values) - min(values) <= 1
+
+
+def test_split_config_parts_sum_to_totals():
+    config = Config(url='http://127.0.0.1/', threads=10, duration=5, rate_limit=101, processes=3,
+                    metrics_port=9100, output_format='csv')
+    parts = split_config(config, 3)
+    assert [c.threads for c in parts] == [4, 3, 3]
+    assert [c.rate_limit for c in parts] == [34, 34, 33]
+    assert sum(c.threads for c in parts) == config.threads
+    assert sum(c.rate_limit for c in parts) == config.rate_limit
+    assert [c.metrics_port for c in parts] == [9100, 9101, 9102]
+    assert [(c.shard_index, c.shard_count) for c in parts] == [(0, 3), (1, 3), (2, 3)]
+    assert all(c.processes == 1 for c in parts)
+    # 原配置不受影響
+    assert (config.threads, config.rate_limit, config.processes) == (10, 101, 3)
+
+
+def test_split_config_subdivides_agent_shards(tmp_path):
+    params = tmp_path / 'params.txt'
+    params.write_text(''.join(f'id={i}\n' for i in range(23)))
+    # 代理 1/2 再拆成 3 個進程：6 個分片覆蓋所有參數項且互不重疊
+    owned = []
+    for agent in range(2):
+        config = Config(url='http://127.0.0.1/', threads=3, duration=5, rate_limit=0, processes=3,
+                        params_file=str(params), selection='exhaustive', output_format='csv',
+                        shard_index=agent, shard_count=2)
+        for child in split_config(config, 3):
+            assert child.shard_count == 6
+            select = ParamSelector('exhaustive', child._params, None, child.shard_index,
+                                   child.shard_count).for_worker(0)
+            idx = select()
+            while idx is not None:
+                owned.append(idx)
+                idx = select()
+    assert sorted(owned) == list(range(23))
+
+
+def test_split_config_splits_profile_stages(tmp_path):
+    profile = tmp_path / 'profile.json'
+    profile.write_text(json.dumps([{'duration': 2, 'rate': 10}, {'duration': 3, 'rate': 25, 'ramp': 'linear'}]))
+    config = Config(url='http://127.0.0.1/', threads=8, duration=5, rate_limit=0, processes=4,
+                    profile_file=str(profile), output_format='csv')
+    parts = split_config(config, 4)
+    for index, stage in enumerate(config._profile.stages):
+        rates = [c._profile.stages[index].rate for c in parts]
+        assert sum(rates) == stage.rate
+        assert all(c._profile.stages[index].ramp == stage.ramp for c in parts)
+        assert all(c._profile.stages[index].threads is None for c in parts)
+    assert [c._profile.stages[1].rate for c in parts] == [7, 6, 6, 6]
+
+
+def snapshot(**values):
+    base = {'rps': 0.0, 'p50': 0.0, 'p99': 0.0, 'blocked_rate': 0.0, 'error_rate': 0.0, 'elapsed': 0.0,
+            'total': 0, 'stage': None, 'saturated': False, 'in_flight': 0, 'concurrency': None}
+    base.update(values)
+    return base
+
+
+def test_merge_snapshots():
+    merged = merge_snapshots([
+        snapshot(rps=300, p50=5, p99=40, blocked_rate=0.1, error_rate=0.0, elapsed=3.0, total=900,
+                 stage=2, in_flight=4, concurrency=8),
+        snapshot(rps=100, p50=8, p99=20, blocked_rate=0.5, error_rate=0.2, elapsed=3.2, total=310,
+                 stage=1, saturated=True, in_flight=1, concurrency=2),
+    ])
+    assert merged['rps'] == 400
+    assert (merged['p50'], merged['p99']) == (8, 40)
+    # 比率按吞吐量加權
+    assert merged['blocked_rate'] == pytest.approx((300 * 0.1 + 100 * 0.5) / 400)
+    assert merged['error_rate'] == pytest.approx(100 * 0.2 / 400)
+    assert merged['elapsed'] == 3.2
+    assert merged['total'] == 1210
+    assert merged['stage'] == 2
+    assert merged['saturated'] is True
+    assert merged['in_flight'] == 5
+    assert merged['concurrency'] == 10
+
+
+def test_merge_idle_snapshots():
+    merged = merge_snapshots([snapshot(total=5), snapshot(total=7)])
+    assert merged['rps'] == 0
+    assert merged['blocked_rate'] == merged['error_rate'] == 0.0
+    assert merged['stage'] is None
+    assert merged['concurrency'] is None
+    assert merged['total'] == 12
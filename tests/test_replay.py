@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import asyncio
+import gzip
+import json
+import time
+
+import pytest
+from multidict import CIMultiDict, CIMultiDictProxy
+
+import replay as replay_module
+from records import RecordStore
+from replay import LogEntry, ReplaySource, detect_format, parse_clf_time, parse_combined, parse_jsonl, parse_time
+from result_sink import create_sink
+
+# 2000-10-10 20:55:36 UTC
+T0 = 971211336.0
+
+
+def combined(target: str, stamp: str = '10/Oct/2000:13:55:36 -0700', method: str = 'GET',
+             agent: str = 'Mozilla/5.0') -> str:
+    return f'127.0.0.1 - frank [{stamp}] "{method} {target} HTTP/1.1" 200 2326 "-" "{agent}"\n'
+
+
+def test_parse_clf_time_offsets():
+    assert parse_clf_time('10/Oct/2000:13:55:36 -0700') == T0
+    assert parse_clf_time('10/Oct/2000:22:25:36 +0130') == T0
+    assert parse_clf_time('10/Oct/2000:20:55:36') == T0
+
+
+@pytest.mark.parametrize('value', [T0, T0 * 1000, str(T0), '2000-10-10T20:55:36Z', '2000-10-10T22:55:36+02:00',
+                                   '2000-10-10T20:55:36', '10/Oct/2000:13:55:36 -0700'])
+def test_parse_time_formats(value):
+    assert parse_time(value) == T0
+
+
+def test_parse_combined():
+    assert parse_combined(combined('/a?b=1')) == ('GET', LogEntry(T0, '/a?b=1', 'Mozilla/5.0'))
+    assert parse_combined(combined('/x', method='POST'))[0] == 'POST'
+    # 絕對URL只取路徑，空的 User-Agent 記為 None
+    assert parse_combined(combined('http://example.com/p?q', agent='-'))[1] == LogEntry(T0, '/p?q', None)
+    assert parse_combined(combined('https://example.com'))[1].target == '/'
+    # nginx 的 \xHH 和 Apache 的 \" 轉義還原為百分號編碼
+    assert parse_combined(combined(r'/s?q=\x22a\x22'))[1].target == '/s?q=%22a%22'
+    # 沒有 Referer 和 User-Agent 的 common 格式
+    common = '10.0.0.1 - - [10/Oct/2000:13:55:36 -0700] "GET /c HTTP/1.0" 200 10\n'
+    assert parse_combined(common) == ('GET', LogEntry(T0, '/c', None))
+
+
+@pytest.mark.parametrize('line', [
+    'garbage\n',
+    combined('*', method='OPTIONS'),
+    combined('/a', stamp='10/Foo/2000:13:55:36 -0700'),
+    '127.0.0.1 - - [10/Oct/2000:13:55:36 -0700] "-" 400 0 "-" "-"\n',
+])
+def test_parse_combined_rejects(line):
+    assert parse_combined(line) is None
+
+
+def test_parse_jsonl():
+    line = json.dumps({'msec': T0 * 1000, 'method': 'get', 'uri': '/a', 'args': 'x=1', 'user_agent': 'ua'})
+    assert parse_jsonl(line) == ('GET', LogEntry(T0, '/a?x=1', 'ua'))
+    line = json.dumps({'@timestamp': '2000-10-10T20:55:36Z', 'request': 'HEAD /h?z HTTP/1.1',
+                       'http_user_agent': '-'})
+    assert parse_jsonl(line) == ('HEAD', LogEntry(T0, '/h?z', None))
+    # 沒有方法時默認為 GET，查詢串已在目標中時不再追加
+    line = json.dumps({'time': T0, 'url': 'https://example.com/p?a=1', 'query': 'b=2'})
+    assert parse_jsonl(line) == ('GET', LogEntry(T0, '/p?a=1', None))
+
+
+@pytest.mark.parametrize('line', [
+    'not json',
+    '[1, 2]',
+    json.dumps({'uri': '/no-time'}),
+    json.dumps({'time': T0}),
+    json.dumps({'time': 'yesterday', 'uri': '/a'}),
+    json.dumps({'time': T0, 'uri': 'relative'}),
+])
+def test_parse_jsonl_rejects(line):
+    assert parse_jsonl(line) is None
+
+
+def test_detect_format():
+    assert detect_format('access.log') == 'combined'
+    assert detect_format('access.log.gz') == 'combined'
+    assert detect_format('access.jsonl.gz') == 'jsonl'
+    assert detect_format('a.ndjson') == 'jsonl'
+
+
+def replay(path: str, agent_header: bool = False, **kwargs):
+    """以最大吞吐量取出 ReplaySource 給出的所有請求"""
+    headers = CIMultiDictProxy(CIMultiDict({'Accept': '*/*'}))
+    source = ReplaySource(str(path), 'auto', 'https://target.test:8443/ignored', headers,
+                          replay_user_agent=not agent_header, **kwargs)
+
+    async def run():
+        start_ns = time.monotonic_ns()
+        return [item async for item in source.requests(start_ns, start_ns + 10 ** 10, 0)]
+
+    return source, asyncio.run(run())
+
+
+def test_replay_source_stream(tmp_path):
+    lines = [combined('/a', agent='ua1'), combined('/a', agent='ua1'), 'garbage\n',
+             combined('/b', method='POST'), combined('/c', stamp='10/Oct/2000:13:55:37 -0700', agent='ua2')]
+    path = tmp_path / 'access.log.gz'
+    with gzip.open(path, 'wt') as f:
+        f.writelines(lines)
+    source, items = replay(path)
+    assert [str(template.url) for _, template, _ in items] == \
+        ['https://target.test:8443/a', 'https://target.test:8443/a', 'https://target.test:8443/c']
+    assert [template.headers['User-Agent'] for _, template, _ in items] == ['ua1', 'ua1', 'ua2']
+    assert items[0][1].headers['Accept'] == '*/*'
+    # 相同 User-Agent 的請求共享同一份只讀Headers
+    assert items[0][1].headers is items[1][1].headers
+    assert [idx for idx, _, _ in items] == [-1, -1, -1]
+    assert (source.stats.skipped, source.stats.malformed, source.stats.log_span) == (1, 1, 1.0)
+    assert source.stats.elapsed is not None
+
+
+def test_replay_source_keeps_configured_user_agent(tmp_path):
+    path = tmp_path / 'access.log'
+    path.write_text(combined('/a', agent='ua1'))
+    source, items = replay(path, agent_header=True)
+    assert 'User-Agent' not in items[0][1].headers
+    assert source._header_cache == {}
+
+
+def test_replay_source_state_stays_bounded(tmp_path, monkeypatch):
+    """目標和 User-Agent 各不相同的日誌：回放源只保留有上限的Headers緩存"""
+    monkeypatch.setattr(replay_module, 'HEADER_CACHE_SIZE', 64)
+    path = tmp_path / 'access.log'
+    path.write_text(''.join(combined(f'/item/{i}?q={i}', agent=f'ua{i}') for i in range(5000)))
+    source, items = replay(path)
+    assert len(items) == 5000
+    assert items[-1][1].url.raw_path_qs == '/item/4999?q=4999'
+    assert len(source._header_cache) == 64
+    for name, value in vars(source).items():
+        if isinstance(value, (list, dict, set)):
+            assert len(value) <= 64, name
+    assert source._queue.qsize() == 0
+
+
+def test_replay_source_shards(tmp_path):
+    path = tmp_path / 'access.jsonl'
+    path.write_text(''.join(json.dumps({'time': T0 + i, 'uri': f'/{i}'}) + '\n' for i in range(6)))
+    targets = []
+    for shard in range(2):
+        _, items = replay(path, shard_index=shard, shard_count=2)
+        targets.append([template.url.path for _, template, _ in items])
+    assert targets == [['/0', '/2', '/4'], ['/1', '/3', '/5']]
+
+
+def test_replay_timeline_spreads_whole_seconds(tmp_path):
+    path = tmp_path / 'access.log'
+    path.write_text(combined('/a') * 4 + combined('/b', stamp='10/Oct/2000:13:55:38 -0700'))
+    source = ReplaySource(str(path), 'combined', 'http://t', CIMultiDictProxy(CIMultiDict()))
+    source.start()
+
+    async def offsets():
+        return [offset for batch in [b async for b in source.batches()] for offset, _ in batch]
+
+    try:
+        assert asyncio.run(offsets()) == [0.0, 0.25, 0.5, 0.75, 2.0]
+    finally:
+        source.stop()
+
+
+@pytest.mark.parametrize('fmt', ['memory', 'columnar', 'csv'])
+def test_records_keep_replayed_targets(tmp_path, fmt):
+    """回放的請求目標和 User-Agent 隨批次保存，寫出後解碼為參數和Headers欄"""
+    path = tmp_path / 'access.log'
+    path.write_text(combined('/a?x=1', agent='ua1') + combined('/b') + combined('/c', agent='default'))
+    _, items = replay(path)
+    sink = create_sink(fmt, str(tmp_path / f'results.{fmt}'))
+    store = RecordStore(sink, None, {'User-Agent': 'default', 'Accept': '*/*'}, 2, replay=True)
+    for _, template, _ in items:
+        store.append(0, 200, 1000, -1, None, (template.url.raw_path_qs, template.headers.get('User-Agent')))
+    store.close()
+    chunks = list(sink.iter_chunks(('params', 'headers')))
+    assert [p for chunk in chunks for p in chunk['params']] == ['/a?x=1', '/b', '/c']
+    assert [h for chunk in chunks for h in chunk['headers']] == [
+        str({'User-Agent': 'ua1', 'Accept': '*/*'}),
+        str({'User-Agent': 'Mozilla/5.0', 'Accept': '*/*'}),
+        str({'User-Agent': 'default', 'Accept': '*/*'})]
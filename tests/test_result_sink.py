@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import threading
+import time
+
+import pytest
+
+from records import RecordBatch, RecordStore
+from result_sink import ColumnarSink, ResultSink, create_sink
+
+PARAMS = [{'id': str(i)} for i in range(10)]
+HEADERS = {'User-Agent': 'test'}
+
+
+def fill(store: RecordStore, count: int):
+    for i in range(count):
+        status = -1 if i % 7 == 0 else 200 + i % 3
+        error = f'error {i % 2}' if status == -1 else None
+        store.append(store.mono_anchor_ns + i * 1000, status, (i + 1) * 1_000_000, i % len(PARAMS), error)
+
+
+class SlowSink(ResultSink):
+    """寫入線程在 release 設置前阻塞，記錄寫入順序"""
+
+    def __init__(self, max_pending: int):
+        super().__init__(None, max_pending)
+        self.release = threading.Event()
+        self.written = []
+        self.file_closed = False
+
+    def _open_file(self):
+        pass
+
+    def _close_file(self):
+        self.file_closed = True
+
+    def _write_batch(self, batch):
+        self.release.wait()
+        self.written.append(batch.ts_ns[0])
+
+
+def batch(ts_ns: int) -> RecordBatch:
+    result = RecordBatch(1)
+    result.ts_ns[0] = ts_ns
+    result.size = 1
+    return result
+
+
+def test_write_batch_does_not_block_until_queue_is_full():
+    sink = SlowSink(max_pending=2)
+    # 寫入線程取走第一批後阻塞，隊列還能容納兩批
+    sink.write_batch(batch(0))
+    deadline = time.monotonic() + 5
+    while sink._queue.qsize() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    sink.write_batch(batch(1))
+    sink.write_batch(batch(2))
+    assert sink.stalls == 0
+    assert sink.stall_ns == 0
+
+    # 隊列已滿：生產者等待寫入線程，等待被計數
+    threading.Timer(0.2, sink.release.set).start()
+    start = time.monotonic()
+    sink.write_batch(batch(3))
+    assert time.monotonic() - start >= 0.15
+    assert sink.stalls == 1
+    assert sink.stall_ns >= 150_000_000
+    assert len(sink) == 4
+
+    sink.close()
+    assert sink.written == [0, 1, 2, 3]
+    assert sink.file_closed
+
+
+def test_close_flushes_pending_batches_before_closing_file():
+    sink = SlowSink(max_pending=8)
+    for i in range(5):
+        sink.write_batch(batch(i))
+    assert not sink.file_closed
+    sink.release.set()
+    sink.close()
+    assert sink.written == list(range(5))
+    assert sink.file_closed
+    # 重複關閉無副作用
+    sink.close()
+
+
+def test_writer_error_is_raised_on_close_and_next_write():
+    class FailingSink(SlowSink):
+        def _write_batch(self, batch):
+            raise OSError('disk full')
+
+    sink = FailingSink(max_pending=2)
+    sink.write_batch(batch(0))
+    deadline = time.monotonic() + 5
+    while sink._error is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    with pytest.raises(IOError, match='disk full'):
+        sink.write_batch(batch(1))
+    with pytest.raises(IOError, match='disk full'):
+        sink.close()
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'csv.gz', 'jsonl.gz', 'columnar'])
+def test_round_trip(tmp_path, fmt):
+    sink = create_sink(fmt, str(tmp_path / f'results.{fmt}'))
+    store = RecordStore(sink, PARAMS, HEADERS, batch_size=16)
+    fill(store, 50)
+    store.close()
+    assert len(sink) == 50
+
+    memory = create_sink('memory')
+    expected_store = RecordStore(memory, PARAMS, HEADERS, batch_size=16)
+    expected_store.mono_anchor_ns = store.mono_anchor_ns
+    expected_store.wall_anchor_ns = store.wall_anchor_ns
+    fill(expected_store, 50)
+    expected_store.close()
+
+    def rows(target):
+        return [row for chunk in target.iter_chunks() for row in zip(*chunk.values())]
+
+    actual, expected = rows(sink), rows(memory)
+    assert len(actual) == 50
+    for got, want in zip(actual, expected):
+        timestamp, status, response_time, params, headers, error = got
+        assert (timestamp, status, params, headers, error) == (want[0], want[1], want[3], want[4], want[5])
+        assert response_time == pytest.approx(want[2])
+
+    statuses = [int(s) for chunk, _ in sink.iter_numeric() for s in chunk]
+    latencies = [int(v) for _, chunk in sink.iter_numeric() for v in chunk]
+    assert statuses == [row[1] for row in expected]
+    assert latencies == [(i + 1) * 1_000_000 for i in range(50)]
+
+
+def test_columnar_reads_back_raw_batches(tmp_path):
+    sink = ColumnarSink(str(tmp_path / 'results.wafcol'))
+    store = RecordStore(sink, PARAMS, HEADERS, batch_size=16)
+    fill(store, 40)
+    store.close()
+    batches = list(sink.iter_batches())
+    assert [b.size for b in batches] == [16, 16, 8]
+    assert [p for b in batches for p in b.column('param_idx')] == [i % len(PARAMS) for i in range(40)]
+    errors = [store.errors[e] if e >= 0 else None for b in batches for e in b.column('error_idx')]
+    assert errors[0] == 'error 0' and errors[7] == 'error 1' and errors[1] is None
+
+    # 其他進程讀取時沒有記錄存儲，只能解碼數值欄位
+    reader = ColumnarSink(sink.path)
+    reader.count = len(sink)
+    chunk = next(reader.iter_chunks(('status', 'response_time')))
+    assert list(chunk['status'][:2]) == [-1, 201]
+    assert list(chunk['response_time'][:2]) == pytest.approx([0.001, 0.002])
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from saturation import SaturationMonitor, SaturationSample
+
+
+def sample(second: int = 0, lag: float = 0.0, cpu: float = 0.0, backlog: float = 0.0,
+           backlog_idle: float = 0.0, stall: float = 0.0) -> SaturationSample:
+    result = SaturationSample(second)
+    result.lag_max_ms = lag
+    result.loop_cpu = cpu
+    result.backlog_max_ms = backlog
+    result.backlog_idle_ms = backlog_idle
+    result.sink_stall_ms = stall
+    return result
+
+
+@pytest.mark.parametrize('values, reasons, target_bound', [
+    ({}, (), False),
+    ({'lag': 80}, ('loop_lag',), False),
+    ({'cpu': 0.95}, ('cpu',), False),
+    # 只有積壓：所有並發都在等待目標，不算作飽和
+    ({'backlog': 500}, (), True),
+    ({'backlog': 500, 'lag': 80}, ('loop_lag', 'backlog'), False),
+    ({'backlog': 500, 'cpu': 0.95}, ('cpu', 'backlog'), False),
+    # 有空閒並發卻未按時發送
+    ({'backlog': 500, 'backlog_idle': 300}, ('backlog',), False),
+    ({'backlog': 500, 'backlog_idle': 50}, (), True),
+    ({'backlog': 50}, (), False),
+    ({'stall': 30}, ('sink_stall',), False),
+    ({'stall': 30, 'backlog': 500}, ('sink_stall', 'backlog'), False),
+    ({'stall': 5}, (), False),
+])
+def test_reasons(values, reasons, target_bound):
+    result = sample(**values)
+    assert result.reasons == reasons
+    assert result.target_bound is target_bound
+
+
+def test_intervals_separate_target_bound_seconds():
+    monitor = SaturationMonitor(lambda mono_ns: 0)
+    for item in (sample(10, lag=80), sample(11, cpu=0.95), sample(12), sample(13, backlog=500),
+                 sample(14, backlog=500), sample(16, backlog=500, backlog_idle=500)):
+        monitor.samples[item.second] = item
+    assert monitor.intervals() == [(10, 11, ('loop_lag', 'cpu')), (16, 16, ('backlog',))]
+    assert monitor.target_bound_intervals() == [(13, 14, ('target_bound',))]
+    assert set(monitor.saturated_seconds()) == {10, 11, 16}
+
+
+def test_merge_and_round_trip():
+    first = SaturationMonitor(lambda mono_ns: 0)
+    first.samples[1] = sample(1, lag=10, backlog=500)
+    first.samples[2] = sample(2, cpu=0.5)
+    second = SaturationMonitor(lambda mono_ns: 0)
+    second.samples[1] = sample(1, lag=20, cpu=0.3, backlog=200, backlog_idle=200)
+    second.samples[3] = sample(3, lag=90)
+    for item in (*first.samples.values(), *second.samples.values()):
+        item.probes = 10
+        item.lag_sum_ms = 5.0
+
+    first.merge(SaturationMonitor.from_dict(second.to_dict()))
+    merged = first.samples[1]
+    assert merged.lag_max_ms == 20
+    assert merged.lag_sum_ms == 10.0
+    assert merged.probes == 20
+    assert merged.loop_cpu == 0.3
+    assert merged.backlog_max_ms == 500
+    assert merged.backlog_idle_ms == 200
+    # 一個進程有空閒並發卻積壓，合併後該秒視為飽和
+    assert merged.reasons == ('backlog',)
+    assert sorted(first.samples) == [1, 2, 3]
+    assert first.intervals() == [(1, 1, ('backlog',)), (3, 3, ('loop_lag',))]
+
+    restored = SaturationMonitor.from_dict(first.to_dict())
+    assert [s.to_list() for s in restored.samples.values()] == [s.to_list() for s in first.samples.values()]
+
+
+class StuckScheduler:
+    """計劃發送時間停在開始時刻，積壓隨時間增長"""
+
+    def __init__(self):
+        self.start_ns = time.monotonic_ns()
+
+    def peek(self) -> int:
+        return self.start_ns
+
+
+@pytest.mark.parametrize('idle, reasons, target_bound', [(0, (), True), (3, ('backlog',), False)])
+def test_run_attributes_backlog_by_idle_capacity(idle, reasons, target_bound):
+    async def probe():
+        monitor = SaturationMonitor(lambda mono_ns: 0, StuckScheduler(), idle_of=lambda: idle)
+        task = asyncio.create_task(monitor.run())
+        await asyncio.sleep(0.4)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return monitor.samples[0]
+
+    result = asyncio.run(probe())
+    assert result.backlog_max_ms > 200
+    assert result.lag_max_ms < 50
+    assert result.reasons == reasons
+    assert result.target_bound is target_bound
+
+
+def test_run_attributes_result_writer_stalls():
+    stalled = [0]
+
+    async def probe():
+        monitor = SaturationMonitor(lambda mono_ns: 0, stall_of=lambda: stalled[0])
+        task = asyncio.create_task(monitor.run())
+        for _ in range(4):
+            await asyncio.sleep(0.06)
+            stalled[0] += 20_000_000
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return monitor.samples[0]
+
+    result = asyncio.run(probe())
+    assert result.sink_stall_ms == pytest.approx(80, abs=20)
+    assert 'sink_stall' in result.reasons
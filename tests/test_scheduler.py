@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import asyncio
+import time
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from config import Config
+from scheduler import ArrivalScheduler, ConcurrencySlots
+from waf_tester import WAFTester
+
+MS = 1_000_000
+
+
+def test_timeline_is_start_plus_i_over_rate():
+    scheduler = ArrivalScheduler(250)
+    scheduler.start(1_000 * MS)
+    assert [scheduler.next_slot() for _ in range(5)] == [1_000 * MS + i * 4 * MS for i in range(5)]
+    assert scheduler.expected(2.0) == 500
+
+
+def test_set_rate_rebases_after_last_issued_slot():
+    scheduler = ArrivalScheduler(100)
+    scheduler.start(0)
+    slots = [scheduler.next_slot() for _ in range(3)]
+    assert slots == [0, 10 * MS, 20 * MS]
+    scheduler.set_rate(1000)
+    # 已領取的時間不變，之後按新間隔從最近一個計劃時間排列
+    assert scheduler.peek() == 21 * MS
+    assert scheduler.next_slot() == 21 * MS
+    assert scheduler.next_slot() == 22 * MS
+
+
+def test_rejects_non_positive_rate():
+    with pytest.raises(ValueError):
+        ArrivalScheduler(0)
+    with pytest.raises(ValueError):
+        ArrivalScheduler(10).set_rate(-1)
+
+
+def test_backlog_is_sent_immediately_with_planned_times():
+    """工作協程落後時：過期的計劃時間立即給出，仍按時間線返回，落後量計入 send_lag"""
+    async def run():
+        scheduler = ArrivalScheduler(100)
+        start_ns = time.monotonic_ns() - 1_000 * MS
+        scheduler.start(start_ns)
+        began = time.monotonic_ns()
+        slots = [await scheduler.wait() for _ in range(50)]
+        return scheduler, start_ns, slots, time.monotonic_ns() - began
+
+    scheduler, start_ns, slots, spent_ns = asyncio.run(run())
+    assert slots == [start_ns + i * 10 * MS for i in range(50)]
+    assert spent_ns < 200 * MS
+    # 第一個請求落後約 1 秒，第 50 個約 0.5 秒
+    assert scheduler.send_lag.max_us >= 1_000_000
+    assert 500_000 <= scheduler.send_lag.min_us < scheduler.send_lag.max_us
+
+
+def test_wait_sleeps_until_planned_time():
+    async def run():
+        scheduler = ArrivalScheduler(20)
+        scheduler.start()
+        await scheduler.wait()
+        intended = await scheduler.wait()
+        return intended, time.monotonic_ns()
+
+    intended, now = asyncio.run(run())
+    assert now >= intended
+    assert now - intended < 40 * MS
+
+
+async def ok(request: web.Request) -> web.Response:
+    return web.Response(text='ok')
+
+
+@pytest.fixture
+def server_url(serve):
+    """回應 200 的本地服務器"""
+    app = web.Application()
+    app.router.add_get('/', ok)
+    return f'http://127.0.0.1:{serve(app)}/'
+
+
+def test_latency_is_measured_from_planned_time(server_url):
+    """協調遺漏校正：延遲從計劃發送時間算起，服務時間只包含請求本身"""
+    config = Config(url=server_url, threads=1, duration=1, rate_limit=100, output_format='none')
+    tester = WAFTester(config)
+
+    async def run():
+        async with aiohttp.ClientSession() as session:
+            intended_ns = time.monotonic_ns() - 300 * MS
+            return await tester.send_request(session, -1, intended_ns)
+
+    assert asyncio.run(run()) == 200
+    assert tester.stats.overall().min_us >= 300_000
+    assert tester.service_latency.max_us < 300_000
+
+
+def test_concurrency_slots_block_at_limit():
+    async def run():
+        slots = ConcurrencySlots(2)
+        await slots.acquire()
+        await slots.acquire()
+        third = asyncio.ensure_future(slots.acquire())
+        await asyncio.sleep(0)
+        blocked = not third.done()
+        slots.release()
+        await asyncio.wait_for(third, 1)
+        slots.set_limit(4)
+        await asyncio.wait_for(slots.acquire(), 1)
+        return blocked, slots.used
+
+    assert asyncio.run(run()) == (True, 3)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import json
+import pickle
+import random
+from collections import Counter
+
+import pytest
+
+from corpus import Corpus
+from selection import AliasTable, ParamSelector, load_weights
+
+PARAMS = [{'param': f'id={i}'} for i in range(10)]
+
+
+def draws(selector: ParamSelector, workers: int, rounds: int):
+    """按工作協程輪流調用選擇函數"""
+    selects = [selector.for_worker(w) for w in range(workers)]
+    return [selects[i % workers]() for i in range(rounds)]
+
+
+def test_alias_table_matches_weights():
+    weights = [1, 0, 3, 6, 0.5]
+    table = AliasTable(weights)
+    rng = random.Random(1)
+    n = 200_000
+    counts = Counter(table.draw(rng) for _ in range(n))
+    total = sum(weights)
+    assert counts[1] == 0
+    for i, weight in enumerate(weights):
+        assert counts[i] / n == pytest.approx(weight / total, abs=0.005)
+
+
+def test_alias_table_rejects_zero_total():
+    with pytest.raises(ValueError):
+        AliasTable([0, 0])
+    with pytest.raises(ValueError):
+        AliasTable([])
+
+
+def test_load_weights():
+    weights = load_weights([{'q': 1, '_weight': 2.5}, {'q': 2}, {'_weight': 0}])
+    assert list(weights) == [2.5, 1.0, 0.0]
+    with pytest.raises(ValueError):
+        load_weights([{'_weight': -1}])
+    with pytest.raises(ValueError):
+        load_weights([{'_weight': 'x'}])
+
+
+def test_corpus_weights_come_from_index(tmp_path, monkeypatch):
+    items = [{'q': i, '_weight': i % 4} for i in range(20)] + [{'q': 'default'}]
+    path = tmp_path / 'p.json'
+    path.write_text(json.dumps(items))
+    first = Corpus(str(path))
+    expected = [float(i % 4) for i in range(20)] + [1.0]
+    assert list(load_weights(first)) == expected
+
+    # 權重從 .idx 緩存讀取，不重建索引也不逐項解碼
+    def fail(*args):
+        raise AssertionError("權重應來自索引")
+    monkeypatch.setattr(Corpus, '_build_index', fail)
+    monkeypatch.setattr(Corpus, '__getitem__', fail)
+    cached = Corpus(str(path))
+    assert list(load_weights(cached)) == expected
+    assert list(load_weights(pickle.loads(pickle.dumps(cached)))) == expected
+    assert ParamSelector('weighted', cached, seed=1).for_worker(0)() in range(1, 20)
+    monkeypatch.undo()
+
+    # 沒有緩存時權重隨偏移索引一起傳給子進程
+    uncached = pickle.loads(pickle.dumps(Corpus(str(path), cache_index=False)))
+    assert list(load_weights(uncached)) == expected
+
+
+def test_corpus_weights_validation(tmp_path):
+    path = tmp_path / 'p.json'
+    path.write_text(json.dumps([{'q': 1}, {'q': 2, '_weight': 'x'}]))
+    with pytest.raises(ValueError, match='第2項'):
+        load_weights(Corpus(str(path)))
+    # 不使用 weighted 選擇時無效權重不影響讀取
+    assert Corpus(str(path))[1] == {'q': 2, '_weight': 'x'}
+
+    text = tmp_path / 'p.txt'
+    text.write_text('a\nb\n')
+    assert list(load_weights(Corpus(str(text)))) == [1.0, 1.0]
+
+
+def test_weighted_selector_is_seeded():
+    params = [{'_weight': 1}, {'_weight': 9}]
+    first = draws(ParamSelector('weighted', params, seed=7), 3, 300)
+    assert first == draws(ParamSelector('weighted', params, seed=7), 3, 300)
+    assert Counter(first)[1] > Counter(first)[0]
+
+
+def test_random_selector_is_seeded_per_worker():
+    a = draws(ParamSelector('random', PARAMS, seed=3), 4, 400)
+    assert a == draws(ParamSelector('random', PARAMS, seed=3), 4, 400)
+    assert set(a) == set(range(10))
+
+
+def test_round_robin_shares_cursor_across_workers():
+    # 只有部分工作協程在運行時，所有參數項仍被輪到
+    selector = ParamSelector('round-robin', PARAMS)
+    assert draws(selector, 3, 20) == list(range(10)) * 2
+
+
+def test_round_robin_shards_are_disjoint():
+    seen = []
+    for shard in range(3):
+        selector = ParamSelector('round-robin', PARAMS, shard_index=shard, shard_count=3)
+        seen.append(draws(selector, 2, len(range(shard, 10, 3)) * 2))
+    assert seen[0] == [0, 3, 6, 9] * 2
+    assert seen[1] == [1, 4, 7] * 2
+    assert seen[2] == [2, 5, 8] * 2
+
+
+def test_round_robin_falls_back_when_shards_outnumber_params():
+    selector = ParamSelector('round-robin', PARAMS[:2], shard_index=5, shard_count=8)
+    assert draws(selector, 1, 4) == [0, 1, 0, 1]
+
+
+def test_exhaustive_sends_each_item_once():
+    selector = ParamSelector('exhaustive', PARAMS, shard_index=1, shard_count=2)
+    assert draws(selector, 4, 7) == [1, 3, 5, 7, 9, None, None]
+
+
+def test_exhaustive_shards_cover_all_items():
+    seen = []
+    for shard in range(4):
+        select = ParamSelector('exhaustive', PARAMS, shard_index=shard, shard_count=4).for_worker(0)
+        while (idx := select()) is not None:
+            seen.append(idx)
+    assert sorted(seen) == list(range(10))
+
+
+def test_no_params_returns_minus_one():
+    for strategy in ('random', 'round-robin', 'weighted', 'exhaustive'):
+        assert ParamSelector(strategy, []).for_worker(0)() == -1
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        ParamSelector('sequential', PARAMS)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import re
+import time
+
+import pytest
+from aiohttp import web
+
+import waf_tester
+from config import Config
+from waf_tester import WAFTester
+
+
+@pytest.fixture
+def target_url(serve):
+    async def ok(request: web.Request) -> web.Response:
+        return web.Response(text='ok')
+    app = web.Application()
+    app.router.add_get('/', ok)
+    return f'http://127.0.0.1:{serve(app)}/'
+
+
+def achieved_rate(summary: str) -> float:
+    return float(re.search(r'([\d.]+)/s', summary).group(1))
+
+
+def test_rate_uses_elapsed_time_when_exhaustive_ends_early(tmp_path, target_url):
+    params = tmp_path / 'params.txt'
+    params.write_text(''.join(f'id={i}\n' for i in range(40)))
+    config = Config(url=target_url, threads=4, duration=30, rate_limit=100, params_file=str(params),
+                    selection='exhaustive', output_format='none')
+    tester = WAFTester(config)
+    start = time.monotonic()
+    tester.run()
+    assert time.monotonic() - start < 5
+    assert tester.stats.total == 40
+    assert tester.run_elapsed == pytest.approx(0.4, abs=0.3)
+
+    # 40 個請求在約 0.4 秒內發完，速率接近目標而不是 40/30
+    rate = achieved_rate(tester.summary())
+    assert rate == pytest.approx(40 / tester.run_elapsed, rel=0.01)
+    assert rate > 50
+    report = tester._schedule_report(waf_tester.TRANSLATIONS['en_US'], tester.stats.total)
+    assert f'{40 / tester.run_elapsed:.2f}/s' in report
+    assert 'ended early' in tester._elapsed_note(waf_tester.TRANSLATIONS['en_US'])
+
+
+def test_elapsed_is_capped_at_duration_and_merged(target_url):
+    config = Config(url=target_url, threads=2, duration=1, rate_limit=20, output_format='none')
+    tester = WAFTester(config)
+    tester.run()
+    assert tester.run_elapsed == 1
+    assert tester._elapsed_note(waf_tester.TRANSLATIONS['en_US']) == ''
+
+    # 合併多個進程時取最晚結束的一個
+    merged = WAFTester(config)
+    for elapsed in (0.5, 0.8):
+        payload = tester.export_stats()
+        payload['elapsed'] = elapsed
+        merged.merge_stats(payload)
+    assert merged.run_elapsed == 0.8
+    assert achieved_rate(merged.summary()) == pytest.approx(merged.stats.total / 0.8, rel=0.01)
+    # 沒有運行過時按持續時間計算
+    assert WAFTester(config).run_seconds() == 1
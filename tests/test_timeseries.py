@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import pytest
+
+from timeseries import LATENCY_BINS, TimeSeries, bin_upper, latency_bin
+
+BASE = 1_700_000_000
+
+
+def series(capacity: int = 8) -> TimeSeries:
+    """Unix 秒等於 monotonic 秒的時間序列，便於指定每條記錄所在的秒"""
+    result = TimeSeries(capacity)
+    result._epoch_offset_ns = 0
+    return result
+
+
+def record(target: TimeSeries, second: int, status: int = 200, latency_ms: float = 10.0, blocked=None):
+    target.record(second * 1_000_000_000 + 500_000_000, status, int(latency_ms * 1_000_000), blocked)
+
+
+def test_latency_bins_cover_their_values():
+    for value in (0, 1, 3, 4, 5, 7, 8, 100, 1000, 123456, 10 ** 9):
+        index = latency_bin(value)
+        assert value <= bin_upper(index)
+        assert index == 0 or bin_upper(index - 1) < value
+    assert latency_bin(2 ** 40) == LATENCY_BINS - 1
+
+
+def test_ring_wraparound_overwrites_oldest_seconds():
+    ts = series(capacity=4)
+    for offset in range(6):
+        for _ in range(offset + 1):
+            record(ts, BASE + offset, latency_ms=offset + 1)
+    # 只保留最近 4 秒，被覆蓋的秒沒有殘留數據
+    assert list(ts.seconds()) == [BASE + 2, BASE + 3, BASE + 4, BASE + 5]
+    assert [row['requests'] for row in ts.rows()] == [3, 4, 5, 6]
+    assert ts.row(BASE)['requests'] == 0
+    assert ts.row(BASE + 1)['max'] == 0.0
+    assert ts.row(BASE + 4)['max'] == pytest.approx(5.0)
+    assert ts.row(BASE + 4)['2xx'] == 5
+    assert sum(ts.latency_bins(BASE + 5)) == 6
+    assert sum(ts.latency_bins(BASE + 1)) == 0
+    # 導出也只包含仍保留的秒
+    assert [item[0] for item in ts.to_dict()['seconds']] == [BASE + 2, BASE + 3, BASE + 4, BASE + 5]
+
+
+def test_seconds_without_requests_are_zero_rows():
+    ts = series()
+    record(ts, BASE)
+    record(ts, BASE + 3, status=-1)
+    rows = ts.rows()
+    assert [row['requests'] for row in rows] == [1, 0, 0, 1]
+    assert rows[3]['error'] == 1
+    window = ts.window(4, end=BASE + 4)
+    assert window['rps'] == 0.5
+    assert window['error_rate'] == 0.5
+
+
+def test_merge_same_second_from_two_sources():
+    first, second = series(), series()
+    for _ in range(90):
+        record(first, BASE, latency_ms=10)
+    record(first, BASE + 1, status=403)
+    for _ in range(10):
+        record(second, BASE, status=503, latency_ms=500)
+    record(second, BASE, status=200, latency_ms=20, blocked=True)
+    record(second, BASE + 2)
+
+    first.merge(TimeSeries.from_dict(second.to_dict()))
+    row = first.row(BASE)
+    assert row['requests'] == 101
+    assert (row['2xx'], row['5xx']) == (91, 10)
+    assert row['blocked'] == 1
+    assert row['max'] == pytest.approx(500.0)
+    assert row['mean'] == pytest.approx((90 * 10 + 10 * 500 + 20) / 101, rel=1e-3)
+    # 百分位來自合併後的分桶，而不是各來源百分位的平均或最大值
+    assert row['p50'] == pytest.approx(10.0, rel=0.25)
+    assert row['p99'] == pytest.approx(500.0, rel=0.25)
+    assert first.row(BASE + 1)['blocked'] == 1
+    assert [r['requests'] for r in first.rows()] == [101, 1, 1]
+
+
+def test_merge_into_different_capacity_and_earlier_first_second():
+    recent = series(capacity=4)
+    record(recent, BASE + 10)
+    older = series(capacity=16)
+    record(older, BASE + 5)
+    older.merge(TimeSeries.from_dict(recent.to_dict()))
+    assert older.first_second == BASE + 5
+    assert older.last_second == BASE + 10
+    assert [r['requests'] for r in older.rows()] == [1, 0, 0, 0, 0, 1]
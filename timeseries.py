@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import time
+from array import array
+from typing import Any, Dict, Iterator, List, Optional
+
+# 每秒統計的狀態類別列，順序固定
+STATUS_CLASSES = ('1xx', '2xx', '3xx', '4xx', '5xx', 'error')
+# 每個2的冪區間分為 4 個子桶，最大約 2^32 微秒
+SUB_BINS = 4
+LATENCY_BINS = 128
+# 默認保留的秒數，超出後最舊的一秒被覆蓋
+DEFAULT_CAPACITY = 3600 + 60
+
+
+def latency_bin(value_us: int) -> int:
+    """延遲（微秒）所在的粗粒度對數分桶，相對誤差約 25%"""
+    if value_us < SUB_BINS:
+        return max(value_us, 0)
+    octave = value_us.bit_length() - 1
+    index = (octave - 1) * SUB_BINS + (value_us >> (octave - 2)) - SUB_BINS
+    return min(index, LATENCY_BINS - 1)
+
+
+def bin_upper(index: int) -> int:
+    """分桶的上界（微秒）"""
+    if index < SUB_BINS:
+        return index
+    octave = index // SUB_BINS + 1
+    return ((index % SUB_BINS + SUB_BINS + 1) << (octave - 2)) - 1
+
+
+def _class_index(status: int) -> int:
+    if status < 0:
+        return len(STATUS_CLASSES) - 1
+    return min(max(status // 100 - 1, 0), len(STATUS_CLASSES) - 2)
+
+
+class TimeSeries:
+    """按秒滾動的統計：請求數、各狀態類別計數、被阻擋計數和粗粒度延遲直方圖
+
+    所有數據保存在預先分配的環形數組中，內存固定；以 Unix 秒為鍵，
+    因此不同進程或代理的數據可以直接按秒對齊合併。
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._seconds = array('q', [-1]) * capacity
+        self._counts = array('I', bytes(4 * capacity))
+        self._blocked = array('I', bytes(4 * capacity))
+        self._classes = array('I', bytes(4 * capacity * len(STATUS_CLASSES)))
+        self._bins = array('I', bytes(4 * capacity * LATENCY_BINS))
+        self._sum_us = array('Q', bytes(8 * capacity))
+        self._max_us = array('Q', bytes(8 * capacity))
+        # monotonic 時間到 Unix 時間的換算
+        self._epoch_offset_ns = time.time_ns() - time.monotonic_ns()
+        self.first_second: Optional[int] = None
+        self.last_second: Optional[int] = None
+
+    def _slot(self, second: int) -> int:
+        """取得某一秒的槽位，槽位中是更早的數據時先清空"""
+        slot = second % self.capacity
+        if self._seconds[slot] != second:
+            self._seconds[slot] = second
+            self._counts[slot] = 0
+            self._blocked[slot] = 0
+            self._sum_us[slot] = 0
+            self._max_us[slot] = 0
+            base = slot * len(STATUS_CLASSES)
+            self._classes[base:base + len(STATUS_CLASSES)] = array('I', bytes(4 * len(STATUS_CLASSES)))
+            base = slot * LATENCY_BINS
+            self._bins[base:base + LATENCY_BINS] = array('I', bytes(4 * LATENCY_BINS))
+            if self.first_second is None or second < self.first_second:
+                self.first_second = second
+            if self.last_second is None or second > self.last_second:
+                self.last_second = second
+        return slot
+
+    def record(self, mono_ns: int, status: int, latency_ns: int, blocked: Optional[bool] = None):
+        """記錄一個在 mono_ns（monotonic 納秒）完成的請求，blocked 未指定時以 403 視為被阻擋"""
+        slot = self._slot(self.second_of(mono_ns))
+        latency_us = latency_ns // 1000
+        self._counts[slot] += 1
+        if blocked or (blocked is None and status == 403):
+            self._blocked[slot] += 1
+        self._classes[slot * len(STATUS_CLASSES) + _class_index(status)] += 1
+        self._bins[slot * LATENCY_BINS + latency_bin(latency_us)] += 1
+        self._sum_us[slot] += latency_us
+        if latency_us > self._max_us[slot]:
+            self._max_us[slot] = latency_us
+
+    def second_of(self, mono_ns: int) -> int:
+        """monotonic 納秒所在的 Unix 秒"""
+        return (mono_ns + self._epoch_offset_ns) // 1_000_000_000
+
+    def now(self) -> int:
+        """當前的 Unix 秒"""
+        return self.second_of(time.monotonic_ns())
+
+    def seconds(self, start: Optional[int] = None, end: Optional[int] = None) -> Iterator[int]:
+        """保留範圍內 [start, end) 的每一秒，包括沒有請求的秒"""
+        if self.last_second is None:
+            return iter(())
+        end = self.last_second + 1 if end is None else end
+        start = self.first_second if start is None else start
+        start = max(start, self.first_second, end - self.capacity)
+        return iter(range(start, end))
+
+    def _has(self, second: int) -> bool:
+        return self._seconds[second % self.capacity] == second
+
+    def row(self, second: int) -> Dict[str, Any]:
+        """某一秒的統計，延遲單位為毫秒"""
+        row = {'second': second, 'requests': 0, 'blocked': 0}
+        row.update(dict.fromkeys(STATUS_CLASSES, 0))
+        row.update({'mean': 0.0, 'p50': 0.0, 'p99': 0.0, 'max': 0.0})
+        if not self._has(second):
+            return row
+        slot = second % self.capacity
+        count = self._counts[slot]
+        row['requests'] = count
+        row['blocked'] = self._blocked[slot]
+        base = slot * len(STATUS_CLASSES)
+        row.update(zip(STATUS_CLASSES, self._classes[base:base + len(STATUS_CLASSES)]))
+        if count:
+            bins = self._bins[slot * LATENCY_BINS:(slot + 1) * LATENCY_BINS]
+            p50, p99 = _bin_percentiles(bins, count, (50, 99))
+            max_us = self._max_us[slot]
+            row.update({'mean': self._sum_us[slot] / count / 1000,
+                        'p50': min(p50, max_us) / 1000,
+                        'p99': min(p99, max_us) / 1000,
+                        'max': max_us / 1000})
+        return row
+
+    def latency_bins(self, second: int) -> List[int]:
+        """某一秒的延遲分桶計數（LATENCY_BINS 個）"""
+        if not self._has(second):
+            return [0] * LATENCY_BINS
+        slot = second % self.capacity
+        return self._bins[slot * LATENCY_BINS:(slot + 1) * LATENCY_BINS].tolist()
+
+    def rows(self, start: Optional[int] = None, end: Optional[int] = None) -> List[Dict[str, Any]]:
+        return [self.row(second) for second in self.seconds(start, end)]
+
+    def window(self, seconds: int = 1, end: Optional[int] = None) -> Dict[str, Any]:
+        """最近 seconds 個完整秒（不含當前未結束的一秒）的合計統計"""
+        end = self.now() if end is None else end
+        bins = array('I', bytes(4 * LATENCY_BINS))
+        total = blocked = errors = 0
+        max_us = 0
+        for second in range(end - seconds, end):
+            if not self._has(second):
+                continue
+            slot = second % self.capacity
+            total += self._counts[slot]
+            blocked += self._blocked[slot]
+            errors += self._classes[slot * len(STATUS_CLASSES) + len(STATUS_CLASSES) - 1]
+            max_us = max(max_us, self._max_us[slot])
+            base = slot * LATENCY_BINS
+            for i, count in enumerate(self._bins[base:base + LATENCY_BINS]):
+                if count:
+                    bins[i] += count
+        p50, p99 = _bin_percentiles(bins, total, (50, 99)) if total else (0, 0)
+        return {
+            'rps': total / seconds,
+            'p50': min(p50, max_us) / 1000,
+            'p99': min(p99, max_us) / 1000,
+            'blocked_rate': blocked / total if total else 0.0,
+            'error_rate': errors / total if total else 0.0,
+        }
+
+    def merge(self, other: 'TimeSeries'):
+        for second in other.seconds():
+            if not other._has(second):
+                continue
+            src = second % other.capacity
+            dst = self._slot(second)
+            self._counts[dst] += other._counts[src]
+            self._blocked[dst] += other._blocked[src]
+            self._sum_us[dst] += other._sum_us[src]
+            self._max_us[dst] = max(self._max_us[dst], other._max_us[src])
+            n = len(STATUS_CLASSES)
+            for i in range(n):
+                self._classes[dst * n + i] += other._classes[src * n + i]
+            for i in range(LATENCY_BINS):
+                self._bins[dst * LATENCY_BINS + i] += other._bins[src * LATENCY_BINS + i]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """稀疏導出有請求的秒，可JSON序列化"""
+        data = []
+        n = len(STATUS_CLASSES)
+        for second in self.seconds():
+            if not self._has(second):
+                continue
+            slot = second % self.capacity
+            bins = self._bins[slot * LATENCY_BINS:(slot + 1) * LATENCY_BINS]
+            data.append([second, self._counts[slot], self._blocked[slot], self._sum_us[slot], self._max_us[slot],
+                         list(self._classes[slot * n:(slot + 1) * n]),
+                         [[i, c] for i, c in enumerate(bins) if c]])
+        return {'capacity': self.capacity, 'seconds': data}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'TimeSeries':
+        series = cls(data['capacity'])
+        n = len(STATUS_CLASSES)
+        for second, count, blocked, sum_us, max_us, classes, bins in data['seconds']:
+            slot = series._slot(second)
+            series._counts[slot] = count
+            series._blocked[slot] = blocked
+            series._sum_us[slot] = sum_us
+            series._max_us[slot] = max_us
+            series._classes[slot * n:(slot + 1) * n] = array('I', classes)
+            for i, c in bins:
+                series._bins[slot * LATENCY_BINS + i] = c
+        return series
+
+
+def _bin_percentiles(bins, total: int, pcts) -> List[int]:
+    """由分桶計數求百分位（返回分桶上界，微秒）"""
+    targets = [max(1, int(total * pct / 100 + 0.5)) for pct in pcts]
+    values = []
+    seen = 0
+    t = 0
+    for i, count in enumerate(bins):
+        if not count:
+            continue
+        seen += count
+        while t < len(targets) and seen >= targets[t]:
+            values.append(bin_upper(i))
+            t += 1
+        if t == len(targets):
+            break
+    while len(values) < len(targets):
+        values.append(bin_upper(LATENCY_BINS - 1))
+    return values
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2024 WillyCow
+This software is released under the MIT License.
+https://opensource.org/licenses/MIT
+"""
+
+import time
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+from histogram import LatencyHistogram
+
+
+class PoolStats:
+    """連接池統計：新建連接數、復用次數及等待空閒連接的時間"""
+
+    def __init__(self):
+        self.opened = 0
+        self.reused = 0
+        self.queued = 0
+        self.connect_time = LatencyHistogram()
+        self.queue_wait = LatencyHistogram()
+
+    @property
+    def reuse_ratio(self) -> float:
+        """復用連接的請求佔比"""
+        acquired = self.opened + self.reused
+        return self.reused / acquired if acquired else 0.0
+
+    def merge(self, other: 'PoolStats'):
+        self.opened += other.opened
+        self.reused += other.reused
+        self.queued += other.queued
+        self.connect_time.merge(other.connect_time)
+        self.queue_wait.merge(other.queue_wait)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'opened': self.opened,
+            'reused': self.reused,
+            'queued': self.queued,
+            'connect_time': self.connect_time.to_dict(),
+            'queue_wait': self.queue_wait.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'PoolStats':
+        stats = cls()
+        stats.opened = data['opened']
+        stats.reused = data['reused']
+        stats.queued = data['queued']
+        stats.connect_time = LatencyHistogram.from_dict(data['connect_time'])
+        stats.queue_wait = LatencyHistogram.from_dict(data['queue_wait'])
+        return stats
+
+
+# 請求階段：DNS解析、建立連接（含TLS握手）、首字節時間、讀取響應體
+PHASES = ('dns', 'connect', 'ttfb', 'body')
+
+
+class PhaseStats:
+    """各請求階段的延遲直方圖"""
+
+    def __init__(self):
+        self.histograms = {phase: LatencyHistogram() for phase in PHASES}
+
+    def record(self, phase: str, elapsed_ns: int):
+        self.histograms[phase].record(elapsed_ns // 1000)
+
+    def merge(self, other: 'PhaseStats'):
+        for phase in PHASES:
+            self.histograms[phase].merge(other.histograms[phase])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {phase: hist.to_dict() for phase, hist in self.histograms.items()}
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> 'PhaseStats':
+        stats = cls()
+        for phase, hist in (data or {}).items():
+            stats.histograms[phase] = LatencyHistogram.from_dict(hist)
+        return stats
+
+
+def phase_trace_config(stats: PhaseStats) -> aiohttp.TraceConfig:
+    """創建記錄請求各階段耗時的 TraceConfig
+
+    aiohttp 在同一個調用中完成 TCP 連接和 TLS 握手，沒有單獨的 TLS 事件，
+    因此 connect 階段包含 TLS 握手；DNS 解析在建立連接的過程中進行，從 connect 中扣除。
+    響應體的讀取時間由調用方記錄。
+    """
+
+    async def on_create_start(session, ctx, params):
+        ctx.connect_ns = time.monotonic_ns()
+        ctx.dns_elapsed_ns = 0
+
+    async def on_dns_start(session, ctx, params):
+        ctx.dns_ns = time.monotonic_ns()
+
+    async def on_dns_end(session, ctx, params):
+        elapsed = time.monotonic_ns() - ctx.dns_ns
+        ctx.dns_elapsed_ns = elapsed
+        stats.record('dns', elapsed)
+
+    async def on_create_end(session, ctx, params):
+        stats.record('connect', time.monotonic_ns() - ctx.connect_ns - ctx.dns_elapsed_ns)
+
+    async def on_headers_sent(session, ctx, params):
+        ctx.sent_ns = time.monotonic_ns()
+
+    async def on_request_end(session, ctx, params):
+        # 請求發出到收到響應頭，主要是目標（WAF規則）的處理時間加上網絡往返
+        stats.record('ttfb', time.monotonic_ns() - ctx.sent_ns)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_create_start.append(on_create_start)
+    trace_config.on_dns_resolvehost_start.append(on_dns_start)
+    trace_config.on_dns_resolvehost_end.append(on_dns_end)
+    trace_config.on_connection_create_end.append(on_create_end)
+    trace_config.on_request_headers_sent.append(on_headers_sent)
+    trace_config.on_request_end.append(on_request_end)
+    return trace_config
+
+
+def pool_trace_config(stats: PoolStats) -> aiohttp.TraceConfig:
+    """創建記錄連接池事件的 TraceConfig"""
+
+    async def on_queued_start(session, ctx, params):
+        ctx.queued_ns = time.monotonic_ns()
+
+    async def on_queued_end(session, ctx, params):
+        stats.queued += 1
+        stats.queue_wait.record((time.monotonic_ns() - ctx.queued_ns) // 1000)
+
+    async def on_create_start(session, ctx, params):
+        ctx.connect_ns = time.monotonic_ns()
+
+    async def on_create_end(session, ctx, params):
+        stats.opened += 1
+        stats.connect_time.record((time.monotonic_ns() - ctx.connect_ns) // 1000)
+
+    async def on_reuse(session, ctx, params):
+        stats.reused += 1
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_queued_start.append(on_queued_start)
+    trace_config.on_connection_queued_end.append(on_queued_end)
+    trace_config.on_connection_create_start.append(on_create_start)
+    trace_config.on_connection_create_end.append(on_create_end)
+    trace_config.on_connection_reuseconn.append(on_reuse)
+    return trace_config
@@ -8,17 +8,31 @@ https://opensource.org/licenses/MIT
 """
 
 import asyncio
+import csv
 import time
 from datetime import datetime
 import aiohttp
-import pandas as pd
-import matplotlib.pyplot as plt
+from charts import render_charts, timeseries_specs
 from rich.progress import Progress, TaskID
-from typing import Dict, List, Any
-import random
+from typing import AsyncIterator, Dict, List, Any, Optional, Tuple, Union
 from config import Config
-import matplotlib as mpl
-import platform
+from histogram import LatencyHistogram
+from load_profile import find_knee, stage_rows
+from records import RecordStore
+from replay import ReplaySource, ReplayStats
+from result_sink import COLUMNS, ResultSink, MemorySink, create_sink
+from saturation import REASONS, SaturationMonitor
+from capacity import HIGH_CONCURRENCY_READ_BUFSIZE, ensure_fd_limit, preflight
+from scheduler import ArrivalScheduler, ConcurrencySlots
+from adaptive import AdaptiveController
+from classifier import read_prefix
+from selection import ParamSelector, PayloadStats
+from metrics import MetricsServer
+from multiproc import merge_snapshots, run_multiprocess
+from tracing import PHASES, PhaseStats, PoolStats, phase_trace_config, pool_trace_config
+from stats import RunStats
+from templates import RequestTemplate
+from timeseries import STATUS_CLASSES, TimeSeries
 
 # 翻譯字典
 TRANSLATIONS = {
@@ -26,7 +40,9 @@ TRANSLATIONS = {
         'report_title': 'WAF測試報告',
         'test_time': '測試時間',
         'duration': '持續時間',
+        'ended_early': '（提前結束，實際運行 {elapsed:.1f}秒）',
         'threads': '並發線程',
+        'processes': '進程數',
         'seconds': '秒',
         'statistics': '統計摘要',
         'total_requests': '總請求數',
@@ -41,13 +57,100 @@ TRANSLATIONS = {
         'report_error': '生成報告時出錯',
         'chart_error': '生成圖表時出錯',
         'no_data': '沒有測試結果數據',
-        'missing_column': '結果數據中缺少必要的列'
+        'missing_column': '結果數據中缺少必要的列',
+        'latency_percentiles': '響應時間百分位（毫秒，按狀態類別）',
+        'all_requests': '全部請求',
+        'schedule': '速率調度（開環，延遲從計劃發送時間起算）',
+        'target_rate': '目標速率',
+        'achieved_rate': '實際速率',
+        'shortfall': '落後',
+        'send_lag': '發送延後（實際發送−計劃時間）',
+        'service_time': '未校正服務時間',
+        'connection_pool': '連接池',
+        'keep_alive': '復用連接',
+        'new_connection': '每個請求使用新連接',
+        'connections_opened': '新建連接數',
+        'connect_time': '建立耗時',
+        'reuse_ratio': '連接復用率',
+        'pool_wait': '等待空閒連接',
+        'times': '次',
+        'total': '合計',
+        'load_profile': '負載階段',
+        'stage': '階段',
+        'concurrency': '並發',
+        'rate': '速率',
+        'throughput': '吞吐量',
+        'blocked': '被阻擋',
+        'errors': '錯誤',
+        'knee': '拐點',
+        'previous_stage': '上一階段',
+        'max_sustainable': '最大可持續吞吐量約',
+        'adaptive': '自適應並發',
+        'adaptive_target': '目標：p99 ≤ {p99:g}ms，錯誤率（請求錯誤及5xx）≤ {errors:g}%',
+        'adaptive_best': '最高可持續吞吐量 {rps}/s（並發 {concurrency}，p99 {p99:.2f}ms，第{second}秒）',
+        'adaptive_settled': '穩定後的並發數約 {settled:.1f}（後半段平均），因違反目標降低並發 {decreases} 次',
+        'adaptive_none': '沒有任何一秒滿足目標，請放寬 --target-p99 / --max-error-rate',
+        'no_knee': '未發現拐點（吞吐量隨負載持續上升）',
+        'over_time': '逐秒統計（詳見 timeseries.csv）',
+        'latency_over_time': '響應時間隨時間變化',
+        'rps_over_time': '吞吐量隨時間變化',
+        'latency_heatmap': '響應時間熱力圖',
+        'elapsed': '經過時間 (秒)',
+        'latency_ms': '響應時間 (毫秒)',
+        'requests_per_second': '每秒請求數',
+        'worst_second': 'p99 最高的一秒',
+        'second_n': '第{}秒',
+        'request_phases': '請求階段耗時（毫秒）',
+        'phase_share': '佔平均服務時間',
+        'phase_dns': 'DNS解析',
+        'phase_connect': '建立連接',
+        'phase_connect_tls': '建立連接（含TLS握手）',
+        'phase_ttfb': '首字節時間',
+        'phase_body': '讀取響應體',
+        'saturation': '負載生成器飽和檢測',
+        'saturation_peak': '事件循環延遲 max {lag:.1f}ms，事件循環CPU max {cpu:.0f}%，調度積壓 max {backlog:.1f}ms，'
+                           '等待結果寫入 max {stall:.1f}ms/秒',
+        'saturation_none': '未發現負載生成器飽和，結果可信',
+        'target_bound': '受目標限制的區間：{spans}。調度積壓時所有並發都在等待響應，事件循環空閒，'
+                        '瓶頸是目標的響應時間和並發上限，結果可信',
+        'payloads': '參數項統計（詳見 payload_results.csv）',
+        'classification': '阻擋頁特徵命中次數',
+        'blocked_by_status': '被阻擋請求的狀態碼',
+        'deadline': '超時與收尾',
+        'timeouts': '超時：連接 {connect}，讀取 {read}，總計 {total}',
+        'unlimited': '不限制',
+        'deadline_clean': '到達持續時間時沒有進行中的請求',
+        'deadline_in_flight': '到達持續時間時仍有 {count} 個請求進行中：寬限期（{grace}秒）內完成 {drained} 個並計入結果，'
+                              '取消 {cancelled} 個且不計入結果',
+        'replay': '訪問日誌回放',
+        'replay_timing': '時間：{speed}',
+        'replay_original': '原始間隔',
+        'replay_scaled': '{speed:g} 倍速',
+        'replay_max': '最大吞吐量',
+        'replay_sent': '發送 {sent} 個GET請求，跳過非GET請求 {skipped} 行，無法解析 {malformed} 行',
+        'replay_done': '日誌時間跨度 {span:.1f}秒，全部發送用時 {elapsed:.1f}秒（{rate:.2f}/s）',
+        'replay_cut': '日誌時間跨度 {span:.1f}秒，到達持續時間時尚未發送完畢',
+        'selection': '選擇策略',
+        'seed': '隨機種子',
+        'payload_coverage': '已發送 {sent}/{total} 項（{pct:.2f}%）',
+        'payload_blocked': '全部被阻擋 {fully} 項，部分被阻擋 {partly} 項，從未被阻擋 {never} 項',
+        'saturation_intervals': '飽和區間',
+        'saturation_untrusted': '這些區間內完成 {count} 個請求（{pct:.2f}%），結果不可信（timeseries.csv 中的 saturated 列已標記）',
+        'saturated_stage': '負載生成器飽和 {}秒，結果不可信',
+        'knee_untrusted': '拐點附近負載生成器飽和，拐點可能來自測試工具本身而非目標',
+        'reason_loop_lag': '事件循環延遲',
+        'reason_cpu': '事件循環CPU',
+        'reason_sink_stall': '結果寫入阻塞',
+        'reason_backlog': '調度積壓',
+        'seconds_range': '第{}–{}秒'
     },
     'en_US': {
         'report_title': 'WAF Test Report',
         'test_time': 'Test Time',
         'duration': 'Duration',
+        'ended_early': ' (ended early after {elapsed:.1f} seconds)',
         'threads': 'Concurrent Threads',
+        'processes': 'Processes',
         'seconds': 'seconds',
         'statistics': 'Statistics Summary',
         'total_requests': 'Total Requests',
@@ -62,26 +165,171 @@ TRANSLATIONS = {
         'report_error': 'Error generating report',
         'chart_error': 'Error generating charts',
         'no_data': 'No test result data',
-        'missing_column': 'Missing required column in results'
+        'missing_column': 'Missing required column in results',
+        'latency_percentiles': 'Response Time Percentiles (ms, by status class)',
+        'all_requests': 'All requests',
+        'schedule': 'Rate Schedule (open loop, latency measured from intended send time)',
+        'target_rate': 'Target rate',
+        'achieved_rate': 'Achieved rate',
+        'shortfall': 'behind by',
+        'send_lag': 'Send lag (actual - intended send time)',
+        'service_time': 'Uncorrected service time',
+        'connection_pool': 'Connection Pool',
+        'keep_alive': 'connection reuse',
+        'new_connection': 'new connection per request',
+        'connections_opened': 'Connections opened',
+        'connect_time': 'connect time',
+        'reuse_ratio': 'Reuse ratio',
+        'pool_wait': 'Waited for a free connection',
+        'times': 'times',
+        'total': 'total',
+        'load_profile': 'Load Stages',
+        'stage': 'Stage',
+        'concurrency': 'concurrency',
+        'rate': 'rate',
+        'throughput': 'throughput',
+        'blocked': 'Blocked',
+        'errors': 'errors',
+        'knee': 'Knee',
+        'previous_stage': 'previous stage',
+        'max_sustainable': 'max sustainable throughput about',
+        'adaptive': 'Adaptive concurrency',
+        'adaptive_target': 'Target: p99 ≤ {p99:g}ms, error rate (transport errors and 5xx) ≤ {errors:g}%',
+        'adaptive_best': 'Highest sustainable throughput {rps}/s (concurrency {concurrency}, p99 {p99:.2f}ms, second {second})',
+        'adaptive_settled': 'Settled concurrency about {settled:.1f} (mean over the second half), decreased {decreases} times on target violations',
+        'adaptive_none': 'No second met the target; relax --target-p99 / --max-error-rate',
+        'no_knee': 'No knee found (throughput kept rising with load)',
+        'over_time': 'Per-second Statistics (see timeseries.csv)',
+        'latency_over_time': 'Response Time over Time',
+        'rps_over_time': 'Throughput over Time',
+        'latency_heatmap': 'Response Time Heatmap',
+        'elapsed': 'Elapsed (seconds)',
+        'latency_ms': 'Response Time (ms)',
+        'requests_per_second': 'Requests per second',
+        'worst_second': 'Second with the highest p99',
+        'second_n': 'second {}',
+        'request_phases': 'Request Phases (ms)',
+        'phase_share': 'of mean service time',
+        'phase_dns': 'DNS lookup',
+        'phase_connect': 'Connect',
+        'phase_connect_tls': 'Connect (incl. TLS handshake)',
+        'phase_ttfb': 'Time to first byte',
+        'phase_body': 'Response body',
+        'saturation': 'Load Generator Saturation',
+        'saturation_peak': 'Event loop lag max {lag:.1f}ms, event loop CPU max {cpu:.0f}%, scheduler backlog max {backlog:.1f}ms, '
+                           'waiting on the result writer max {stall:.1f}ms/s',
+        'saturation_none': 'The load generator was not saturated; results are trustworthy',
+        'target_bound': 'Target-bound intervals: {spans}. Sending fell behind schedule while every slot was '
+                        'waiting for a response and the event loop was idle; the bottleneck is the target\'s '
+                        'response time and the concurrency limit, and results are trustworthy',
+        'payloads': 'Payloads (see payload_results.csv)',
+        'classification': 'Block page signature matches',
+        'blocked_by_status': 'Blocked requests by status',
+        'deadline': 'Timeouts and shutdown',
+        'timeouts': 'Timeouts: connect {connect}, read {read}, total {total}',
+        'unlimited': 'unlimited',
+        'deadline_clean': 'No requests were in flight when the duration ended',
+        'deadline_in_flight': '{count} requests were in flight when the duration ended: {drained} completed within '
+                              'the {grace}s grace period and are counted, {cancelled} were cancelled and are not counted',
+        'replay': 'Access log replay',
+        'replay_timing': 'Timing: {speed}',
+        'replay_original': 'original intervals',
+        'replay_scaled': '{speed:g}x speed',
+        'replay_max': 'maximum throughput',
+        'replay_sent': '{sent} GET requests sent, {skipped} non-GET lines skipped, {malformed} lines unparseable',
+        'replay_done': 'The log spans {span:.1f}s and was fully sent in {elapsed:.1f}s ({rate:.2f}/s)',
+        'replay_cut': 'The log spans {span:.1f}s; the duration ended before it was fully sent',
+        'selection': 'Selection strategy',
+        'seed': 'seed',
+        'payload_coverage': '{sent}/{total} entries sent ({pct:.2f}%)',
+        'payload_blocked': '{fully} always blocked, {partly} sometimes blocked, {never} never blocked',
+        'saturation_intervals': 'Saturated intervals',
+        'saturation_untrusted': '{count} requests ({pct:.2f}%) completed in these intervals are untrustworthy (flagged in the saturated column of timeseries.csv)',
+        'saturated_stage': 'load generator saturated for {}s, untrustworthy',
+        'knee_untrusted': 'The load generator was saturated around the knee; it may come from the tester rather than the target',
+        'reason_loop_lag': 'event loop lag',
+        'reason_cpu': 'event loop CPU',
+        'reason_sink_stall': 'result writer stall',
+        'reason_backlog': 'scheduler backlog',
+        'seconds_range': 'seconds {}-{}'
     }
 }
 
-# 設置中文字體
-if platform.system() == 'Windows':
-    plt.rcParams['font.sans-serif'] = ['Microsoft YaHei']  # 微軟雅黑
-elif platform.system() == 'Darwin':
-    plt.rcParams['font.sans-serif'] = ['PingFang HK']     # macOS
-else:
-    plt.rcParams['font.sans-serif'] = ['Noto Sans TC']    # Linux
 
-plt.rcParams['axes.unicode_minus'] = False  # 解決負號顯示問題
+# 按負載配置調整目標並發數和速率的間隔(秒)
+PROFILE_INTERVAL = 0.1
+# 超出當前並發目標的工作協程每次暫停的時間(秒)
+PARK_INTERVAL = 0.05
+# 逐秒統計在測試持續時間之外額外保留的秒數（收尾中的請求）
+TIMESERIES_SLACK = 60
 
 class WAFTester:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, sink: Optional[ResultSink] = None):
         self.config = config
-        self.results = []
+        # 請求模板在載入配置時已預編譯，所有請求共享同一份Headers
+        self.headers = dict(config._request_headers)
+        # 結果按批寫入磁盤，避免長時間測試佔用大量內存
+        self.results = sink if sink is not None else create_sink(config.output_format)
+        # 參數項選擇策略及每個參數項的阻擋/放行統計
+        params = config._params or []
+        self.selector = ParamSelector(config.selection, params, config.seed, config.shard_index, config.shard_count)
+        self.payload_stats = PayloadStats(len(params)) if params else None
+        # 可選的阻擋頁分類：狀態碼以外按響應頭和響應體前綴識別被阻擋的響應
+        self.classifier = config._classifier
+        self.signature_counts = [0] * len(self.classifier.signatures) if self.classifier else []
+        # 熱路徑上記錄的延遲直方圖，報告不需要排序或保存所有樣本
+        self.stats = RunStats()
+        # 設置速率限制時，由中央調度器按固定到達時間線發送請求
+        self.scheduler = ArrivalScheduler(config.rate_limit) if config.rate_limit > 0 else None
+        # 未經協調遺漏校正的服務時間（僅在啟用調度器時有意義）
+        self.service_latency = LatencyHistogram()
+        self.pool_stats = PoolStats()
+        # 可選的請求階段耗時統計
+        self.phase_stats = PhaseStats() if config.trace_phases else None
+        # 分階段負載：各階段單獨統計，當前階段和並發目標由 follow_profile 更新
+        self.profile = config._profile
+        self.stage_stats = [RunStats() for _ in self.profile.stages] if self.profile else []
+        self.stage_index = 0
+        self.active_threads = config.threads
+        # 訪問日誌回放：後台線程流式解析日誌，threads 為進行中請求數的上限
+        self.replay = None
+        if config.replay_file:
+            replay_user_agent = not any(key.lower() == 'user-agent' for key in config._headers)
+            self.replay = ReplaySource(config.replay_file, config.replay_format, config.url,
+                                       config._request_headers, replay_user_agent,
+                                       config.shard_index, config.shard_count)
+        self.replay_stats = self.replay.stats if self.replay else None
+        self.records = RecordStore(self.results, config._params, self.headers, config.batch_size,
+                                   self.replay is not None)
+        # 高並發模式和日誌回放：以可調整上限的並發槽位代替每個虛擬用戶一個常駐協程
+        self.slots = ConcurrencySlots(config.threads) if config.high_concurrency or self.replay else None
+        # 逐秒滾動統計，供進度顯示、GUI和報告使用，不需要掃描詳細結果
+        self.timeseries = TimeSeries(config.duration + TIMESERIES_SLACK)
+        # 監測負載生成器自身是否飽和
+        self.saturation = SaturationMonitor(self.timeseries.second_of, self.scheduler,
+                                            (lambda: self.stage_index) if self.profile else None,
+                                            self._idle_concurrency, lambda: self.results.stall_ns)
+        # 自適應並發：以 threads 為上限，由控制器調整生效的工作協程數
+        self.adaptive = None
+        if config.adaptive:
+            self.adaptive = AdaptiveController(self.timeseries, config.threads, config.target_p99,
+                                               config.max_error_rate, lambda: self.saturation.saturated_now)
+            self._set_concurrency(self.adaptive.concurrency)
+        # 供指標服務讀取的實時計數
+        self.in_flight = 0
+        # 硬性截止時間（單調時鐘納秒），到達後不再發送新請求
+        self.deadline_ns: Optional[int] = None
+        # 截止時間仍在進行的請求：寬限期內完成的計入結果，被取消的只單獨計數
+        self.in_flight_at_deadline = 0
+        self.drained = 0
+        self.cancelled = 0
+        self.error_types: Dict[str, int] = {}
         self.start_time = None
+        # 多進程模式下各子進程的最新實時快照（按進程序號），由 run_multiprocess 更新
+        self.child_snapshots: Dict[int, Dict[str, Any]] = {}
         self.end_time = None
+        # 實際發送請求的時間（秒）：提前結束時小於持續時間，寬限期不計入
+        self.run_elapsed: Optional[float] = None
         self.current_lang = 'zh_TW'  # 默認使用中文
 
     def set_language(self, lang: str):
@@ -89,54 +337,233 @@ class WAFTester:
         if lang in TRANSLATIONS:
             self.current_lang = lang
 
-    async def send_request(self, session: aiohttp.ClientSession, params: Dict = None) -> Dict[str, Any]:
-        """發送單個請求並記錄結果"""
-        start_time = time.time()
+    async def send_request(self, session: aiohttp.ClientSession, param_idx: int = -1,
+                           intended_ns: Optional[int] = None, template: Optional[RequestTemplate] = None) -> int:
+        """發送單個請求並記錄結果，intended_ns 為調度器給出的計劃發送時間，template 為直接給出的請求（日誌回放）"""
+        stage = self.stage_index
+        error = None
+        blocked = None
+        self.in_flight += 1
+        start_ns = time.monotonic_ns()
         try:
-            headers = self.config._headers.copy()
-            if not headers.get('User-Agent'):
-                headers['User-Agent'] = 'WAF-Tester/1.0'
-
-            async with session.get(self.config.url, 
-                                 params=params, 
-                                 headers=headers,
-                                 timeout=30) as response:
-                end_time = time.time()
-                return {
-                    'timestamp': datetime.now().isoformat(),
-                    'status': response.status,
-                    'response_time': end_time - start_time,
-                    'params': params,
-                    'headers': headers
-                }
+            # 大型參數文件的項在此按需編譯，無法編碼的項記為請求錯誤
+            if template is None:
+                template = self.config._templates[param_idx] if param_idx >= 0 else self.config._base_template
+            # 超時由會話的 ClientTimeout 控制
+            async with session.get(template.url,
+                                   headers=template.headers) as response:
+                status = response.status
+                body_ns = time.monotonic_ns()
+                if self.classifier is not None:
+                    classifier = self.classifier
+                    # 只讀取響應體前綴，且只在此狀態碼有響應體特徵時讀取
+                    body = await read_prefix(response.content, classifier.body_bytes) \
+                        if classifier.wants_body(status) else b''
+                    signature = classifier.classify(status, response.headers, body)
+                    if signature is not None:
+                        self.signature_counts[signature] += 1
+                        blocked = True
+                if self.phase_stats is not None:
+                    async for _ in response.content.iter_any():
+                        pass
+                    self.phase_stats.record('body', time.monotonic_ns() - body_ns)
+        except asyncio.CancelledError:
+            # 寬限期結束時被取消，沒有響應可記錄；取消只發生在截止之後，必然屬於截止時的在途請求
+            self.in_flight_at_deadline += 1
+            self.cancelled += 1
+            raise
         except Exception as e:
-            end_time = time.time()
-            return {
-                'timestamp': datetime.now().isoformat(),
-                'status': -1,
-                'response_time': end_time - start_time,
-                'error': str(e),
-                'params': params,
-                'headers': headers
-            }
-
-    async def worker(self, session: aiohttp.ClientSession):
+            status = -1
+            error = str(e)
+            error_type = type(e).__name__
+            self.error_types[error_type] = self.error_types.get(error_type, 0) + 1
+        finally:
+            self.in_flight -= 1
+        end_ns = time.monotonic_ns()
+        # 截止前發出、截止後才完成的請求正是截止時刻的在途請求，
+        # 按請求逐個歸類，保證 在途數 = 寬限期內完成數 + 取消數
+        if self.deadline_ns is not None and end_ns > self.deadline_ns:
+            self.in_flight_at_deadline += 1
+            self.drained += 1
+        # 從計劃發送時間開始計算延遲，包含排隊等待的時間
+        latency_ns = end_ns - (start_ns if intended_ns is None else intended_ns)
+        replayed = None
+        if self.replay is not None:
+            # 回放的請求目標和實際發送的 User-Agent 隨記錄保存，不在回放源中累積
+            replayed = (template.url.raw_path_qs, template.headers.get('User-Agent'))
+        self.records.append(end_ns, status, latency_ns, param_idx, error, replayed)
+        if self.payload_stats is not None and param_idx >= 0:
+            self.payload_stats.record(param_idx, status, blocked)
+        self.stats.record(status, latency_ns, blocked)
+        if self.stage_stats:
+            self.stage_stats[stage].record(status, latency_ns, blocked)
+        self.timeseries.record(end_ns, status, latency_ns, blocked)
+        self.service_latency.record((end_ns - start_ns) // 1000)
+        return status
+
+    async def worker(self, session: aiohttp.ClientSession, worker_id: int = 0):
         """工作線程"""
-        while time.time() - self.start_time < self.config.duration:
-            if self.config.rate_limit > 0:
-                await asyncio.sleep(1 / self.config.rate_limit)
+        select = self.selector.for_worker(worker_id)
+        deadline_ns = self.deadline_ns
+        while time.monotonic_ns() < deadline_ns:
+            # 超出當前並發目標的工作協程暫停
+            if worker_id >= self.active_threads:
+                await asyncio.sleep(PARK_INTERVAL)
+                continue
+            intended_ns = None
+            if self.scheduler:
+                intended_ns = await self.scheduler.wait()
+                # 計劃時間或實際時間已過截止時間（調度積壓）時不再發送
+                if intended_ns >= deadline_ns or time.monotonic_ns() >= deadline_ns:
+                    break
+
+            param_idx = select()
+            if param_idx is None:
+                break
+            await self.send_request(session, param_idx, intended_ns)
+
+    async def selected_requests(self) -> AsyncIterator[Tuple[int, Optional[RequestTemplate], Optional[int]]]:
+        """高並發模式按參數選擇策略和調度器給出 (參數項索引, 請求模板, 計劃發送時間)"""
+        select = self.selector.for_worker(0)
+        deadline_ns = self.deadline_ns
+        while time.monotonic_ns() < deadline_ns:
+            intended_ns = None
+            if self.scheduler:
+                intended_ns = await self.scheduler.wait()
+                # 與 worker 相同：計劃時間或實際時間已過截止時間時不再發送
+                if intended_ns >= deadline_ns or time.monotonic_ns() >= deadline_ns:
+                    return
+            param_idx = select()
+            if param_idx is None:
+                return
+            yield param_idx, None, intended_ns
+
+    async def dispatch(self, session: aiohttp.ClientSession,
+                       requests: AsyncIterator[Tuple[int, Optional[RequestTemplate], Optional[int]]]):
+        """調度協程：為 requests 給出的每個請求領取並發槽位並創建任務，請求完成時釋放槽位"""
+        slots = self.slots
+        deadline_ns = self.deadline_ns
+        tasks = set()
+
+        async def send(param_idx: int, template: Optional[RequestTemplate], intended_ns: Optional[int]):
+            try:
+                await self.send_request(session, param_idx, intended_ns, template)
+            finally:
+                slots.release()
+
+        try:
+            async for param_idx, template, intended_ns in requests:
+                await slots.acquire()
+                if time.monotonic_ns() >= deadline_ns:
+                    slots.release()
+                    break
+                task = asyncio.create_task(send(param_idx, template, intended_ns))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                if self.replay_stats is not None:
+                    self.replay_stats.sent += 1
+            await requests.aclose()
+            if tasks:
+                await asyncio.wait(tasks)
+        except asyncio.CancelledError:
+            # 寬限期結束，取消仍在進行的請求
+            await requests.aclose()
+            pending = list(tasks)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+            raise
+
+    def _apply_profile(self, elapsed: float):
+        """切換到負載配置在 elapsed 秒時的目標"""
+        index, threads, rate = self.profile.target_at(elapsed)
+        self.stage_index = index
+        self._set_concurrency(threads or self.config.threads)
+        if rate and self.scheduler:
+            self.scheduler.set_rate(rate)
+
+    def _idle_concurrency(self) -> int:
+        """當前空閒的並發數：未佔用的槽位或沒有請求在進行的工作協程"""
+        if self.slots is not None:
+            return self.slots.limit - self.slots.used
+        return self.active_threads - self.in_flight
+
+    def _set_concurrency(self, threads: int):
+        """設置生效的並發數（負載配置和自適應並發使用）"""
+        self.active_threads = threads
+        if self.slots is not None:
+            self.slots.set_limit(threads)
 
-            params = None
-            if self.config._params:
-                params = random.choice(self.config._params)
+    async def follow_profile(self, start_ns: int):
+        """按負載配置隨時間調整目標並發數和速率"""
+        while True:
+            elapsed = (time.monotonic_ns() - start_ns) / 1e9
+            self._apply_profile(elapsed)
+            if elapsed >= self.config.duration:
+                break
+            await asyncio.sleep(PROFILE_INTERVAL)
 
-            result = await self.send_request(session, params)
-            self.results.append(result)
+    async def _join_workers(self, workers: List[asyncio.Task]):
+        """等待工作協程在截止時間前結束；之後最多等待寬限期讓進行中的請求完成，再取消剩餘請求"""
+        timeout = max(self.deadline_ns - time.monotonic_ns(), 0) / 1e9
+        _, pending = await asyncio.wait(workers, timeout=timeout)
+        if pending:
+            if self.config.grace_period:
+                _, pending = await asyncio.wait(pending, timeout=self.config.grace_period)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+        # 傳播工作協程中的異常
+        for task in workers:
+            if not task.cancelled():
+                task.result()
+
+    def _client_timeout(self) -> aiohttp.ClientTimeout:
+        """按配置分別設置連接、讀取和總超時，0表示不限制"""
+        return aiohttp.ClientTimeout(total=self.config.total_timeout or None,
+                                     sock_connect=self.config.connect_timeout or None,
+                                     sock_read=self.config.read_timeout or None)
+
+    def _create_connector(self) -> aiohttp.TCPConnector:
+        """按配置創建連接池"""
+        options = {
+            'limit': self.config.conn_limit,
+            'limit_per_host': self.config.conn_limit_per_host,
+            'ttl_dns_cache': self.config.dns_cache_ttl or None,
+            'use_dns_cache': self.config.dns_cache_ttl > 0,
+            'force_close': self.config.force_close,
+        }
+        # 每個請求使用新連接時不能設置 keep-alive 超時
+        if not self.config.force_close:
+            options['keepalive_timeout'] = self.config.keepalive_timeout
+        return aiohttp.TCPConnector(**options)
 
     async def run_test(self, progress_callback=None):
         """運行測試"""
-        async with aiohttp.ClientSession() as session:
-            workers = [self.worker(session) for _ in range(self.config.threads)]
+        start_ns = time.monotonic_ns()
+        self.deadline_ns = start_ns + self.config.duration * 1_000_000_000
+        if self.scheduler:
+            self.scheduler.start(start_ns)
+        if self.profile:
+            self._apply_profile(0)
+        trace_configs = [pool_trace_config(self.pool_stats)]
+        if self.phase_stats is not None:
+            trace_configs.append(phase_trace_config(self.phase_stats))
+        options = {}
+        if self.slots is not None:
+            # 限制每個連接未讀響應的緩衝，內存隨並發數線性且有界地增長
+            options['read_bufsize'] = HIGH_CONCURRENCY_READ_BUFSIZE
+        async with aiohttp.ClientSession(connector=self._create_connector(), timeout=self._client_timeout(),
+                                         trace_configs=trace_configs, **options) as session:
+            if self.replay is not None:
+                requests = self.replay.requests(start_ns, self.deadline_ns, self.config.replay_speed)
+                workers = [asyncio.create_task(self.dispatch(session, requests))]
+            elif self.slots is not None:
+                workers = [asyncio.create_task(self.dispatch(session, self.selected_requests()))]
+            else:
+                workers = [asyncio.create_task(self.worker(session, i)) for i in range(self.config.threads)]
             try:
                 # 創建進度更新任務
                 async def update_progress():
@@ -145,44 +572,433 @@ class WAFTester:
                             break
                         await asyncio.sleep(0.1)
 
-                # 同時運行工作線程和進度更新
-                await asyncio.gather(
-                    update_progress(),
-                    *workers
-                )
+                # 進度更新、負載配置和飽和監測在工作線程全部結束後停止
+                # （exhaustive 模式下參數項選完即提前結束）
+                tasks = [update_progress()] if progress_callback else []
+                if self.profile:
+                    tasks.append(self.follow_profile(start_ns))
+                if self.adaptive:
+                    tasks.append(self.adaptive.run(self._set_concurrency))
+                tasks = [asyncio.create_task(task) for task in tasks]
+                tasks.append(asyncio.create_task(self.saturation.run()))
+                try:
+                    await self._join_workers(workers)
+                    self.run_elapsed = min((time.monotonic_ns() - start_ns) / 1e9, self.config.duration)
+                    if progress_callback:
+                        progress_callback()
+                finally:
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
             except Exception as e:
                 print(f"Error during test: {str(e)}")
                 raise
 
-    def run(self, progress_callback=None) -> List[Dict[str, Any]]:
+    def run(self, progress_callback=None) -> ResultSink:
         """執行測試"""
         self.start_time = time.time()
-        asyncio.run(self.run_test(progress_callback))
+        if self.config.high_concurrency:
+            # 子進程繼承提高後的文件描述符上限
+            ensure_fd_limit(preflight(self.config)['fds_per_process'])
+        # 多進程模式下由各子進程在自己的端口提供指標
+        metrics = None
+        if self.config.metrics_port and self.config.processes == 1:
+            metrics = MetricsServer(self, self.config.metrics_host, self.config.metrics_port)
+            metrics.start()
+        try:
+            if self.config.processes > 1:
+                run_multiprocess(self, progress_callback)
+            else:
+                asyncio.run(self.run_test(progress_callback))
+        finally:
+            if metrics:
+                metrics.stop()
+            self.records.close()
         self.end_time = time.time()
         return self.results
 
-    def generate_report(self, results: List[Dict[str, Any]]):
+    def snapshot(self, window: int = 1) -> Dict[str, Any]:
+        """測試進行中的狀態快照：已用時間、累計請求數及最近 window 個完整秒的吞吐量和延遲"""
+        if self.child_snapshots:
+            snap = merge_snapshots(self.child_snapshots.values())
+            snap['elapsed'] = time.time() - self.start_time if self.start_time else 0.0
+            return snap
+        snap = self.timeseries.window(window)
+        snap['elapsed'] = time.time() - self.start_time if self.start_time else 0.0
+        snap['total'] = self.stats.total
+        snap['stage'] = self.stage_index + 1 if self.profile else None
+        snap['saturated'] = self.saturation.saturated_now
+        snap['in_flight'] = self.in_flight
+        snap['concurrency'] = self.active_threads if self.adaptive else None
+        return snap
+
+    def run_seconds(self) -> float:
+        """計算速率使用的實際運行時間；exhaustive 選完或日誌回放完時測試提前結束"""
+        if self.run_elapsed is None:
+            return self.config.duration
+        return max(self.run_elapsed, 1e-3)
+
+    def summary(self) -> str:
+        """本次測試的簡短摘要，不生成報告文件、不載入報告使用的庫"""
+        t = TRANSLATIONS[self.current_lang]
+        total = self.stats.total
+        blocked = self.stats.blocked
+        errors = self.stats.status_counts.get(-1, 0)
+        latency = self.stats.overall().percentiles((50, 99))
+        return (f"{t['total_requests']} {total}，{t['achieved_rate']} {total / self.run_seconds():.2f}/s，"
+                f"p50 {latency[50] / 1000:.2f} / p99 {latency[99] / 1000:.2f}ms，"
+                f"{t['blocked_requests']} {blocked} ({blocked / total * 100 if total else 0:.2f}%)，"
+                f"{t['error_requests']} {errors} ({errors / total * 100 if total else 0:.2f}%)")
+
+    def export_stats(self) -> Dict[str, Any]:
+        """導出緊湊的統計數據（可JSON序列化），供其他進程或機器合併"""
+        return {
+            'stats': self.stats.to_dict(),
+            'service_latency': self.service_latency.to_dict(),
+            'send_lag': self.scheduler.send_lag.to_dict() if self.scheduler else None,
+            'issued': self.scheduler.issued if self.scheduler else self.stats.total,
+            'pool': self.pool_stats.to_dict(),
+            'stages': [stats.to_dict() for stats in self.stage_stats],
+            'timeseries': self.timeseries.to_dict(),
+            'phases': self.phase_stats.to_dict() if self.phase_stats is not None else None,
+            'saturation': self.saturation.to_dict(),
+            'payloads': self.payload_stats.to_dict() if self.payload_stats is not None else None,
+            'deadline': [self.drained, self.cancelled],
+            'elapsed': self.run_elapsed,
+            'signatures': self.signature_counts,
+            'adaptive': self.adaptive.to_dict() if self.adaptive else None,
+            'replay': self.replay_stats.to_dict() if self.replay_stats is not None else None,
+            'output_format': self.config.output_format,
+            'path': self.results.path,
+            'count': len(self.results),
+        }
+
+    def merge_stats(self, payload: Dict[str, Any]):
+        """合併 export_stats 導出的統計數據"""
+        self.stats.merge(RunStats.from_dict(payload['stats']))
+        self.service_latency.merge(LatencyHistogram.from_dict(payload['service_latency']))
+        self.pool_stats.merge(PoolStats.from_dict(payload['pool']))
+        for stats, data in zip(self.stage_stats, payload.get('stages') or []):
+            stats.merge(RunStats.from_dict(data))
+        if self.phase_stats is not None and payload.get('phases'):
+            self.phase_stats.merge(PhaseStats.from_dict(payload['phases']))
+        if payload.get('saturation'):
+            self.saturation.merge(SaturationMonitor.from_dict(payload['saturation']))
+        if self.payload_stats is not None and payload.get('payloads'):
+            self.payload_stats.merge(PayloadStats.from_dict(payload['payloads']))
+        if self.adaptive and payload.get('adaptive'):
+            self.adaptive.merge(AdaptiveController.from_dict(payload['adaptive']))
+        if self.replay_stats is not None and payload.get('replay'):
+            self.replay_stats.merge(ReplayStats.from_dict(payload['replay']))
+        for i, count in enumerate(payload.get('signatures') or []):
+            self.signature_counts[i] += count
+        if payload.get('deadline'):
+            # 在途數由兩者推導，跨進程匯總後三個數字仍然相加一致
+            drained, cancelled = payload['deadline']
+            self.in_flight_at_deadline += drained + cancelled
+            self.drained += drained
+            self.cancelled += cancelled
+        if payload.get('elapsed') is not None:
+            # 各進程並行運行，取最晚結束的一個
+            self.run_elapsed = max(self.run_elapsed or 0.0, payload['elapsed'])
+        if payload.get('timeseries'):
+            self.timeseries.merge(TimeSeries.from_dict(payload['timeseries']))
+        if self.scheduler and payload['send_lag']:
+            self.scheduler.send_lag.merge(LatencyHistogram.from_dict(payload['send_lag']))
+            self.scheduler.issued += payload['issued']
+
+    def _collect_stats(self, results: ResultSink) -> RunStats:
+        """取得報告使用的統計：本次測試直接使用熱路徑上的直方圖，否則逐塊讀回狀態碼和延遲兩列向量化重建"""
+        if results is self.results and self.stats.total:
+            return self.stats
+        return RunStats.from_columns(results.iter_numeric())
+
+    @staticmethod
+    def _response_time_hist(latency: LatencyHistogram, bins: int = 50):
+        """由延遲直方圖重新分箱得到響應時間分佈，不需要讀回詳細結果"""
+        import numpy as np
+
+        time_min = latency.min_us / 1e6
+        time_max = max(latency.max_us / 1e6, time_min + 1e-6)
+        edges = np.linspace(time_min, time_max, bins + 1)
+        buckets = list(latency.buckets())
+        mids = [min(max((low + high) / 2e6, time_min), time_max) for low, high, _ in buckets]
+        counts = [count for _, _, count in buckets]
+        hist = np.histogram(mids, bins=edges, weights=counts)[0].astype('int64')
+        return hist, edges
+
+    def _elapsed_note(self, t: Dict[str, str]) -> str:
+        """測試提前結束時註明實際運行時間"""
+        if self.run_elapsed is None or self.run_elapsed >= self.config.duration - 0.5:
+            return ''
+        return t['ended_early'].format(elapsed=self.run_elapsed)
+
+    def _schedule_report(self, t: Dict[str, str], total_requests: int) -> str:
+        """調度器的目標速率與實際速率對比"""
+        # 分階段速率以整個負載曲線的平均目標比較
+        target = self.profile.mean_rate() if self.profile and self.profile.rate_based else self.scheduler.rate
+        achieved = total_requests / self.run_seconds()
+        shortfall = max(0.0, (target - achieved) / target * 100)
+        lag = self.scheduler.send_lag.percentiles((50, 99))
+        service = self.service_latency.percentiles((50, 99))
+        return f"""
+{t['schedule']}：
+- {t['target_rate']}：{target:.2f}/s
+- {t['achieved_rate']}：{achieved:.2f}/s ({t['shortfall']} {shortfall:.2f}%)
+- {t['send_lag']}：p50 {lag[50] / 1000:.2f} / p99 {lag[99] / 1000:.2f} / max {self.scheduler.send_lag.max_us / 1000:.2f}ms
+- {t['service_time']}：p50 {service[50] / 1000:.2f} / p99 {service[99] / 1000:.2f}ms
+"""
+
+    def _pool_report(self, t: Dict[str, str]) -> str:
+        """連接池統計"""
+        pool = self.pool_stats
+        connect = pool.connect_time.percentiles((50, 99))
+        wait = pool.queue_wait.percentiles((50, 99))
+        mode = t['new_connection'] if self.config.force_close else t['keep_alive']
+        return f"""
+{t['connection_pool']}（{mode}）：
+- {t['connections_opened']}：{pool.opened}（{t['connect_time']} p50 {connect[50] / 1000:.2f} / p99 {connect[99] / 1000:.2f}ms）
+- {t['reuse_ratio']}：{pool.reuse_ratio * 100:.2f}% ({pool.reused})
+- {t['pool_wait']}：{pool.queued} {t['times']}，{t['total']} {pool.queue_wait.sum_us / 1e6:.2f}{t['seconds']}，p50 {wait[50] / 1000:.2f} / p99 {wait[99] / 1000:.2f}ms
+"""
+
+    def _profile_report(self, t: Dict[str, str]) -> str:
+        """各負載階段的吞吐量、延遲和拐點，同時保存 stage_summary.csv"""
+        rows = stage_rows(self.profile, self.stage_stats)
+        with open('stage_summary.csv', 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({k: f'{v:.4f}' if isinstance(v, float) else v for k, v in row.items()})
+
+        # 各階段中負載生成器飽和的秒數
+        saturated = [0] * len(rows)
+        for sample in self.saturation.samples.values():
+            if sample.reasons and 0 <= sample.stage < len(rows):
+                saturated[sample.stage] += 1
+
+        report = f"\n{t['load_profile']}：\n"
+        for row, seconds in zip(rows, saturated):
+            target = f"{t['rate']} {row['rate']}/s" if row['rate'] else f"{t['concurrency']} {row['threads']}"
+            report += (f"- {t['stage']}{row['stage']}（{target}，{row['ramp']}，{row['duration']}{t['seconds']}）："
+                       f"{t['throughput']} {row['throughput']:.2f}/s，p50 {row['p50']:.2f} / p99 {row['p99']:.2f}ms，"
+                       f"{t['blocked']} {row['blocked_rate'] * 100:.2f}%，{t['errors']} {row['error_rate'] * 100:.2f}%")
+            if seconds:
+                report += f"，{t['saturated_stage'].format(seconds)}"
+            report += "\n"
+        knee = find_knee(rows)
+        if knee is None:
+            report += f"- {t['no_knee']}\n"
+        else:
+            cur, prev = rows[knee], rows[knee - 1]
+            report += (f"- {t['knee']}：{t['stage']}{cur['stage']}，{t['throughput']} {cur['throughput']:.2f}/s"
+                       f"（{t['previous_stage']} {prev['throughput']:.2f}/s），p99 {prev['p99']:.2f} → {cur['p99']:.2f}ms，"
+                       f"{t['blocked']} {prev['blocked_rate'] * 100:.2f}% → {cur['blocked_rate'] * 100:.2f}%，"
+                       f"{t['errors']} {prev['error_rate'] * 100:.2f}% → {cur['error_rate'] * 100:.2f}%\n"
+                       f"- {t['max_sustainable']} {prev['throughput']:.2f}/s（{t['stage']}{prev['stage']}）\n")
+            if saturated[knee] or saturated[knee - 1]:
+                report += f"- {t['knee_untrusted']}\n"
+        return report
+
+    def _adaptive_report(self, t: Dict[str, str]) -> str:
+        """自適應並發找到的最大可持續吞吐量和穩定後的並發數"""
+        adaptive = self.adaptive
+        report = f"""
+{t['adaptive']}：
+- {t['adaptive_target'].format(p99=adaptive.target_p99, errors=adaptive.max_error_rate * 100)}
+- {t['adaptive_settled'].format(settled=adaptive.settled(), decreases=adaptive.decreases)}
+"""
+        # 負載生成器飽和的秒不能代表目標的能力
+        best = adaptive.best(self.timeseries, set(self.saturation.saturated_seconds()))
+        if best is None:
+            return report + f"- {t['adaptive_none']}\n"
+        start = self.timeseries.first_second or best['second']
+        return report + "- " + t['adaptive_best'].format(
+            rps=best['requests'], concurrency=best['concurrency'], p99=best['p99'],
+            second=best['second'] - start) + "\n"
+
+    def _timeseries_report(self, t: Dict[str, str]) -> str:
+        """逐秒吞吐量和延遲的摘要，同時保存 timeseries.csv"""
+        rows = self.timeseries.rows()
+        start = rows[0]['second']
+        saturated = self.saturation.saturated_seconds()
+        with open('timeseries.csv', 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            levels = self.adaptive.levels if self.adaptive else None
+            writer.writerow(['second', 'time', 'requests', 'blocked'] + list(STATUS_CLASSES)
+                            + ['mean_ms', 'p50_ms', 'p99_ms', 'max_ms', 'saturated']
+                            + (['concurrency'] if levels is not None else []))
+            for row in rows:
+                writer.writerow([row['second'] - start, datetime.fromtimestamp(row['second']).isoformat(),
+                                 row['requests'], row['blocked']] + [row[c] for c in STATUS_CLASSES]
+                                + [f"{row[k]:.3f}" for k in ('mean', 'p50', 'p99', 'max')]
+                                + ['+'.join(saturated.get(row['second'], ()))]
+                                + ([levels.get(row['second'], '')] if levels is not None else []))
+
+        # 首尾兩秒通常不完整，不計入吞吐量範圍
+        full = rows[1:-1] or rows
+        rps = [row['requests'] for row in full]
+        worst = max(rows, key=lambda row: row['p99'])
+        return f"""
+{t['over_time']}：
+- {t['throughput']}：min {min(rps)} / mean {sum(rps) / len(rps):.2f} / max {max(rps)} /s
+- {t['worst_second']}：{t['second_n'].format(worst['second'] - start)}，p99 {worst['p99']:.2f}ms（{t['request_count']} {worst['requests']}）
+"""
+
+    def _phase_report(self, t: Dict[str, str]) -> str:
+        """各請求階段的耗時分佈及佔平均服務時間的比例"""
+        if not any(hist.total for hist in self.phase_stats.histograms.values()):
+            return ''
+        report = f"\n{t['request_phases']}：\n"
+        service_sum = self.service_latency.sum_us
+        requests = self.service_latency.total
+        for phase in PHASES:
+            hist = self.phase_stats.histograms[phase]
+            if not hist.total:
+                continue
+            label = t[f'phase_{phase}']
+            if phase == 'connect' and self.config.url.startswith('https://'):
+                label = t['phase_connect_tls']
+            pct = hist.percentiles((50, 99))
+            # 按請求數攤分後佔平均服務時間的比例（DNS和建立連接只發生在部分請求上）
+            share = hist.sum_us / service_sum * 100 if service_sum else 0.0
+            report += (f"- {label} ({hist.total}/{requests})：mean {hist.mean_us / 1000:.2f} / "
+                       f"p50 {pct[50] / 1000:.2f} / p99 {pct[99] / 1000:.2f} / max {hist.max_us / 1000:.2f}，"
+                       f"{t['phase_share']} {share:.1f}%\n")
+        return report
+
+    def _payload_report(self, t: Dict[str, str]) -> str:
+        """每個參數項的阻擋/放行次數，寫入 payload_results.csv"""
+        params = self.config._params
+        stats = self.payload_stats
+        sent = fully = partly = never = 0
+        with open('payload_results.csv', 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['index', 'param', 'sent', 'blocked', 'passed', 'errors', 'block_rate'])
+            for idx, blocked, passed, errors in stats.rows():
+                total = blocked + passed + errors
+                writer.writerow([idx, str(params[idx]), total, blocked, passed, errors, f"{blocked / total:.4f}"])
+                sent += 1
+                if not blocked:
+                    never += 1
+                elif blocked == total:
+                    fully += 1
+                else:
+                    partly += 1
+        seed = '' if self.config.seed is None else f"，{t['seed']} {self.config.seed}"
+        return f"""
+{t['payloads']}：
+- {t['selection']} {self.config.selection}{seed}
+- {t['payload_coverage'].format(sent=sent, total=stats.count, pct=sent / stats.count * 100)}
+- {t['payload_blocked'].format(fully=fully, partly=partly, never=never)}
+"""
+
+    def _classification_report(self, t: Dict[str, str], stats: RunStats) -> str:
+        """各阻擋頁特徵的命中次數，以及被阻擋請求的狀態碼分佈"""
+        report = f"\n{t['classification']}：\n"
+        for name, count in zip(self.classifier.names, self.signature_counts):
+            report += f"- {name}：{count}\n"
+        by_status = '，'.join(f"{status} {count}" for status, count in sorted(stats.blocked_counts.items()))
+        report += f"- {t['blocked_by_status']}：{by_status or 0}\n"
+        return report
+
+    def _deadline_report(self, t: Dict[str, str]) -> str:
+        """超時設置，以及截止時間仍在進行的請求如何收尾"""
+        def limit(value: float) -> str:
+            return f"{value:g}s" if value else t['unlimited']
+
+        report = f"""
+{t['deadline']}：
+- {t['timeouts'].format(connect=limit(self.config.connect_timeout), read=limit(self.config.read_timeout),
+                        total=limit(self.config.total_timeout))}
+"""
+        if not self.in_flight_at_deadline:
+            return report + f"- {t['deadline_clean']}\n"
+        return report + "- " + t['deadline_in_flight'].format(
+            count=self.in_flight_at_deadline, grace=f"{self.config.grace_period:g}",
+            drained=self.drained, cancelled=self.cancelled) + "\n"
+
+    def _replay_report(self, t: Dict[str, str]) -> str:
+        """回放的時間模式、發送和跳過的日誌行數，以及日誌是否在持續時間內發送完畢"""
+        replay = self.replay_stats
+        speed = self.config.replay_speed
+        timing = t['replay_max'] if not speed else \
+            t['replay_original'] if speed == 1 else t['replay_scaled'].format(speed=speed)
+        report = f"""
+{t['replay']}：
+- {t['replay_timing'].format(speed=timing)}
+- {t['replay_sent'].format(sent=replay.sent, skipped=replay.skipped, malformed=replay.malformed)}
+"""
+        if replay.elapsed is None:
+            return report + f"- {t['replay_cut'].format(span=replay.log_span)}\n"
+        return report + "- " + t['replay_done'].format(
+            span=replay.log_span, elapsed=replay.elapsed, rate=replay.sent / max(replay.elapsed, 1e-3)) + "\n"
+
+    def _saturation_report(self, t: Dict[str, str]) -> str:
+        """負載生成器自身的飽和區間，這些區間內的結果標記為不可信"""
+        samples = self.saturation.samples.values()
+        report = f"\n{t['saturation']}：\n- " + t['saturation_peak'].format(
+            lag=max(s.lag_max_ms for s in samples), cpu=max(s.loop_cpu for s in samples) * 100,
+            backlog=max(max(s.backlog_max_ms for s in samples), 0.0),
+            stall=max(s.sink_stall_ms for s in samples)) + "\n"
+        intervals = self.saturation.intervals()
+        target_bound = self.saturation.target_bound_intervals()
+        start = self.timeseries.first_second or min((i[0] for i in intervals + target_bound), default=0)
+
+        def span(first: int, last: int) -> str:
+            return t['second_n'].format(first - start) if first == last else \
+                t['seconds_range'].format(first - start, last - start)
+
+        if target_bound:
+            report += "- " + t['target_bound'].format(spans='；'.join(span(f, l) for f, l, _ in target_bound)) + "\n"
+        if not intervals:
+            return report + f"- {t['saturation_none']}\n"
+
+        parts = []
+        for first, last, reasons in intervals:
+            parts.append(f"{span(first, last)}（{'、'.join(t[f'reason_{r}'] for r in REASONS if r in reasons)}）")
+        count = sum(self.timeseries.row(second)['requests'] for second in self.saturation.saturated_seconds())
+        total = self.stats.total
+        report += f"- {t['saturation_intervals']}：{'；'.join(parts)}\n"
+        report += "- " + t['saturation_untrusted'].format(count=count, pct=count / total * 100 if total else 0.0) + "\n"
+        return report
+
+    def _write_latency_summary(self, summary: Dict[str, Dict[str, float]]):
+        """保存各狀態類別的延遲百分位摘要"""
+        with open('latency_summary.csv', 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            fields = list(next(iter(summary.values())))
+            writer.writerow(['status_class'] + [k if k == 'count' else f'{k}_ms' for k in fields])
+            for cls, row in summary.items():
+                writer.writerow([cls] + [row[k] if k == 'count' else f'{row[k]:.3f}' for k in fields])
+
+    def generate_report(self, results: Union[ResultSink, List[Dict[str, Any]]]):
         """生成測試報告"""
         try:
+            # 兼容直接傳入記錄列表
+            if isinstance(results, list):
+                results = MemorySink(results)
+
             # 確保結果不為空
             if not results:
                 raise ValueError(TRANSLATIONS[self.current_lang]['no_data'])
 
-            # 轉換結果為DataFrame
-            df = pd.DataFrame(results)
-            
             # 確保必要的列存在
-            required_columns = ['status', 'response_time']
-            for col in required_columns:
-                if col not in df.columns:
-                    raise ValueError(f"{TRANSLATIONS[self.current_lang]['missing_column']}: {col}")
-            
+            try:
+                stats = self._collect_stats(results)
+            except KeyError as e:
+                raise ValueError(f"{TRANSLATIONS[self.current_lang]['missing_column']}: {e.args[0]}")
+
             # 基本統計
-            total_requests = len(results)
-            successful_requests = len(df[df['status'] == 200])
-            blocked_requests = len(df[df['status'] == 403])
-            error_requests = len(df[df['status'] == -1])
-            avg_response_time = df['response_time'].mean()
+            status_counts = sorted(stats.status_counts.items(), key=lambda item: item[1], reverse=True)
+            latency = stats.overall()
+            total_requests = stats.total
+            # 匹配阻擋頁特徵的 200 響應計入被阻擋而不是成功
+            successful_requests = stats.status_counts.get(200, 0) - stats.blocked_counts.get(200, 0)
+            blocked_requests = stats.blocked
+            error_requests = stats.status_counts.get(-1, 0)
+            avg_response_time = latency.mean_us / 1e6
+            summary = stats.latency_summary()
 
             # 生成報告
             t = TRANSLATIONS[self.current_lang]
@@ -190,8 +1006,9 @@ class WAFTester:
 {t['report_title']}
 {'=' * len(t['report_title'])}
 {t['test_time']}：{datetime.fromtimestamp(self.start_time).strftime('%Y-%m-%d %H:%M:%S')}
-{t['duration']}：{self.config.duration}{t['seconds']}
+{t['duration']}：{self.config.duration}{t['seconds']}{self._elapsed_note(t)}
 {t['threads']}：{self.config.threads}
+{t['processes']}：{self.config.processes}
 
 {t['statistics']}：
 - {t['total_requests']}：{total_requests}
@@ -199,46 +1016,63 @@ class WAFTester:
 - {t['blocked_requests']}：{blocked_requests} ({(blocked_requests/total_requests*100) if total_requests > 0 else 0:.2f}%)
 - {t['error_requests']}：{error_requests} ({(error_requests/total_requests*100) if total_requests > 0 else 0:.2f}%)
 - {t['avg_response_time']}：{avg_response_time*1000:.2f}ms
+
+{t['latency_percentiles']}：
 """
+            for cls, row in summary.items():
+                label = t['all_requests'] if cls == 'all' else cls
+                report += (f"- {label} ({row['count']})：p50 {row['p50']:.2f} / p90 {row['p90']:.2f} / "
+                           f"p99 {row['p99']:.2f} / p99.9 {row['p99.9']:.2f} / max {row['max']:.2f}\n")
+            if self.scheduler and results is self.results:
+                report += self._schedule_report(t, total_requests)
+            if results is self.results and self.pool_stats.opened:
+                report += self._pool_report(t)
+            if results is self.results and self.stage_stats:
+                report += self._profile_report(t)
+            if results is self.results and self.adaptive and self.adaptive.levels:
+                report += self._adaptive_report(t)
+            if results is self.results and self.phase_stats is not None:
+                report += self._phase_report(t)
+            if results is self.results and self.timeseries.last_second is not None:
+                report += self._timeseries_report(t)
+            if results is self.results and self.replay_stats is not None:
+                report += self._replay_report(t)
+            if results is self.results:
+                report += self._deadline_report(t)
+            if results is self.results and self.classifier is not None:
+                report += self._classification_report(t, stats)
+            if results is self.results and self.payload_stats is not None and self.payload_stats.count:
+                report += self._payload_report(t)
+            if results is self.results and self.saturation.samples:
+                report += self._saturation_report(t)
             # 保存報告
             with open('waf_test_report.txt', 'w', encoding='utf-8') as f:
                 f.write(report)
+            self._write_latency_summary(summary)
 
-            # 生成圖表
+            # 生成圖表：只傳遞預先匯總的分桶和逐秒數據，由工作進程並行繪製
             try:
-                # 響應時間分佈圖
-                plt.figure(figsize=(10, 6))
-                df['response_time'].hist(bins=50)
-                plt.title(t['response_time_dist'], fontsize=12)
-                plt.xlabel(t['response_time'], fontsize=10)
-                plt.ylabel(t['request_count'], fontsize=10)
-                plt.grid(True, linestyle='--', alpha=0.7)
-                plt.savefig('response_time_distribution.png', dpi=300, bbox_inches='tight')
-                plt.close()
-
-                # 狀態碼分佈圖
-                plt.figure(figsize=(8, 8))
-                status_counts = df['status'].value_counts()
-                if not status_counts.empty:
-                    colors = ['#2ecc71', '#e74c3c', '#3498db', '#f1c40f']  # 設置顏色
-                    patches, texts, autotexts = plt.pie(
-                        status_counts, 
-                        labels=status_counts.index,
-                        autopct='%1.1f%%',
-                        colors=colors,
-                        startangle=90
-                    )
-                    # 設置字體大小
-                    plt.setp(autotexts, size=9, weight='bold')
-                    plt.setp(texts, size=9)
-                    plt.title(t['status_dist'], fontsize=12, pad=20)
-                    plt.savefig('status_distribution.png', dpi=300, bbox_inches='tight')
-                plt.close()
+                hist, edges = self._response_time_hist(latency)
+                specs = [{'kind': 'histogram', 'name': 'response_time_distribution', 'title': t['response_time_dist'],
+                          'edges': edges.tolist(), 'counts': hist.tolist(),
+                          'xlabel': t['response_time'], 'ylabel': t['request_count']}]
+                if status_counts:
+                    specs.append({'kind': 'pie', 'name': 'status_distribution', 'title': t['status_dist'],
+                                  'labels': [status for status, _ in status_counts],
+                                  'values': [count for _, count in status_counts]})
+                if results is self.results:
+                    specs.extend(timeseries_specs(self.timeseries, t))
+                render_charts(specs, self.config.chart_format, t['report_title'])
             except Exception as e:
                 print(f"{t['chart_error']}: {str(e)}")
 
-            # 保存詳細結果
-            df.to_csv('detailed_results.csv', index=False)
+            # 保存詳細結果（磁盤輸出已在測試過程中寫入）
+            if isinstance(results, MemorySink):
+                with open('detailed_results.csv', 'w', encoding='utf-8', newline='') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(COLUMNS)
+                    for chunk in results.iter_chunks():
+                        writer.writerows(zip(*(chunk[name] for name in COLUMNS)))
             
         except Exception as e:
             raise Exception(f"{TRANSLATIONS[self.current_lang]['report_error']}: {str(e)}") 
\ No newline at end of file